@@ -0,0 +1,220 @@
+"""Campaign-wide analytics over persisted bastions
+
+Reports cover every bastion in ``db.bastions``: gold distribution, defenders,
+hireling counts, turn progression and special facility popularity by party
+level. An aggregation pipeline reduces each bastion document to a handful of
+integers on the MongoDB side (party level, hireling total, catalog indexes of
+its special facilities...), so nested bastion_data never crosses the wire.
+Rows are consumed ``chunk_rows`` at a time: each chunk becomes NumPy columns,
+facility counts are folded into a fixed (level tier x facility) matrix, and
+only the compact scalar columns are kept, at about 30 bytes per bastion, for
+exact percentiles and per-turn reductions at the end.
+
+A report is cached until the next turn boundary, i.e. until some bastion's
+``bastionTurn`` changes; concurrent requests share one computation.
+
+NumPy is imported with the first report rather than at startup.
+"""
+import asyncio
+import itertools
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, List, Optional
+
+from facility_catalog import FACILITY_LEVELS, SPECIAL_FACILITIES
+
+logger = logging.getLogger(__name__)
+
+FACILITY_NAMES = [f["name"] for f in SPECIAL_FACILITIES]
+SECTIONS = ("gold", "defenders", "hirelings", "turns", "levels", "facilities")
+# Integer columns projected per bastion, in report order
+SCALARS = ("gold", "defenders", "turn", "walls", "level", "hirelings")
+
+GOLD_BINS = 20
+HIRELING_BUCKETS = 50
+
+
+def _integer(path: str, default: int = 0) -> Dict[str, Any]:
+    return {"$convert": {"input": path, "to": "long", "onError": default, "onNull": default}}
+
+
+def _array(path: str) -> Dict[str, Any]:
+    return {"$cond": [{"$isArray": path}, path, []]}
+
+
+def _hireling_total(field: str) -> Dict[str, Any]:
+    return {"$sum": {"$map": {
+        "input": _array(f"$bastion_data.{field}"), "as": "f",
+        "in": {"$size": _array("$$f.hirelings")},
+    }}}
+
+
+# One small row of integers per bastion; -1 marks a special facility not in the catalog
+PIPELINE = [{"$project": {
+    "_id": 0,
+    "gold": _integer("$bastion_data.bastionGold"),
+    "defenders": _integer("$bastion_data.bastionDefenders"),
+    "turn": _integer("$bastion_data.bastionTurn", 1),
+    "walls": _integer("$bastion_data.defensiveWalls"),
+    "level": {"$max": [FACILITY_LEVELS[0], {"$max": {"$map": {
+        "input": _array("$bastion_data.party"), "as": "c", "in": _integer("$$c.level"),
+    }}}]},
+    "hirelings": {"$add": [_hireling_total("basicFacilities"), _hireling_total("specialFacilities")]},
+    "facilities": {"$map": {
+        "input": _array("$bastion_data.specialFacilities"), "as": "f",
+        "in": {"$indexOfArray": [FACILITY_NAMES, "$$f.name"]},
+    }},
+}}]
+
+
+class _Reducer:
+    """Folds chunks of pipeline rows into columns and facility counts"""
+
+    def __init__(self, np):
+        self.np = np
+        self.columns: Dict[str, List[Any]] = {name: [] for name in SCALARS}
+        self.facilities = np.zeros((len(FACILITY_LEVELS), len(FACILITY_NAMES)), dtype=np.int64)
+
+    def tiers(self, levels):
+        np = self.np
+        return np.clip(np.searchsorted(FACILITY_LEVELS, levels, side="right") - 1, 0, len(FACILITY_LEVELS) - 1)
+
+    def add(self, rows: List[Dict[str, Any]]) -> None:
+        np, count = self.np, len(rows)
+        chunk = {}
+        for name in SCALARS:
+            dtype = np.int64 if name == "gold" else np.int32
+            chunk[name] = np.fromiter((row[name] for row in rows), dtype=dtype, count=count)
+            self.columns[name].append(chunk[name])
+
+        built = np.fromiter((len(row["facilities"]) for row in rows), dtype=np.int64, count=count)
+        indexes = np.fromiter(itertools.chain.from_iterable(row["facilities"] for row in rows),
+                              dtype=np.int64, count=int(built.sum()))
+        tiers = np.repeat(self.tiers(chunk["level"]), built)
+        known = indexes >= 0
+        cells = tiers[known] * len(FACILITY_NAMES) + indexes[known]
+        self.facilities += np.bincount(cells, minlength=self.facilities.size).reshape(self.facilities.shape)
+
+    def report(self) -> Dict[str, Any]:
+        np = self.np
+        columns = {
+            name: np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+            for name, parts in self.columns.items()
+        }
+        count = len(columns["gold"])
+        report: Dict[str, Any] = {"bastions": count}
+        if not count:
+            return {**report, **{section: None for section in SECTIONS}}
+
+        gold = columns["gold"]
+        p10, p50, p90 = np.percentile(gold, (10, 50, 90))
+        edges = np.histogram_bin_edges(gold, bins=GOLD_BINS)
+        report["gold"] = {
+            "total": int(gold.sum()), "mean": float(gold.mean()), "min": int(gold.min()),
+            "p10": float(p10), "median": float(p50), "p90": float(p90), "max": int(gold.max()),
+            "histogram": {"edges": edges.tolist(), "counts": np.histogram(gold, bins=edges)[0].tolist()},
+        }
+
+        defenders, walls = columns["defenders"], columns["walls"]
+        report["defenders"] = {
+            "total": int(defenders.sum()), "mean": float(defenders.mean()), "max": int(defenders.max()),
+            "meanWalls": float(walls.mean()),
+        }
+
+        hirelings = columns["hirelings"]
+        report["hirelings"] = {
+            "total": int(hirelings.sum()), "mean": float(hirelings.mean()), "max": int(hirelings.max()),
+            # bastions by hireling count; the last bucket holds everything at or above it
+            "distribution": np.bincount(np.clip(hirelings, 0, HIRELING_BUCKETS), minlength=1).tolist(),
+        }
+
+        # Grouped by the turns actually reached; a bincount over turn numbers could be huge
+        turns = columns["turn"]
+        reached, turn_group, by_turn = np.unique(turns, return_inverse=True, return_counts=True)
+        gold_by_turn = np.bincount(turn_group.ravel(), weights=gold) / by_turn
+        report["turns"] = {
+            "mean": float(turns.mean()), "max": int(turns.max()),
+            "byTurn": [
+                {"turn": int(turn), "bastions": int(n), "meanGold": float(mean_gold)}
+                for turn, n, mean_gold in zip(reached, by_turn, gold_by_turn)
+            ],
+        }
+
+        tiers = np.bincount(self.tiers(columns["level"]), minlength=len(FACILITY_LEVELS))
+        report["levels"] = {str(level): int(n) for level, n in zip(FACILITY_LEVELS, tiers)}
+
+        report["facilities"] = {
+            "total": {FACILITY_NAMES[i]: int(n) for i, n in enumerate(self.facilities.sum(axis=0)) if n},
+            "byLevel": {
+                str(level): {FACILITY_NAMES[i]: int(n) for i, n in enumerate(row) if n}
+                for level, row in zip(FACILITY_LEVELS, self.facilities)
+            },
+        }
+        return report
+
+
+async def build_report(rows: AsyncIterable[Dict[str, Any]], chunk_rows: int = 65536) -> Dict[str, Any]:
+    """Report over pipeline rows, reduced chunk_rows at a time"""
+    import numpy as np
+
+    reducer = _Reducer(np)
+    chunk: List[Dict[str, Any]] = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            reducer.add(chunk)
+            chunk = []
+    if chunk:
+        reducer.add(chunk)
+    return reducer.report()
+
+
+class CampaignAnalytics:
+    """Cached campaign report, recomputed after a turn boundary"""
+
+    def __init__(self, collection, before_report: Optional[Callable[[], Awaitable[Any]]] = None,
+                 chunk_rows: int = 65536, batch_size: int = 10000):
+        self._collection = collection
+        self._before_report = before_report
+        self.chunk_rows = chunk_rows
+        self.batch_size = batch_size
+
+        self._generation = 0
+        self._cached: Optional[Dict[str, Any]] = None
+        self._cached_generation = -1
+        self._pending: Optional[asyncio.Future] = None
+        self._pending_generation = -1
+
+    def turn_boundary(self) -> None:
+        """Some bastion moved to a new turn; the next request recomputes"""
+        self._generation += 1
+
+    async def report(self) -> Dict[str, Any]:
+        generation = self._generation
+        if self._cached is not None and self._cached_generation == generation:
+            return self._cached
+        if self._pending is None or self._pending_generation != generation:
+            self._pending = asyncio.ensure_future(self._compute(generation))
+            self._pending_generation = generation
+            # A failed computation is not reused; the next request starts a fresh one
+            self._pending.add_done_callback(self._forget_failed)
+        # A cancelled request must not cancel the computation others are waiting on
+        return await asyncio.shield(self._pending)
+
+    def _forget_failed(self, pending: asyncio.Future) -> None:
+        if pending is self._pending and (pending.cancelled() or pending.exception() is not None):
+            self._pending = None
+
+    async def _compute(self, generation: int) -> Dict[str, Any]:
+        started = datetime.utcnow()
+        if self._before_report is not None:
+            # Include changes still waiting in the write-behind buffer
+            await self._before_report()
+        rows = self._collection.aggregate(PIPELINE, allowDiskUse=True, batchSize=self.batch_size)
+        report = await build_report(rows, self.chunk_rows)
+        report["generatedAt"] = started
+        logger.info(f"Analytics over {report['bastions']} bastions took "
+                    f"{(datetime.utcnow() - started).total_seconds():.2f}s")
+        if generation >= self._cached_generation:
+            self._cached, self._cached_generation = report, generation
+        return report
@@ -0,0 +1,277 @@
+"""Append-only bastion history with periodic snapshots
+
+Every change applied to a room is appended to ``bastion_events`` as a small
+``{room_code, revision, changes}`` document (plus ``removed`` when the
+change dropped fields), next to (not instead of) the
+write-behind ``$set`` on ``bastions``. Events are buffered and written with
+one unordered ``insert_many`` per flush, so an append costs a fraction of
+rewriting the bastion document.
+
+Every ``snapshot_every`` revisions, and whenever a room is created or loaded,
+the full bastion_data is written to ``bastion_snapshots``. The state at any
+revision is then the nearest snapshot at or below it plus the events after
+it, never a replay from the beginning. Events that change ``bastionTurn``
+carry a ``turn`` field so the state at the start of a turn can be found by
+index.
+
+Events and snapshots are written independently. A duplicate key means the
+document was already written by an earlier attempt, so it counts as
+written. Batches that fail because MongoDB is unreachable are requeued, up
+to ``max_pending`` events; anything else is dropped and counted in
+``flushErrors``. Events are an audit trail, not the source of truth.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+from bastion_sync import MISSING, SERVER_OWNED_FIELDS, split_changes
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+# room_code -> (bastion_data, revision) from the room store, or None if not resident
+StateReader = Callable[[str], Awaitable[Optional[Tuple[Dict[str, Any], int]]]]
+
+
+class HistoryUnavailable(Exception):
+    """No snapshot old enough to rebuild the requested state"""
+
+
+class RestoreOrder:
+    """An earlier bastion_data to restore wholesale, queued behind a room's pending updates
+
+    ``fields`` (changed or removed) and ``revision`` are filled in by
+    whoever applies it; both stay None if the room was gone by then.
+    """
+    __slots__ = ("bastion_data", "fields", "revision")
+
+    def __init__(self, bastion_data: Dict[str, Any]):
+        self.bastion_data = bastion_data
+        self.fields: Optional[List[str]] = None
+        self.revision: Optional[int] = None
+
+
+def _replay(bastion_data: Dict[str, Any], event: Dict[str, Any]) -> None:
+    bastion_data.update(event["changes"])
+    for key in event.get("removed", ()):
+        bastion_data.pop(key, None)
+
+
+def _failed_writes(error: BulkWriteError) -> List[int]:
+    """Indexes of the writes in an unordered bulk that failed for a reason other than already existing"""
+    return [e["index"] for e in error.details.get("writeErrors", []) if e.get("code") != DUPLICATE_KEY]
+
+
+class BastionHistory:
+    """Buffered event log and snapshot writer for bastion changes"""
+
+    def __init__(self, events, snapshots, read_state: StateReader, snapshot_every: int = 100,
+                 flush_interval: float = 1.0, max_pending: int = 100_000):
+        self._events = events
+        self._snapshots = snapshots
+        self._read_state = read_state
+        self.snapshot_every = snapshot_every
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending_events: List[Dict[str, Any]] = []
+        self._pending_snapshots: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+        self.events_written = 0
+        self.snapshots_written = 0
+        self.flush_errors = 0
+        self.dropped_events = 0
+
+    async def create_indexes(self) -> None:
+        await self._events.create_index([("room_code", 1), ("revision", 1)], unique=True)
+        await self._events.create_index(
+            [("room_code", 1), ("turn", 1), ("revision", 1)],
+            partialFilterExpression={"turn": {"$exists": True}},
+        )
+        await self._snapshots.create_index([("room_code", 1), ("revision", 1)], unique=True)
+
+    def snapshot(self, room_code: str, bastion_data: Dict[str, Any], revision: int) -> None:
+        """Queue a full snapshot of a room at revision (kept if one already exists)"""
+        data = {k: v for k, v in bastion_data.items() if k not in SERVER_OWNED_FIELDS}
+        self._pending_snapshots[(room_code, revision)] = {"bastion_data": data, "at": datetime.utcnow()}
+
+    async def record(self, room_code: str, revision: int, changes: Dict[str, Any]) -> None:
+        """Append one applied change; snapshot the room when it reaches a snapshot revision"""
+        changes, removed = split_changes(changes)
+        event = {"room_code": room_code, "revision": revision, "changes": changes, "at": datetime.utcnow()}
+        if removed:
+            event["removed"] = removed
+        if "bastionTurn" in changes:
+            event["turn"] = changes["bastionTurn"]
+        self._pending_events.append(event)
+
+        if self.snapshot_every and revision % self.snapshot_every == 0:
+            state = await self._read_state(room_code)
+            if state is not None and state[1] == revision:
+                self.snapshot(room_code, state[0], revision)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            events, self._pending_events = self._pending_events, []
+            snapshots, self._pending_snapshots = self._pending_snapshots, {}
+            if events:
+                await self._write_events(events)
+            if snapshots:
+                await self._write_snapshots(snapshots)
+
+    async def _write_events(self, events: List[Dict[str, Any]]) -> None:
+        try:
+            await self._events.insert_many(events, ordered=False)
+            failed = []
+        except BulkWriteError as e:
+            # Unordered: every event without a write error was inserted
+            failed = _failed_writes(e)
+            self._write_failed("events", [events[i] for i in failed], e)
+        except ConnectionFailure as e:
+            failed = range(len(events))
+            self._write_failed("events", events, e)
+            self._requeue_events(events)
+        except Exception as e:
+            failed = range(len(events))
+            self._write_failed("events", events, e)
+        self.events_written += len(events) - len(failed)
+
+    async def _write_snapshots(self, snapshots: Dict[Tuple[str, int], Dict[str, Any]]) -> None:
+        keys = list(snapshots)
+        try:
+            await self._snapshots.bulk_write([
+                UpdateOne({"room_code": room_code, "revision": revision}, {"$setOnInsert": doc}, upsert=True)
+                for (room_code, revision), doc in snapshots.items()
+            ], ordered=False)
+            failed = []
+        except BulkWriteError as e:
+            failed = _failed_writes(e)
+            self._write_failed("snapshots", [keys[i] for i in failed], e)
+        except ConnectionFailure as e:
+            failed = keys
+            self._write_failed("snapshots", keys, e)
+            for key, doc in snapshots.items():
+                self._pending_snapshots.setdefault(key, doc)
+        except Exception as e:
+            failed = keys
+            self._write_failed("snapshots", keys, e)
+        self.snapshots_written += len(snapshots) - len(failed)
+
+    def _write_failed(self, kind: str, failed: List[Any], error: Exception) -> None:
+        if failed:
+            self.flush_errors += 1
+            logger.error(f"History flush of {len(failed)} {kind} failed: {error}")
+
+    def _requeue_events(self, events: List[Dict[str, Any]]) -> None:
+        """Put events back ahead of newer ones, dropping the oldest past max_pending"""
+        self._pending_events[:0] = events
+        overflow = len(self._pending_events) - self.max_pending
+        if overflow > 0:
+            del self._pending_events[:overflow]
+            self.dropped_events += overflow
+            logger.error(f"History buffer full, dropped the {overflow} oldest events")
+
+    async def state_at(self, room_code: str, revision: int) -> Tuple[Dict[str, Any], int]:
+        """bastion_data as of revision (or the latest revision before it)"""
+        await self.flush()
+        snapshot = await self._snapshots.find_one(
+            {"room_code": room_code, "revision": {"$lte": revision}}, sort=[("revision", DESCENDING)],
+        )
+        if snapshot is None:
+            raise HistoryUnavailable(f"No history for {room_code} at revision {revision}")
+
+        bastion_data, at_revision = snapshot["bastion_data"], snapshot["revision"]
+        cursor = self._events.find(
+            {"room_code": room_code, "revision": {"$gt": at_revision, "$lte": revision}},
+        ).sort("revision", 1)
+        async for event in cursor:
+            _replay(bastion_data, event)
+            at_revision = event["revision"]
+        return bastion_data, at_revision
+
+    async def changes_since(self, room_code: str, revision: int, until: int,
+                            max_events: int = 500) -> Optional[Dict[str, Any]]:
+        """Merged changes of revisions (revision, until], or None if any of them is missing
+
+        Fields removed along the way, and not set again, map to MISSING.
+        """
+        if until - revision > max_events:
+            return None
+        await self.flush()
+        merged: Dict[str, Any] = {}
+        expected = revision + 1
+        cursor = self._events.find(
+            {"room_code": room_code, "revision": {"$gt": revision, "$lte": until}},
+        ).sort("revision", 1)
+        async for event in cursor:
+            if event["revision"] != expected:
+                return None
+            merged.update(event["changes"])
+            merged.update(dict.fromkeys(event.get("removed", ()), MISSING))
+            expected += 1
+        return merged if expected == until + 1 else None
+
+    async def revision_at_turn(self, room_code: str, turn: int) -> Optional[int]:
+        """Revision at which the bastion last moved to turn, if it ever did
+
+        The turn the history starts in (turn 1 for a new bastion) has no
+        event moving to it; it and any turn before it resolve to the earliest
+        snapshot.
+        """
+        await self.flush()
+        event = await self._events.find_one(
+            {"room_code": room_code, "turn": turn}, sort=[("revision", DESCENDING)],
+        )
+        if event is not None:
+            return event["revision"]
+        first = await self._snapshots.find_one({"room_code": room_code}, sort=[("revision", ASCENDING)])
+        if first is not None and turn <= first["bastion_data"].get("bastionTurn", 1):
+            return first["revision"]
+        return None
+
+    async def recent(self, room_code: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Newest events first, with the names of the fields each one changed"""
+        await self.flush()
+        cursor = self._events.find({"room_code": room_code}).sort("revision", DESCENDING).limit(limit)
+        return [
+            {"revision": event["revision"], "turn": event.get("turn"),
+             "fields": [*event["changes"], *event.get("removed", ())],
+             "at": event["at"]}
+            async for event in cursor
+        ]
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pendingEvents": len(self._pending_events),
+            "pendingSnapshots": len(self._pending_snapshots),
+            "eventsWritten": self.events_written,
+            "snapshotsWritten": self.snapshots_written,
+            "flushErrors": self.flush_errors,
+            "droppedEvents": self.dropped_events,
+        }
@@ -0,0 +1,155 @@
+"""Merging concurrent client edits instead of letting the last one win
+
+Clients always send whole top-level fields: the complete ``party`` or
+``specialFacilities`` list after one hireling was renamed. When two tabs edit
+the same field from the same starting point, the second full list used to
+replace the first, silently undoing its change.
+
+Every client update now names its ``base``, the room revision its edit was
+made against, and each field in it is resolved against the field's
+``FieldVersion``:
+
+* no change to the field since ``base``: the update is taken as it is;
+* if the field's value as of ``base`` is still known (only its last change
+  came after ``base``, so it is that change's ``previous``), the edit is
+  three-way merged into the current value;
+* failing that, a plain value (not a list or dict) is taken as it is if
+  every change since ``base`` was the same writer's own: the writer is only
+  racing its own unacknowledged edits, typing into a number field say.
+  Lists and dicts get no such pass, since a patch may have replaced the
+  writer's local copy before its own last edit came back;
+* otherwise the field is rejected as a conflict and left alone.
+
+The three-way merge goes key by key through dicts and item by item, matched
+by ``id``, through lists of dicts, so a hireling edit on one facility and a
+facility added elsewhere both survive. Updates without a ``base`` keep the
+old last-write-wins behaviour.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from bastion_sync import MISSING, FieldVersion
+
+
+class MergeConflict(Exception):
+    """Both sides changed the same value differently"""
+
+
+class ClientUpdate:
+    """Fields sent by one client, the revision they were based on and who sent them"""
+    __slots__ = ("changes", "base", "writer")
+
+    def __init__(self, changes: Dict[str, Any], base: Optional[int] = None, writer: Optional[str] = None):
+        self.changes = changes
+        self.base = base
+        self.writer = writer
+
+
+def _keyed(items: Any) -> Optional[Dict[Any, Dict[str, Any]]]:
+    """items by id if items is a list of dicts with distinct hashable ids, else None"""
+    if type(items) is not list:
+        return None
+    by_id = {}
+    for item in items:
+        if type(item) is not dict:
+            return None
+        key = item.get("id", MISSING)
+        if key is MISSING or type(key) not in (int, float, str) or key in by_id:
+            return None
+        by_id[key] = item
+    return by_id
+
+
+def _merge_lists(base: List[Dict[str, Any]], current: List[Dict[str, Any]],
+                 incoming: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    base_by, current_by, incoming_by = _keyed(base), _keyed(current), _keyed(incoming)
+    if base_by is None or current_by is None or incoming_by is None:
+        raise MergeConflict
+    merged = []
+    # Current order first, with what the client changed in each item, then the client's additions
+    for key, item in current_by.items():
+        if key in incoming_by:
+            merged.append(merge_values(base_by.get(key, MISSING), item, incoming_by[key]))
+        elif key not in base_by:
+            merged.append(item)  # added by someone else meanwhile
+        elif item != base_by[key]:
+            raise MergeConflict  # removed by the client but changed by someone else
+    for key, item in incoming_by.items():
+        if key in current_by:
+            continue
+        if key not in base_by:
+            merged.append(item)  # added by the client
+        elif item != base_by[key]:
+            raise MergeConflict  # changed by the client but removed by someone else
+    return merged
+
+
+def _merge_dicts(base: Dict[str, Any], current: Dict[str, Any], incoming: Dict[str, Any]) -> Dict[str, Any]:
+    merged = {}
+    for key in {**current, **incoming}:
+        value = merge_values(base.get(key, MISSING), current.get(key, MISSING), incoming.get(key, MISSING))
+        if value is not MISSING:
+            merged[key] = value
+    return merged
+
+
+def merge_values(base: Any, current: Any, incoming: Any) -> Any:
+    """Three-way merge of the client's incoming value into current, both derived from base
+
+    Returns MISSING if the merged value is a removed dict key; raises
+    MergeConflict if the two sides cannot both be kept.
+    """
+    if incoming == base:
+        return current
+    if current == base or current == incoming:
+        return incoming
+    if type(current) is dict and type(incoming) is dict:
+        return _merge_dicts(base if type(base) is dict else {}, current, incoming)
+    if type(current) is list and type(incoming) is list:
+        return _merge_lists(base if type(base) is list else [], current, incoming)
+    raise MergeConflict
+
+
+def resolve_updates(versions: Dict[str, FieldVersion], updates: List[ClientUpdate],
+                    validate: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                    ) -> Tuple[Dict[str, Any], Dict[str, Optional[str]], List[Tuple[ClientUpdate, List[str]]]]:
+    """Fold updates, in order, into the fields described by versions
+
+    Returns (merged field values, writer of each merged field, [(update,
+    conflicting fields)]). Earlier updates in the same call count as
+    concurrent changes for later ones. ``validate`` is run on every merged
+    value that neither side sent as such; if it raises, the field is a
+    conflict.
+    """
+    versions = dict(versions)
+    merged: Dict[str, Any] = {}
+    writers: Dict[str, Optional[str]] = {}
+    conflicts = []
+    # Stands in for the revision this batch will be written at, newer than any base
+    pending = max((version.revision for version in versions.values()), default=0) + 1
+    for update in updates:
+        rejected = []
+        for field, incoming in update.changes.items():
+            version = versions.get(field) or FieldVersion()
+            base = update.base
+            value = MISSING
+            if base is None or version.revision <= base:
+                value = incoming
+            elif version.previous_revision <= base:
+                try:
+                    value = merge_values(version.previous, version.value, incoming)
+                    if validate is not None and value is not incoming:
+                        validate({field: value})
+                except Exception:
+                    value = MISSING
+            if value is MISSING:
+                if (type(incoming) in (list, dict) or version.writer != update.writer
+                        or version.run_revision > base):
+                    rejected.append(field)
+                    continue
+                value = incoming
+            merged[field] = value
+            writers[field] = update.writer
+            versions[field] = version.advance(value, max(pending, version.revision + 1), update.writer)
+        if rejected:
+            conflicts.append((update, rejected))
+    return merged, writers, conflicts
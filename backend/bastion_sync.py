@@ -0,0 +1,110 @@
+"""Revisioned delta sync for bastion state
+
+Clients receive the full ``bastionState`` once on join (tagged with the room's
+revision) and afterwards only ``bastionPatch`` events carrying the top-level
+keys that actually changed. Each patch bumps the room revision by one, so a
+client that sees a gap asks for a resync instead of applying a patch on top of
+state it never received.
+
+Each top-level field also carries its own revision: the room revision at
+which it last changed. The room store also keeps who changed the field,
+what it held just before that change, and when that writer's current run of
+changes began. A client
+update names the room revision it was made against (its ``base``), which
+is how ``bastion_merge`` tells a stale edit from a fresh one. Store writes
+can be made conditional on field revisions; a write whose fields moved on
+meanwhile raises ``RevisionMismatch``.
+
+Inside the server a changes dict may map a field to ``MISSING``, meaning
+the field is removed (as when an undo restores a state that predates it).
+Patches list removed fields under ``removed`` rather than in ``changes``.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Fields the server maintains itself and never accepts from a client update
+SERVER_OWNED_FIELDS = frozenset({"connectedPlayers", "revision"})
+
+# A field that is not set (distinct from a field set to null)
+MISSING = object()
+
+
+class RevisionMismatch(Exception):
+    """A conditional write found fields changed since they were read"""
+
+    def __init__(self, fields: Iterable[str]):
+        self.fields = list(fields)
+        super().__init__(f"fields changed meanwhile: {', '.join(self.fields)}")
+
+
+class FieldVersion:
+    """A field's value and revision, plus what it held just before its last change
+
+    ``writer`` is whoever made the last change (None for the server itself);
+    ``previous`` is the value the field had from ``previous_revision`` until
+    then, and ``run_revision`` is the revision it was at before ``writer``'s
+    current run of consecutive changes began.
+    """
+    __slots__ = ("value", "revision", "writer", "previous", "previous_revision", "run_revision")
+
+    def __init__(self, value: Any = MISSING, revision: int = 0, writer: Optional[str] = None,
+                 previous: Any = MISSING, previous_revision: int = 0, run_revision: int = 0):
+        self.value = value
+        self.revision = revision
+        self.writer = writer
+        self.previous = previous
+        self.previous_revision = previous_revision
+        self.run_revision = run_revision
+
+    def advance(self, value: Any, revision: int, writer: Optional[str]) -> "FieldVersion":
+        """The version after writer sets value at revision"""
+        run_revision = self.run_revision if self.revision and writer == self.writer else self.revision
+        return FieldVersion(value, revision, writer, self.value, self.revision, run_revision)
+
+
+def diff_bastion(current: Dict[str, Any], updates: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the subset of updates whose values differ from current"""
+    return {
+        key: value
+        for key, value in updates.items()
+        if key not in SERVER_OWNED_FIELDS and current.get(key, MISSING) != value
+    }
+
+
+def replacement_changes(current: Dict[str, Any], replacement: Dict[str, Any]) -> Dict[str, Any]:
+    """Changes that turn current into replacement, with MISSING for fields replacement lacks"""
+    changes = diff_bastion(current, replacement)
+    for key in current:
+        if key not in replacement and key not in SERVER_OWNED_FIELDS:
+            changes[key] = MISSING
+    return changes
+
+
+def split_changes(changes: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """(fields set, fields removed) of a changes dict"""
+    removed = [key for key, value in changes.items() if value is MISSING]
+    if not removed:
+        return changes, removed
+    return {key: value for key, value in changes.items() if value is not MISSING}, removed
+
+
+def state_payload(bastion_data: Dict[str, Any], revision: int) -> Dict[str, Any]:
+    """Full bastionState payload for a room, tagged with its revision"""
+    payload = dict(bastion_data)
+    payload["revision"] = revision
+    return payload
+
+
+def patch_payload(revision: int, changes: Dict[str, Any], base: Optional[int] = None) -> Dict[str, Any]:
+    """bastionPatch payload carrying only the changed top-level keys
+
+    A patch applies on top of revision - 1 unless it names another ``base``
+    revision, as a catch-up patch spanning several revisions does.
+    Removed fields are listed under ``removed``.
+    """
+    changes, removed = split_changes(changes)
+    payload = {"revision": revision, "changes": changes}
+    if removed:
+        payload["removed"] = removed
+    if base is not None:
+        payload["base"] = base
+    return payload
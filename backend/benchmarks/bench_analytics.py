@@ -0,0 +1,78 @@
+"""Benchmark: campaign analytics over many bastions
+
+Feeds --bastions synthetic pipeline rows (what analytics.PIPELINE yields per
+bastion) through analytics.build_report, as a Motor cursor would deliver
+them, and reports the wall time. With --trace-memory a second, much slower
+pass reports the peak memory traced while reducing; rows are generated on
+the fly, so the peak reflects what the reducer holds: one chunk of rows plus
+the compact columns. Run from the backend directory:
+
+    python benchmarks/bench_analytics.py --bastions 1000000
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from analytics import FACILITY_NAMES, build_report  # noqa: E402
+
+
+async def rows(count, seed):
+    rng = random.Random(seed)
+    facilities = range(len(FACILITY_NAMES))
+    for i in range(count):
+        level = rng.choice((5, 5, 5, 7, 9, 11, 13, 17, 20))
+        built = rng.sample(facilities, rng.randint(0, 6)) if level > 5 or rng.random() < 0.5 else []
+        yield {
+            "gold": rng.randint(0, 20000), "defenders": rng.randint(0, 40), "turn": rng.randint(1, 60),
+            "walls": rng.randint(0, 10), "level": level, "hirelings": rng.randint(0, 12),
+            "facilities": built,
+        }
+        if i % 10000 == 0:
+            # Let the loop run between cursor batches, as a real cursor would
+            await asyncio.sleep(0)
+
+
+async def run(count, chunk_rows, seed, trace_memory):
+    started = time.perf_counter()
+    async for _ in rows(count, seed):
+        pass
+    generate = time.perf_counter() - started
+
+    started = time.perf_counter()
+    report = await build_report(rows(count, seed), chunk_rows)
+    total = time.perf_counter() - started
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        await build_report(rows(count, seed), chunk_rows)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return report, total, generate, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bastions", type=int, default=1_000_000)
+    parser.add_argument("--chunk-rows", type=int, default=65536)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace-memory", action="store_true")
+    args = parser.parse_args()
+
+    report, total, generate, peak = asyncio.run(run(args.bastions, args.chunk_rows, args.seed, args.trace_memory))
+    print(f"bastions        {report['bastions']}")
+    print(f"report s        {total:.2f} (of which generating rows ~{generate:.2f})")
+    if peak is not None:
+        print(f"peak MiB        {peak / 2 ** 20:.1f}")
+    print(f"median gold     {report['gold']['median']:.0f}")
+    print(f"most built      {max(report['facilities']['total'].items(), key=lambda item: item[1])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark: batch-create/batch-get against the per-item endpoints
+
+Boots the server on the fake database (as loadtest.py --serve does), with
+every fake MongoDB operation taking --mongo-latency-ms, and times creating
+--rooms bastions through POST /api/bastion/create versus POST
+/api/bastions/batch-create, then fetching them through GET
+/api/bastion/{code} versus POST /api/bastions/batch-get. The benchmark waits until
+every created room has been evicted, so both fetch paths start cold and
+have to go to the database. Per-item calls are issued --concurrency at a time. Run from the
+backend directory:
+
+    python benchmarks/bench_batch_endpoints.py --rooms 500 --mongo-latency-ms 1
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from loadtest import wait_until_up  # noqa: E402
+
+LOADTEST = Path(__file__).resolve().parent / "loadtest.py"
+BATCH = 500
+
+
+async def per_item(count, concurrency, call):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            return await call(i)
+
+    return await asyncio.gather(*(one(i) for i in range(count)))
+
+
+async def timed(coro):
+    started = time.perf_counter()
+    result = await coro
+    return time.perf_counter() - started, result
+
+
+async def wait_until_evicted(http, api, timeout=30.0):
+    """Wait for the sweeper to evict every resident room"""
+    deadline = time.monotonic() + timeout
+    while True:
+        async with http.get(f"{api}/rooms/stats") as response:
+            resident = (await response.json())["residentRooms"]
+        if resident == 0:
+            return
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{resident} rooms still resident after {timeout}s")
+        await asyncio.sleep(0.1)
+
+
+async def drive(base_url, rooms, concurrency):
+    api = f"{base_url}/api"
+    async with aiohttp.ClientSession() as http:
+        async def create_one(_):
+            async with http.post(f"{api}/bastion/create") as response:
+                return (await response.json())["roomCode"]
+
+        async def create_batch():
+            codes = []
+            for start in range(0, rooms, BATCH):
+                async with http.post(f"{api}/bastions/batch-create",
+                                     json={"count": min(BATCH, rooms - start)}) as response:
+                    codes += [item["roomCode"] for item in (await response.json())["results"]]
+            return codes
+
+        async def get_batch(codes):
+            found = 0
+            for start in range(0, len(codes), BATCH):
+                async with http.post(f"{api}/bastions/batch-get", json={"roomCodes": codes[start:start + BATCH]}) as response:
+                    found += sum("bastionData" in item for item in (await response.json())["results"])
+            return found
+
+        single_create, single_codes = await timed(per_item(rooms, concurrency, create_one))
+        batch_create, batch_codes = await timed(create_batch())
+        await wait_until_evicted(http, api)
+
+        async def get_one(i):
+            async with http.get(f"{api}/bastion/{single_codes[i]}") as response:
+                return response.status == 200
+
+        single_get, single_found = await timed(per_item(rooms, concurrency, get_one))
+        batch_get, batch_found = await timed(get_batch(batch_codes))
+        assert sum(single_found) == batch_found == rooms, (sum(single_found), batch_found)
+
+    print(f"{'operation':>10} {'per-item s':>11} {'batch s':>9} {'speedup':>8}")
+    for name, single, batch in (("create", single_create, batch_create), ("get", single_get, batch_get)):
+        print(f"{name:>10} {single:>11.3f} {batch:>9.3f} {single / batch:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mongo-latency-ms", type=float, default=1.0)
+    parser.add_argument("--port", type=int, default=8102)
+    args = parser.parse_args()
+
+    env = dict(os.environ, FAKE_MONGO_LATENCY_MS=str(args.mongo_latency_ms),
+               ROOM_CACHE_IDLE_TTL="0", ROOM_CACHE_SWEEP_INTERVAL="0.2")
+    proc = subprocess.Popen([sys.executable, str(LOADTEST), "--serve", "--port", str(args.port)], env=env)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        asyncio.run(wait_until_up(base_url))
+        asyncio.run(drive(base_url, args.rooms, args.concurrency))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark: cold start to first accepted socket
+
+Starts ``server:socket_app`` on the fake database (as loadtest.py --serve
+does) --runs times and reports, from process spawn, when the liveness and
+readiness endpoints first answer 200 and when the first Socket.IO client
+connects. Run from the backend directory:
+
+    python benchmarks/bench_cold_start.py --runs 5
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+import socketio
+
+LOADTEST = Path(__file__).resolve().parent / "loadtest.py"
+
+
+async def first_ok(http, url, started, timeout):
+    while time.monotonic() - started < timeout:
+        try:
+            async with http.get(url) as response:
+                if response.status == 200:
+                    return time.monotonic() - started
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.005)
+    raise RuntimeError(f"{url} did not answer within {timeout}s")
+
+
+async def one_run(port, timeout):
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    proc = subprocess.Popen([sys.executable, str(LOADTEST), "--serve", "--port", str(port)])
+    try:
+        async with aiohttp.ClientSession() as http:
+            live = await first_ok(http, f"{base_url}/api/health/live", started, timeout)
+            ready = await first_ok(http, f"{base_url}/api/health/ready", started, timeout)
+        client = socketio.AsyncClient()
+        await client.connect(base_url, transports=["websocket"])
+        socket = time.monotonic() - started
+        await client.disconnect()
+        return live, ready, socket
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    runs = [asyncio.run(one_run(args.port, args.timeout)) for _ in range(args.runs)]
+    print(f"{'milestone':>14} {'median ms':>10} {'max ms':>8}")
+    for name, samples in zip(("live", "ready", "first socket"), zip(*runs)):
+        print(f"{name:>14} {statistics.median(samples) * 1000:>10.0f} {max(samples) * 1000:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark: players editing different facilities of one bastion at once
+
+--writers players share one room and each keeps hiring into its own special
+facility. Like the client, each player edits its local copy of
+``specialFacilities`` and sends the whole list; patches reach it --lag
+revisions behind the room and replace its local copy when they do. The
+updates are applied through a LocalRoomStore the way
+server.commit_client_updates applies them:
+
+* lww: no ``base``, so each full list replaces the last one (the old
+  behaviour);
+* merge: edits carry their ``base`` and are resolved by
+  ``bastion_merge.resolve_updates``. A conflicting edit is redone on top of
+  the current value the server sends back, which counts as a retry.
+
+Reports how many accepted hires are missing from the final state, and the
+retries needed per edit. Run from the backend directory:
+
+    python benchmarks/bench_concurrent_edits.py --writers 4 --edits 500
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bastion_merge import ClientUpdate, resolve_updates  # noqa: E402
+from room_store import LocalRoomStore  # noqa: E402
+
+FIELD = "specialFacilities"
+
+
+def hire(facilities, facility_id, hireling_id):
+    hireling = {"id": hireling_id, "name": hireling_id, "race": "Human"}
+    return [{**f, "hirelings": [*f["hirelings"], hireling]} if f["id"] == facility_id else f
+            for f in facilities]
+
+
+async def run(mode, writers, edits, lag, seed):
+    rng = random.Random(seed)
+    store = LocalRoomStore()
+    facilities = [{"id": f"f{i}", "name": "Workshop", "space": "Roomy", "hirelings": []} for i in range(writers)]
+    await store.seed("ROOM", {FIELD: facilities}, 0)
+    seen = {0: facilities}  # revision -> specialFacilities, as patched to the players
+    local = [(0, facilities)] * writers  # each player's (last revision patched in, local copy)
+    hired, retries, revision = [], 0, 0
+
+    started = time.perf_counter()
+    for n in range(edits):
+        writer = rng.randrange(writers)
+        known, copy = local[writer]
+        arrived = max([r for r in seen if known < r <= revision - lag], default=None)
+        if arrived is not None:
+            known, copy = arrived, seen[arrived]
+        hireling = f"h{n}"
+        copy = hire(copy, f"f{writer}", hireling)
+        local[writer] = known, copy
+        update = ClientUpdate({FIELD: copy}, known if mode == "merge" else None, f"player{writer}")
+        while True:
+            versions = await store.read_versions("ROOM", [FIELD])
+            merged, writer_of, conflicts = resolve_updates(versions, [update])
+            if not conflicts:
+                break
+            # The server sent back the current value; redo the edit on top of it
+            retries += 1
+            current = versions[FIELD]
+            local[writer] = current.revision, hire(current.value, f"f{writer}", hireling)
+            update = ClientUpdate({FIELD: local[writer][1]}, current.revision, update.writer)
+        result = await store.apply("ROOM", merged, writer_of, {FIELD: versions[FIELD].revision})
+        hired.append(hireling)
+        if result:
+            revision = result[0]
+            seen[revision] = result[1][FIELD]
+    elapsed = time.perf_counter() - started
+
+    state, _ = await store.get_state("ROOM")
+    kept = {h["id"] for f in state[FIELD] for h in f["hirelings"]}
+    return {"lost": sum(1 for h in hired if h not in kept), "retries": retries, "seconds": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--edits", type=int, default=500)
+    parser.add_argument("--lag", type=int, default=1, help="revisions each edit is behind the room")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'mode':>6} {'edits':>6} {'lost':>6} {'retries/edit':>13} {'us/edit':>8}")
+    for mode in ("lww", "merge"):
+        result = asyncio.run(run(mode, args.writers, args.edits, args.lag, args.seed))
+        print(f"{mode:>6} {args.edits:>6} {result['lost']:>6} {result['retries'] / args.edits:>13.3f} "
+              f"{result['seconds'] / args.edits * 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
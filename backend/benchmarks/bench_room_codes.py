@@ -0,0 +1,148 @@
+"""Benchmark: POST /api/bastion/create throughput with millions of existing bastions
+
+Drives the real create_bastion handler in process against fake bastions and
+counters collections that add a fixed latency per operation (a stand-in for
+the MongoDB round-trip). The bastions collection is pre-filled with
+--existing codes from the old random generator, and a unique-index check
+raises DuplicateKeyError like MongoDB would.
+
+Compares the block allocator with a DB-aware version of the old rejection
+loop (random code, find_one per attempt, then insert). Run from the backend
+directory:
+
+    python benchmarks/bench_room_codes.py --existing 1000000 3000000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pymongo.errors import DuplicateKeyError  # noqa: E402
+
+# Fake data must not end up in the room checkpoint a real start would warm from
+os.environ.setdefault("ROOM_CHECKPOINT_PATH", "")
+import server  # noqa: E402
+from room_codes import ALPHABET, CODE_LENGTH, RoomCodeAllocator  # noqa: E402
+
+
+class FakeBastions:
+    def __init__(self, existing, latency):
+        self.codes = existing
+        self.latency = latency
+        self.ops = 0
+
+    async def _round_trip(self):
+        self.ops += 1
+        await asyncio.sleep(self.latency)
+
+    async def find_one(self, query, *args, **kwargs):
+        await self._round_trip()
+        return {"room_code": query["room_code"]} if int(query["room_code"], 36) in self.codes else None
+
+    async def insert_one(self, doc):
+        await self._round_trip()
+        key = int(doc["room_code"], 36)
+        if key in self.codes:
+            raise DuplicateKeyError("E11000 duplicate key error collection: bastions index: room_code_1")
+        self.codes.add(key)
+
+
+class FakeCounters:
+    def __init__(self, latency):
+        self.value = 0
+        self.latency = latency
+        self.ops = 0
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        self.ops += 1
+        await asyncio.sleep(self.latency)
+        self.value += update["$inc"]["next"]
+        return {"_id": query["_id"], "next": self.value}
+
+
+class FakeDB:
+    def __init__(self, existing, latency):
+        self.bastions = FakeBastions(existing, latency)
+        self.counters = FakeCounters(latency)
+
+
+def legacy_codes(count):
+    rng = random.Random(11)
+    return {int(''.join(rng.choices(ALPHABET, k=CODE_LENGTH)), 36) for _ in range(count)}
+
+
+class LegacyRandomAllocator:
+    """Old rejection loop, made DB-aware with one find_one per attempt"""
+
+    def __init__(self, bastions):
+        self._bastions = bastions
+
+    async def allocate(self):
+        while True:
+            code = ''.join(random.choices(ALPHABET, k=CODE_LENGTH))
+            if not await self._bastions.find_one({"room_code": code}):
+                return code
+
+
+async def run(label, allocator, db, creates, concurrency):
+    server.db = db
+    server.code_allocator = allocator
+    server.store = type(server.store)()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await server.create_bastion()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(creates)))
+    elapsed = time.perf_counter() - start
+    db_ops = db.bastions.ops + db.counters.ops
+    return {
+        "allocator": label,
+        "creates": creates,
+        "createsPerSecond": round(creates / elapsed, 1),
+        "dbOpsPerCreate": round(db_ops / creates, 3),
+    }
+
+
+async def bench(existing_count, args):
+    existing = legacy_codes(existing_count)
+    results = []
+
+    db = FakeDB(set(existing), args.latency)
+    allocator = LegacyRandomAllocator(db.bastions)
+    results.append(await run("legacy-random", allocator, db, args.creates, args.concurrency))
+
+    db = FakeDB(set(existing), args.latency)
+    allocator = RoomCodeAllocator(db.counters, key=b"bench", block_size=args.block_size)
+    results.append(await run("block-permutation", allocator, db, args.creates, args.concurrency))
+
+    for result in results:
+        result["existingBastions"] = existing_count
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--existing", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--creates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--block-size", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.001, help="simulated seconds per DB round-trip")
+    args = parser.parse_args()
+
+    results = []
+    for count in args.existing:
+        results.extend(asyncio.run(bench(count, args)))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
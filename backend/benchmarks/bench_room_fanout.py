@@ -0,0 +1,132 @@
+"""Benchmark: emit volume for one crowded room, before and after spectators
+
+Replays one streamed game against a recorder that counts every delivered
+message (one emit to a room of k members delivers k messages) and its JSON
+bytes: --members join over --join-seconds, then the DM sends
+--updates-per-second bastion updates for --seconds.
+
+* before: everyone is a seated player, as before the spectator role. Every
+  join sends playerJoined and the full connectedPlayersUpdate roster to the
+  whole room, and every update sends a bastionPatch to everyone.
+* after: one DM plus spectators, through RoomFanout. Spectator frames are
+  throttled and coalesced, and join notices are debounced per room.
+
+Run from the backend directory:
+
+    python benchmarks/bench_room_fanout.py --members 500
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bastion_sync import patch_payload  # noqa: E402
+from room_fanout import RoomFanout, spectator_room  # noqa: E402
+
+ROOM = "ROOM01"
+
+
+class Recorder:
+    """Stands in for sio.emit and counts deliveries per event"""
+
+    def __init__(self):
+        self.members = Counter()  # socket.io room -> members
+        self.messages = Counter()
+        self.bytes = 0
+
+    async def emit(self, event, data, room):
+        recipients = self.members[room]
+        self.messages[event] += recipients
+        self.bytes += recipients * len(json.dumps([event, data]))
+
+
+async def replay(recorder, members, join_seconds, updates_per_second, seconds, join, update):
+    for i in range(members):
+        await join(i)
+        await asyncio.sleep(join_seconds / members)
+    revision = 0
+    gold = 5000
+    for _ in range(int(updates_per_second * seconds)):
+        revision += 1
+        gold -= 10
+        await update(revision, {"bastionGold": gold})
+        await asyncio.sleep(1 / updates_per_second)
+    # Let the last debounced notices and frames go out
+    await asyncio.sleep(1)
+
+
+async def before(args):
+    recorder = Recorder()
+    players = []
+
+    async def join(i):
+        player = {"id": f"p{i}", "name": f"Member {i}"}
+        players.append(player)
+        recorder.members[f"sid{i}"] = 1
+        recorder.members[ROOM] += 1
+        await recorder.emit("bastionState", {}, room=f"sid{i}")
+        await recorder.emit("playerJoined", player, room=ROOM)
+        await recorder.emit("connectedPlayersUpdate", list(players), room=ROOM)
+
+    async def update(revision, changes):
+        await recorder.emit("bastionPatch", patch_payload(revision, changes), room=ROOM)
+
+    await replay(recorder, args.members, args.join_seconds, args.updates_per_second, args.seconds, join, update)
+    return recorder
+
+
+async def after(args):
+    recorder = Recorder()
+    fanout = RoomFanout(recorder.emit, frame_rate=args.frame_rate, membership_delay=args.membership_delay)
+    players = []
+
+    async def join(i):
+        recorder.members[f"sid{i}"] = 1
+        if i == 0:
+            players.append({"id": "p0", "name": "DM"})
+            recorder.members[ROOM] += 1
+            await recorder.emit("bastionState", {}, room="sid0")
+            fanout.members_changed(ROOM, players=list(players), joined=players[0])
+        else:
+            recorder.members[spectator_room(ROOM)] += 1
+            await recorder.emit("bastionState", {}, room=f"sid{i}")
+            await recorder.emit("memberCount", {"players": len(players), "spectators": i}, room=f"sid{i}")
+            fanout.members_changed(ROOM, spectators=i, player_count=len(players))
+
+    async def update(revision, changes):
+        await recorder.emit("bastionPatch", patch_payload(revision, changes), room=ROOM)
+        fanout.publish(ROOM, revision, changes)
+
+    await replay(recorder, args.members, args.join_seconds, args.updates_per_second, args.seconds, join, update)
+    return recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--join-seconds", type=float, default=1.0)
+    parser.add_argument("--updates-per-second", type=float, default=20)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--frame-rate", type=float, default=4)
+    parser.add_argument("--membership-delay", type=float, default=0.25)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    old = asyncio.run(before(args))
+    new = asyncio.run(after(args))
+    events = sorted(set(old.messages) | set(new.messages))
+    print(f"{'event':>24} {'before':>10} {'after':>10}")
+    for event in events:
+        print(f"{event:>24} {old.messages[event]:>10} {new.messages[event]:>10}")
+    print(f"{'messages':>24} {sum(old.messages.values()):>10} {sum(new.messages.values()):>10}")
+    print(f"{'MiB':>24} {old.bytes / 2 ** 20:>10.2f} {new.bytes / 2 ** 20:>10.2f}")
+    print(f"({time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
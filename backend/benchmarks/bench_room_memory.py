@@ -0,0 +1,89 @@
+"""Benchmark: memory held by idle resident rooms
+
+Seeds --rooms idle rooms into the old dict-of-dicts layout and into
+LocalRoomStore's RoomState objects and measures each with tracemalloc. Every
+room's state is decoded from JSON separately, as it would be when loaded
+from MongoDB or received from a client, so no strings are shared by accident.
+Most rooms are fresh bastions; --built-share of them have a party, basic
+facilities and special facilities with hirelings. Run from the backend
+directory:
+
+    python benchmarks/bench_room_memory.py --rooms 100000
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from facility_catalog import FACILITIES_BY_NAME  # noqa: E402
+from room_state import RoomState  # noqa: E402
+
+FRESH = {
+    "party": [], "bastionGold": 5000, "bastionDefenders": 0, "bastionTurn": 1, "defensiveWalls": 0,
+    "armoryStocked": False, "basicFacilities": [], "specialFacilities": [],
+}
+
+
+def built_bastion():
+    special = []
+    for i, name in enumerate(["Barrack", "Workshop", "Library"]):
+        facility = dict(FACILITIES_BY_NAME[name])
+        hirelings = facility["hirelings"]
+        facility["id"] = 1700000000000 + i
+        facility["hirelings"] = [
+            {"id": 1700000000000 + i * 10 + h, "name": f"{name} Worker {h + 1}", "race": "Dwarf",
+             "role": f"{facility['order']} Specialist"}
+            for h in range(hirelings)
+        ]
+        special.append(facility)
+    return dict(
+        FRESH,
+        party=[{"id": i, "name": f"Hero {i}", "level": 5, "class": "Fighter"} for i in range(4)],
+        basicFacilities=[
+            {"name": name, "space": "Roomy", "id": 1600000000000 + i,
+             "hirelings": [{"id": 1600000000000 + i, "name": f"{name} Caretaker", "race": "Human",
+                            "role": "Caretaker"}]}
+            for i, name in enumerate(["Bedroom", "Kitchen"])
+        ],
+        specialFacilities=special,
+    )
+
+
+def legacy_room(data, revision):
+    return {"players": {}, "bastion_data": data, "revision": revision, "touched": time.monotonic(), "bytes": None}
+
+
+def measure(build, room_count, built_every):
+    fresh_json, built_json = json.dumps(FRESH), json.dumps(built_bastion())
+    tracemalloc.start()
+    rooms = {}
+    for r in range(room_count):
+        data = json.loads(built_json if built_every and r % built_every == 0 else fresh_json)
+        rooms[f"R{r:06d}"] = build(data, 0)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rooms
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=100_000)
+    parser.add_argument("--built-share", type=float, default=0.2, help="fraction of rooms with built facilities")
+    args = parser.parse_args()
+    built_every = round(1 / args.built_share) if args.built_share else 0
+
+    legacy = measure(legacy_room, args.rooms, built_every)
+    compact = measure(RoomState, args.rooms, built_every)
+    print(f"{'layout':>10} {'MiB':>9} {'bytes/room':>11}")
+    for name, total in (("dicts", legacy), ("RoomState", compact)):
+        print(f"{name:>10} {total / 2 ** 20:>9.1f} {total / args.rooms:>11.0f}")
+    print(f"saved {(1 - compact / legacy) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark: bytes and µs per bastion broadcast for each packet codec
+
+Encodes bastionState and bastionPatch packets for small, medium and large
+bastions with the stock socketio packet (binary scan + stdlib json), the
+server's JsonOnlyPacket with stdlib json and with orjson and, when installed,
+msgpack (shown for reference; it needs a msgpack parser on the client). It also shows what a 50-member room would cost if the packet
+were encoded per recipient instead of once per room. Run from the backend
+directory:
+
+    python benchmarks/bench_serialization.py
+"""
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from socketio import packet  # noqa: E402
+
+from serialization import JsonOnlyPacket, OrjsonCodec  # noqa: E402
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ROOM_MEMBERS = 50
+RACES = ["Human", "Elf", "Dwarf", "Halfling", "Dragonborn", "Gnome", "Half-Elf", "Half-Orc", "Tiefling"]
+
+
+def make_facility(i, special, hirelings):
+    facility = {
+        "id": 1700000000000 + i,
+        "name": f"Facility {i}",
+        "space": random.choice(["Cramped", "Roomy", "Vast"]),
+        "hirelings": [
+            {"id": 1700000000000 + i * 100 + h, "name": f"Facility {i} Worker {h + 1}",
+             "race": random.choice(RACES), "role": "Specialist" if special else "Caretaker"}
+            for h in range(hirelings)
+        ],
+    }
+    if special:
+        facility.update({
+            "level": random.choice([5, 9, 13, 17]),
+            "prerequisite": "None",
+            "order": random.choice(["Craft", "Trade", "Recruit", "Harvest", "Research"]),
+            "description": "A place of quiet research with desks and bookshelves.",
+            "craftOptions": ["Arcane Focus (7 days, free)", "Book (7 days, 10 GP)"],
+        })
+    return facility
+
+
+def make_bastion(party, basic, special, hirelings):
+    return {
+        "party": [{"id": 1700000000000 + i, "name": f"Character {i}", "level": random.randint(5, 20)} for i in range(party)],
+        "bastionGold": 5000,
+        "bastionDefenders": 12,
+        "bastionTurn": 7,
+        "defensiveWalls": 2,
+        "armoryStocked": True,
+        "basicFacilities": [make_facility(i, False, 1) for i in range(basic)],
+        "specialFacilities": [make_facility(100 + i, True, hirelings) for i in range(special)],
+        "connectedPlayers": [{"id": f"player-{i}", "name": f"Player {i}"} for i in range(party)],
+        "revision": 42,
+    }
+
+
+SIZES = {
+    "small": make_bastion(party=2, basic=2, special=2, hirelings=1),
+    "medium": make_bastion(party=4, basic=8, special=4, hirelings=3),
+    "large": make_bastion(party=6, basic=24, special=6, hirelings=12),
+}
+
+
+def encoder(codec):
+    if codec == "msgpack":
+        return lambda event, data: msgpack.dumps({"type": packet.EVENT, "data": [event, data], "nsp": "/"})
+    if codec == "stock":
+        return lambda event, data: packet.Packet(packet.EVENT, namespace="/", data=[event, data]).encode()
+
+    class CodecPacket(JsonOnlyPacket):
+        json = {"json": json, "orjson": OrjsonCodec}[codec]
+
+    return lambda event, data: CodecPacket(packet.EVENT, namespace="/", data=[event, data]).encode()
+
+
+def measure(encode, event, data, iterations):
+    payload = encode(event, data)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encode(event, data)
+    elapsed = (time.perf_counter() - start) / iterations * 1e6
+    return len(payload if isinstance(payload, (bytes, bytearray)) else payload.encode()), elapsed
+
+
+def main():
+    codecs = ["stock", "json", "orjson"]
+    if msgpack is not None:
+        codecs.append("msgpack")
+
+    print(f"{'size':<7} {'event':<13} {'codec':<8} {'bytes':>7} {'µs/encode':>10} {f'µs/room x{ROOM_MEMBERS} per-recipient':>28}")
+    for size, bastion in SIZES.items():
+        patch = {"revision": 43, "changes": {"bastionGold": 4200}}
+        for event, data in (("bastionState", bastion), ("bastionPatch", patch)):
+            iterations = 2000 if event == "bastionState" else 20000
+            for codec in codecs:
+                size_bytes, micros = measure(encoder(codec), event, data, iterations)
+                print(f"{size:<7} {event:<13} {codec:<8} {size_bytes:>7} {micros:>10.2f} {micros * ROOM_MEMBERS:>28.1f}")
+
+
+if __name__ == "__main__":
+    random.seed(7)
+    main()
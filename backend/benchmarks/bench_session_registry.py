@@ -0,0 +1,82 @@
+"""Benchmark: resolving the sender's room in updateBastion as room count grows
+
+Compares the old full scan over every room's player list with the
+SessionRegistry index. Run from the backend directory:
+
+    python benchmarks/bench_session_registry.py
+"""
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from session_registry import SessionRegistry  # noqa: E402
+
+ROOM_COUNTS = [10, 100, 1_000, 10_000, 100_000]
+PLAYERS_PER_ROOM = 4
+LOOKUPS = 2_000
+
+
+def build_rooms(room_count):
+    """Populate both the legacy list layout and the indexed layout"""
+    legacy_rooms = {}
+    rooms = {}
+    sessions = SessionRegistry()
+    sids = []
+    for r in range(room_count):
+        room_code = f"R{r:05d}"
+        legacy_rooms[room_code] = {"players": [], "bastion_data": {"bastionGold": 5000}}
+        rooms[room_code] = {"players": {}, "bastion_data": {"bastionGold": 5000}}
+        for _ in range(PLAYERS_PER_ROOM):
+            sid = uuid.uuid4().hex
+            player = {"id": str(uuid.uuid4()), "name": "bench", "sid": sid}
+            legacy_rooms[room_code]["players"].append(player)
+            rooms[room_code]["players"][player["id"]] = player
+            sessions.bind(sid, room_code, player["id"])
+            sids.append(sid)
+    return legacy_rooms, rooms, sessions, sids
+
+
+def legacy_update(legacy_rooms, sid, data):
+    player_room = None
+    for room_code, room_data in legacy_rooms.items():
+        for player in room_data["players"]:
+            if player["sid"] == sid:
+                player_room = room_code
+                break
+        if player_room:
+            break
+    legacy_rooms[player_room]["bastion_data"].update(data)
+
+
+def indexed_update(rooms, sessions, sid, data):
+    room_code, _ = sessions.lookup(sid)
+    rooms[room_code]["bastion_data"].update(data)
+
+
+def time_per_call(fn, sids, lookups):
+    # Sample evenly across the sid space so the scan is not flattered
+    step = max(1, len(sids) // lookups)
+    sample = sids[::step][:lookups]
+    start = time.perf_counter()
+    for sid in sample:
+        fn(sid)
+    return (time.perf_counter() - start) / len(sample) * 1e6
+
+
+def main():
+    print(f"{'rooms':>8} {'legacy µs/update':>18} {'indexed µs/update':>18}")
+    for room_count in ROOM_COUNTS:
+        legacy_rooms, rooms, sessions, sids = build_rooms(room_count)
+        data = {"bastionGold": 4200}
+        # The scan is O(total players); cap its samples to keep the run short
+        legacy_lookups = max(20, LOOKUPS // max(1, room_count // 100))
+        legacy = time_per_call(lambda s: legacy_update(legacy_rooms, s, data), sids, legacy_lookups)
+        indexed = time_per_call(lambda s: indexed_update(rooms, sessions, s, data), sids, LOOKUPS)
+        print(f"{room_count:>8} {legacy:>18.2f} {indexed:>18.3f}")
+
+
+if __name__ == "__main__":
+    main()
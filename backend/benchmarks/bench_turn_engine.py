@@ -0,0 +1,65 @@
+"""Benchmark: advancing a turn for many bastions in one batch
+
+Builds bastions with a realistic mix of special facilities (a Barrack,
+an Armory, a Gaming Hall and a few order-less ones), gives every facility
+its order and times ``advance_turns`` over the whole batch. That is the pass
+``POST /api/bastions/advance-turn`` runs once its rooms have checked in
+through their mailboxes (see ``turn_engine.TurnBatch``); loading the rooms
+and committing the outcomes are not timed here. Run from the backend
+directory:
+
+    python benchmarks/bench_turn_engine.py
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from turn_engine import FACILITY_RULES, ORDERS, TurnOrders, advance_turns  # noqa: E402
+
+BASTION_COUNTS = [1_000, 10_000, 100_000]
+FACILITIES_PER_BASTION = 6
+SEED = 7
+
+
+def build_bastions(count, rng):
+    names = sorted(FACILITY_RULES)
+    batch = []
+    for b in range(count):
+        facilities = []
+        for f, name in enumerate(["Barrack", "Armory", "Gaming Hall"]
+                                 + rng.sample(names, FACILITIES_PER_BASTION - 3)):
+            facilities.append({
+                "id": b * 100 + f,
+                "name": name,
+                "space": "Roomy",
+                "hirelings": [{"id": 1, "name": "Worker", "race": "Human", "role": "Specialist"}],
+            })
+        bastion = {
+            "bastionGold": 5000,
+            "bastionDefenders": rng.randint(0, 8),
+            "bastionTurn": 1,
+            "armoryStocked": False,
+            "specialFacilities": facilities,
+        }
+        orders = {f["id"]: ORDERS[FACILITY_RULES[f["name"]].order] for f in facilities}
+        batch.append((bastion, TurnOrders(orders, gold=-50, defenders=-1)))
+    return batch
+
+
+def main():
+    rng = random.Random(SEED)
+    print(f"{'bastions':>9} {'seconds':>9} {'µs/bastion':>11}")
+    for count in BASTION_COUNTS:
+        batch = build_bastions(count, rng)
+        start = time.perf_counter()
+        results = advance_turns(batch, seed=SEED)
+        elapsed = time.perf_counter() - start
+        assert len(results) == count
+        print(f"{count:>9} {elapsed:>9.3f} {elapsed / count * 1e6:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
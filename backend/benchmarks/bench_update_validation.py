@@ -0,0 +1,72 @@
+"""Benchmark: cost of validating and rate limiting an updateBastion payload
+
+Times UpdateValidator.validate on the update shapes the frontend sends (a
+single counter, a party edit, a facility list) and on rejected payloads,
+plus one TokenBucketLimiter.allow. Run from the backend directory:
+
+    python benchmarks/bench_update_validation.py
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bastion_sync import SERVER_OWNED_FIELDS  # noqa: E402
+from update_validation import TokenBucketLimiter, UpdateRejected, UpdateValidator  # noqa: E402
+from server import BastionData  # noqa: E402
+
+ITERATIONS = 100_000
+
+PARTY = [{"id": i, "name": f"Hero {i}", "level": 5 + i, "class": "Fighter"} for i in range(6)]
+FACILITIES = [
+    {
+        "id": 1700000000000 + i,
+        "name": "Workshop",
+        "space": "Roomy",
+        "level": 5,
+        "order": "Craft",
+        "description": "Workbenches and tools for crafting.",
+        "hirelings": [{"id": 1700000000000 + i * 10 + h, "name": f"Worker {h}", "race": "Dwarf",
+                       "role": "Craft Specialist"} for h in range(3)],
+    }
+    for i in range(4)
+]
+
+CASES = {
+    "gold": {"bastionGold": 4200},
+    "turn+defenders": {"bastionTurn": 7, "bastionDefenders": 12},
+    "party (6)": {"party": PARTY},
+    "facilities (4)": {"specialFacilities": FACILITIES},
+    "unknown key": {"isAdmin": True},
+    "oversized party": {"party": PARTY * 10},
+}
+
+
+def time_per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    validator = UpdateValidator(BastionData, exclude=SERVER_OWNED_FIELDS)
+
+    def validate(update):
+        try:
+            validator.validate(update)
+        except UpdateRejected:
+            pass
+
+    print(f"{'payload':>16} {'µs/validate':>12}")
+    for name, update in CASES.items():
+        iterations = ITERATIONS // 10 if "facilities" in name or "party" in name else ITERATIONS
+        print(f"{name:>16} {time_per_call(lambda: validate(update), iterations):>12.3f}")
+
+    limiter = TokenBucketLimiter(rate=1e9, burst=1e9)
+    print(f"{'token bucket':>16} {time_per_call(lambda: limiter.allow('sid'), ITERATIONS):>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
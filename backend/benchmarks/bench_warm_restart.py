@@ -0,0 +1,143 @@
+"""Benchmark: bringing --rooms hot rooms back after a restart, cold and warm
+
+Fills the fake database and a LocalRoomStore with --rooms bastions, writes a
+room checkpoint, then simulates a restart twice with an empty store and every
+room rejoining at once through RoomCache:
+
+* cold: each miss is a find_one against MongoDB, as before checkpoints.
+* warm: the checkpoint is mapped and reconciled with one revision query, and
+  misses are served from it. --stale-fraction of the rooms are given a newer
+  revision in MongoDB first, so they have to fall back to a read.
+
+Every MongoDB operation takes --mongo-latency-ms and at most --pool run at
+once, like a connection pool. Reports wall time to full residency and the
+MongoDB reads issued. Run from the backend directory:
+
+    python benchmarks/bench_warm_restart.py --rooms 10000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from facility_catalog import SPECIAL_FACILITIES  # noqa: E402
+from room_cache import RoomCache  # noqa: E402
+from room_checkpoint import RoomCheckpoint  # noqa: E402
+from room_store import LocalRoomStore  # noqa: E402
+
+
+class PooledCollection:
+    """Counts reads and holds each one to a pool slot and a round trip"""
+
+    def __init__(self, collection, latency, pool):
+        self._collection = collection
+        self._latency = latency
+        self._pool = asyncio.Semaphore(pool)
+        self.reads = 0
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        async with self._pool:
+            await asyncio.sleep(self._latency)
+            return await self._collection.find_one(query, projection)
+
+    async def _find(self, query, projection):
+        self.reads += 1
+        async with self._pool:
+            await asyncio.sleep(self._latency)
+            async for doc in self._collection.find(query, projection):
+                yield doc
+
+    def find(self, query, projection=None):
+        return self._find(query, projection)
+
+
+def bastion(rng):
+    facilities = [{**rng.choice(SPECIAL_FACILITIES), "id": f"f{i}", "hirelings": []} for i in range(rng.randint(0, 6))]
+    return {
+        "party": [{"name": f"Hero {i}", "level": rng.choice((5, 9, 13, 17))} for i in range(4)],
+        "bastionGold": rng.randint(0, 20000), "bastionDefenders": rng.randint(0, 40),
+        "bastionTurn": rng.randint(1, 60), "defensiveWalls": rng.randint(0, 10), "armoryStocked": False,
+        "basicFacilities": [{"id": "b0", "name": "Bedroom", "space": "Cramped", "hirelings": []}],
+        "specialFacilities": facilities,
+    }
+
+
+async def restart(collection, room_codes, checkpoint=None):
+    """Empty store, every room rejoining at once; return (seconds, reads)"""
+    store = LocalRoomStore()
+    reads_before = collection.reads
+
+    async def loader(room_code):
+        if checkpoint is not None:
+            warm = await checkpoint.take(room_code)
+            if warm is not None:
+                return warm[0], warm[1]
+        doc = await collection.find_one({"room_code": room_code})
+        return (doc["bastion_data"], doc.get("revision", 0)) if doc else None
+
+    cache = RoomCache(store, loader, capacity=len(room_codes))
+    started = time.perf_counter()
+    if checkpoint is not None:
+        checkpoint.open()
+        await checkpoint.reconcile(collection)
+    found = await asyncio.gather(*(cache.ensure(room_code) for room_code in room_codes))
+    elapsed = time.perf_counter() - started
+    assert all(found) and await store.size() == len(room_codes)
+    return elapsed, collection.reads - reads_before
+
+
+async def run(args, path):
+    os.environ["FAKE_MONGO_LATENCY_MS"] = "0"
+    from benchmarks.fake_mongo import FakeCollection
+
+    rng = random.Random(args.seed)
+    raw = FakeCollection(unique_key="room_code")
+    store = LocalRoomStore()
+    room_codes = [f"R{i:06d}" for i in range(args.rooms)]
+    for room_code in room_codes:
+        data = bastion(rng)
+        raw._insert({"room_code": room_code, "bastion_data": data, "revision": 10})
+        await store.seed(room_code, data, 10)
+
+    checkpoint = RoomCheckpoint(path, store.resident_rooms)
+    started = time.perf_counter()
+    await checkpoint.write()
+    write_seconds = time.perf_counter() - started
+    for room_code in rng.sample(room_codes, int(len(room_codes) * args.stale_fraction)):
+        raw._update({"room_code": room_code}, {"$set": {"revision": 11}}, upsert=False)
+
+    collection = PooledCollection(raw, args.mongo_latency_ms / 1000, args.pool)
+    cold = await restart(collection, room_codes)
+    warm_checkpoint = RoomCheckpoint(path, store.resident_rooms)
+    warm = await restart(collection, room_codes, warm_checkpoint)
+    return write_seconds, checkpoint.stats(), cold, warm, warm_checkpoint.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=10000)
+    parser.add_argument("--mongo-latency-ms", type=float, default=1.0)
+    parser.add_argument("--pool", type=int, default=100)
+    parser.add_argument("--stale-fraction", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_seconds, written, cold, warm, served = asyncio.run(run(args, os.path.join(tmp, "rooms.ckpt")))
+    print(f"checkpoint      {written['lastCheckpointRooms']} rooms, "
+          f"{written['lastCheckpointBytes'] / 2 ** 20:.1f} MiB in {write_seconds:.2f}s")
+    print(f"{'restart':>8} {'seconds':>9} {'mongo reads':>12}")
+    for name, (seconds, reads) in (("cold", cold), ("warm", warm)):
+        print(f"{name:>8} {seconds:>9.3f} {reads:>12}")
+    print(f"warm loads {served['warmLoads']}, stale {served['staleRooms']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""In-process stand-in for the parts of Motor that server.py uses
+
+Good enough to boot ``server.socket_app`` for benchmarks without a MongoDB:
+equality, comparison and ``$or`` filters, projections, ``$set`` (including
+dotted paths), ``$inc``, ``$max``, ``$setOnInsert``, ``$set``-only update
+pipelines, sorted/limited ``find`` cursors, ``$project`` aggregations,
+``bulk_write`` of ``UpdateOne`` operations and a unique ``room_code``. Set
+FAKE_MONGO_LATENCY_MS to give every operation a round trip.
+"""
+import asyncio
+import copy
+import itertools
+import os
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+_ids = itertools.count(1)
+
+# What $$REMOVE evaluates to: the field is left out
+_REMOVE = object()
+
+# Simulated network round trip per operation, for comparing per-item and batched calls
+LATENCY = float(os.environ.get("FAKE_MONGO_LATENCY_MS", "0")) / 1000
+
+
+async def _round_trip():
+    if LATENCY:
+        await asyncio.sleep(LATENCY)
+
+
+def _get(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+def _unset(doc, path):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(leaf, None)
+
+
+def _set(doc, path, value):
+    *parents, leaf = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[leaf] = value
+
+
+_COMPARISONS = {
+    "$in": lambda value, operand: value in operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$exists": lambda value, operand: (value is not None) == operand,
+}
+
+
+def _matches(doc, query):
+    for key, expected in query.items():
+        if key == "$or":
+            if not any(_matches(doc, branch) for branch in expected):
+                return False
+            continue
+        value = _get(doc, key)
+        if isinstance(expected, dict) and expected and all(op.startswith("$") for op in expected):
+            if not all(_COMPARISONS[op](value, operand) for op, operand in expected.items()):
+                return False
+        elif value != expected:
+            return False
+    return True
+
+
+def _sorted(docs, sort):
+    for key, direction in reversed(sort or []):
+        docs = sorted(docs, key=lambda doc: _get(doc, key), reverse=direction < 0)
+    return docs
+
+
+def _project(doc, projection):
+    if not projection:
+        return doc
+    included = [key for key, keep in projection.items() if keep]
+    if included:
+        doc = {key: doc[key] for key in ["_id", *included] if key in doc}
+    return {key: value for key, value in doc.items() if projection.get(key, 1)}
+
+
+class FakeCursor:
+    def __init__(self, docs, projection=None):
+        self._docs = docs
+        self._projection = projection
+        self._sort = None
+        self._limit = 0
+
+    def sort(self, key, direction=1):
+        self._sort = key if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def _results(self):
+        docs = _sorted(self._docs, self._sort)
+        return [copy.deepcopy(_project(doc, self._projection)) for doc in (docs[:self._limit] if self._limit else docs)]
+
+    async def to_list(self, length=None):
+        await _round_trip()
+        docs = self._results()
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await _round_trip()
+        for doc in self._results():
+            yield doc
+
+
+def _convert(spec, doc, variables):
+    value = _evaluate(spec["input"], doc, variables)
+    if value is None:
+        return spec.get("onNull")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return spec.get("onError")
+
+
+def _map(spec, doc, variables):
+    items = _evaluate(spec["input"], doc, variables) or []
+    return [_evaluate(spec["in"], doc, {**variables, spec["as"]: item}) for item in items]
+
+
+def _max(values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def _greater(value, other):
+    # null and missing sort below every number, as in MongoDB
+    if value is None or other is None:
+        return value is not None
+    return value > other
+
+
+def _index_of(array, value):
+    return array.index(value) if value in array else -1
+
+
+_EXPRESSIONS = {
+    "$convert": _convert,
+    "$map": _map,
+    "$literal": lambda arg, doc, v: arg,
+    "$gt": lambda args, doc, v: _greater(_evaluate(args[0], doc, v), _evaluate(args[1], doc, v)),
+    "$cond": lambda args, doc, v: _evaluate(args[1] if _evaluate(args[0], doc, v) else args[2], doc, v),
+    "$isArray": lambda arg, doc, v: isinstance(_evaluate(arg, doc, v), list),
+    "$size": lambda arg, doc, v: len(_evaluate(arg, doc, v)),
+    "$sum": lambda arg, doc, v: sum(_evaluate(arg, doc, v) or []),
+    "$add": lambda args, doc, v: sum(_evaluate(arg, doc, v) for arg in args),
+    "$max": lambda arg, doc, v: _max(
+        [_evaluate(a, doc, v) for a in arg] if isinstance(arg, list) else _evaluate(arg, doc, v) or []),
+    "$indexOfArray": lambda args, doc, v: _index_of(_evaluate(args[0], doc, v), _evaluate(args[1], doc, v)),
+}
+
+
+def _evaluate(expression, doc, variables):
+    """The subset of aggregation expressions analytics.PIPELINE and the write-behind flush use"""
+    if expression == "$$REMOVE":
+        return _REMOVE
+    if isinstance(expression, str) and expression.startswith("$$"):
+        name, _, path = expression[2:].partition(".")
+        value = variables.get(name)
+        return _get(value, path) if path else value
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _get(doc, expression[1:])
+    if isinstance(expression, dict) and len(expression) == 1 and next(iter(expression)) in _EXPRESSIONS:
+        (operator, argument), = expression.items()
+        return _EXPRESSIONS[operator](argument, doc, variables)
+    return expression
+
+
+def _apply_update(doc, update):
+    if isinstance(update, list):
+        for stage in update:
+            (name, spec), = stage.items()
+            if name != "$set":
+                raise NotImplementedError(f"fake update pipeline has no {name} stage")
+            # Every expression in a stage sees the document as it was before the stage
+            values = {path: _evaluate(expression, doc, {}) for path, expression in spec.items()}
+            for path, value in values.items():
+                if value is _REMOVE:
+                    _unset(doc, path)
+                else:
+                    _set(doc, path, copy.deepcopy(value))
+        return
+    for path, value in update.get("$set", {}).items():
+        _set(doc, path, copy.deepcopy(value))
+    for path, value in update.get("$inc", {}).items():
+        _set(doc, path, (_get(doc, path) or 0) + value)
+    for path, value in update.get("$max", {}).items():
+        current = _get(doc, path)
+        if current is None or value > current:
+            _set(doc, path, value)
+
+
+class FakeCollection:
+    def __init__(self, unique_key=None):
+        self._docs = {}
+        self._unique_key = unique_key
+        self._by_unique = {}
+
+    async def create_index(self, *args, **kwargs):
+        return "fake_index"
+
+    def _find(self, query):
+        if self._unique_key and set(query) == {self._unique_key}:
+            # Served from the unique index, as MongoDB would
+            value = query[self._unique_key]
+            if not isinstance(value, dict):
+                doc = self._by_unique.get(value)
+                return [doc] if doc is not None else []
+            if set(value) == {"$in"}:
+                return [self._by_unique[key] for key in dict.fromkeys(value["$in"]) if key in self._by_unique]
+        return [doc for doc in self._docs.values() if _matches(doc, query)]
+
+    async def insert_one(self, doc):
+        await _round_trip()
+        self._insert(doc)
+
+    def _insert(self, doc):
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", next(_ids))
+        if self._unique_key and self._unique_key in doc:
+            if doc[self._unique_key] in self._by_unique:
+                raise DuplicateKeyError(f"E11000 duplicate key error index: {self._unique_key}_1")
+            self._by_unique[doc[self._unique_key]] = doc
+        self._docs[doc["_id"]] = doc
+
+    async def insert_many(self, docs, ordered=True):
+        await _round_trip()
+        errors = []
+        for index, doc in enumerate(docs):
+            try:
+                self._insert(doc)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(docs) - len(errors)})
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(self._find(query or {}), projection)
+
+    def aggregate(self, pipeline, **kwargs):
+        docs = list(self._docs.values())
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            if name != "$project":
+                raise NotImplementedError(f"fake aggregate has no {name} stage")
+            docs = [{key: _evaluate(expression, doc, {}) for key, expression in spec.items() if key != "_id"}
+                    for doc in docs]
+        return FakeCursor(docs)
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        await _round_trip()
+        found = _sorted(self._find(query or {}), sort)
+        return copy.deepcopy(found[0]) if found else None
+
+    async def update_one(self, query, update, upsert=False):
+        await _round_trip()
+        self._update(query, update, upsert)
+
+    def _update(self, query, update, upsert):
+        found = self._find(query)
+        if found:
+            _apply_update(found[0], update)
+        elif upsert:
+            doc = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            _apply_update(doc, update)
+            for path, value in (update.get("$setOnInsert", {}) if isinstance(update, dict) else {}).items():
+                _set(doc, path, copy.deepcopy(value))
+            self._insert(doc)
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=ReturnDocument.BEFORE, **kwargs):
+        await _round_trip()
+        found = self._find(query)
+        if not found:
+            if not upsert:
+                return None
+            self._update(query, update, upsert=True)
+            return copy.deepcopy(self._find(query)[0]) if return_document == ReturnDocument.AFTER else None
+        before = copy.deepcopy(found[0])
+        _apply_update(found[0], update)
+        return copy.deepcopy(found[0]) if return_document == ReturnDocument.AFTER else before
+
+    async def bulk_write(self, operations, ordered=True):
+        await _round_trip()
+        for op in operations:
+            self._update(op._filter, op._doc, op._upsert)
+
+    def __len__(self):
+        return len(self._docs)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(unique_key="room_code" if name == "bastions" else None)
+        return self._collections[name]
+
+    async def command(self, name, *args, **kwargs):
+        await _round_trip()
+        return {"ok": 1.0}
+
+
+def install(server_module):
+    """Point a freshly imported server module at a fake database"""
+    db = FakeDatabase()
+    server_module.db = db
+    server_module.persister._collection = db.bastions
+    server_module.code_allocator._counters = db.counters
+    server_module.history._events = db.bastion_events
+    server_module.history._snapshots = db.bastion_snapshots
+    server_module.analytics._collection = db.bastions
+    return db
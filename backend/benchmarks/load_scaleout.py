@@ -0,0 +1,135 @@
+"""Load test: one room served by N workers sharing Redis
+
+Starts N uvicorn workers of ``server:socket_app`` on consecutive ports, all
+pointed at the same MONGO_URL and REDIS_URL, then for each worker count:
+
+* opens --clients socket connections spread round-robin over the workers and
+  reports how many connections per second were accepted, and
+* joins them all to one bastion, sends one update from a client on the first
+  worker and checks that every client on every worker receives the patch.
+
+Needs a running MongoDB and Redis plus the socket.io client extras
+(``pip install "python-socketio[asyncio_client]"``). Run from the backend
+directory:
+
+    REDIS_URL=redis://localhost:6379/0 python benchmarks/load_scaleout.py --workers 1 2 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+import socketio
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def start_workers(count, base_port):
+    env = dict(os.environ)
+    procs = []
+    for i in range(count):
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:socket_app",
+             "--host", "127.0.0.1", "--port", str(base_port + i), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env,
+        ))
+    for i in range(count):
+        url = f"http://127.0.0.1:{base_port + i}/api/"
+        for _ in range(100):
+            try:
+                if requests.get(url, timeout=1).ok:
+                    break
+            except requests.RequestException:
+                pass
+            time.sleep(0.1)
+        else:
+            raise RuntimeError(f"worker on port {base_port + i} did not start")
+    return procs
+
+
+def stop_workers(procs):
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        proc.wait(timeout=10)
+
+
+async def connect_clients(ports, clients, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    connected = []
+    failures = 0
+
+    async def connect_one(i):
+        nonlocal failures
+        sio = socketio.AsyncClient(reconnection=False)
+        sio.received = asyncio.Event()
+        sio.on("bastionPatch", lambda data, c=sio: c.received.set())
+        async with semaphore:
+            try:
+                await sio.connect(f"http://127.0.0.1:{ports[i % len(ports)]}", transports=["websocket"])
+                connected.append(sio)
+            except Exception:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connect_one(i) for i in range(clients)))
+    return connected, failures, time.perf_counter() - start
+
+
+async def run(worker_count, args):
+    procs = start_workers(worker_count, args.base_port)
+    ports = [args.base_port + i for i in range(worker_count)]
+    try:
+        room_code = requests.post(f"http://127.0.0.1:{ports[0]}/api/bastion/create", timeout=5).json()["roomCode"]
+        clients, failures, elapsed = await connect_clients(ports, args.clients, args.concurrency)
+
+        for i, sio in enumerate(clients):
+            await sio.emit("joinBastion", {"roomCode": room_code, "playerName": f"load-{i}"})
+        await asyncio.sleep(args.settle)
+
+        await clients[0].emit("updateBastion", {"bastionGold": int(time.time()) % 100000})
+        try:
+            await asyncio.wait_for(asyncio.gather(*(c.received.wait() for c in clients)), timeout=args.timeout)
+        except asyncio.TimeoutError:
+            pass
+        delivered = sum(1 for c in clients if c.received.is_set())
+
+        await asyncio.gather(*(c.disconnect() for c in clients), return_exceptions=True)
+        return {
+            "workers": worker_count,
+            "clients": args.clients,
+            "connected": len(clients),
+            "failed": failures,
+            "connectSeconds": round(elapsed, 3),
+            "connectionsPerSecond": round(len(clients) / elapsed, 1) if elapsed else None,
+            "patchDelivered": delivered,
+        }
+    finally:
+        stop_workers(procs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--base-port", type=int, default=8101)
+    parser.add_argument("--settle", type=float, default=2.0)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    if not os.environ.get("REDIS_URL"):
+        parser.error("REDIS_URL must be set so workers share room state")
+
+    results = [asyncio.run(run(count, args)) for count in args.workers]
+    print(json.dumps(results, indent=2))
+    return 0 if all(r["patchDelivered"] == r["connected"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
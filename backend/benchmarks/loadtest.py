@@ -0,0 +1,263 @@
+"""Socket.IO load test: many clients joining, updating and leaving bastions
+
+Boots ``server:socket_app`` in a child process against the in-process fake
+MongoDB (benchmarks/fake_mongo.py), then drives --clients simulated players
+from this process. Players are spread over rooms --fan-in at a time; each
+one joins, sends --updates updates with --think-ms between them, and
+disconnects. Reported as JSON:
+
+* join latency: joinBastion emitted -> bastionState received
+* update latency: updateBastion emitted -> next bastionPatch received
+* throughput of updates and the server's peak resident memory
+
+Needs the socket.io asyncio client extras
+(``pip install "python-socketio[asyncio_client]"``). Run from the backend
+directory:
+
+    python benchmarks/loadtest.py --clients 2000 --fan-in 8 --output run.json
+    python benchmarks/loadtest.py --clients 2000 --fan-in 8 --compare run.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+import socketio
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def serve(port):
+    """Child process: run the real app on a fake database"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    os.chdir(BACKEND_DIR)
+    os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+    # Fake-data rooms must not end up in the checkpoint a real start would warm from
+    os.environ.setdefault("ROOM_CHECKPOINT_PATH", "")
+
+    import uvicorn
+
+    import fake_mongo
+    import server
+
+    fake_mongo.install(server)
+    uvicorn.run(server.socket_app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def summarize(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "meanMs": round(statistics.fmean(ordered) * 1000, 3),
+        "p50Ms": pct(0.50),
+        "p90Ms": pct(0.90),
+        "p99Ms": pct(0.99),
+        "maxMs": round(ordered[-1] * 1000, 3),
+    }
+
+
+class Player:
+    """One simulated client"""
+
+    def __init__(self, url, room_code, name, gold_values, timeout):
+        self.url = url
+        self.room_code = room_code
+        self.name = name
+        self.gold_values = gold_values
+        self.timeout = timeout
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.state_received = asyncio.Event()
+        self.patch_received = asyncio.Event()
+        self.sio.on("bastionState", self._on_state)
+        self.sio.on("bastionPatch", self._on_patch)
+
+    async def _on_state(self, data):
+        self.state_received.set()
+
+    async def _on_patch(self, data):
+        self.patch_received.set()
+
+    async def run(self, updates, think, results):
+        try:
+            await self.sio.connect(self.url, transports=["websocket"], wait_timeout=self.timeout)
+        except Exception:
+            results["errors"]["connect"] += 1
+            return
+        try:
+            start = time.perf_counter()
+            await self.sio.emit("joinBastion", {"roomCode": self.room_code, "playerName": self.name})
+            await asyncio.wait_for(self.state_received.wait(), self.timeout)
+            results["join"].append(time.perf_counter() - start)
+
+            for _ in range(updates):
+                await asyncio.sleep(think)
+                self.patch_received.clear()
+                start = time.perf_counter()
+                await self.sio.emit("updateBastion", {"bastionGold": next(self.gold_values)})
+                try:
+                    await asyncio.wait_for(self.patch_received.wait(), self.timeout)
+                    results["update"].append(time.perf_counter() - start)
+                except asyncio.TimeoutError:
+                    results["errors"]["updateTimeout"] += 1
+        except asyncio.TimeoutError:
+            results["errors"]["joinTimeout"] += 1
+        finally:
+            await self.sio.disconnect()
+            results["disconnects"] += 1
+
+
+async def create_rooms(base_url, count):
+    async with aiohttp.ClientSession() as http:
+        codes = []
+        for _ in range(count):
+            async with http.post(f"{base_url}/api/bastion/create") as response:
+                codes.append((await response.json())["roomCode"])
+        return codes
+
+
+async def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as http:
+        while time.monotonic() < deadline:
+            try:
+                async with http.get(f"{base_url}/api/") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def drive(args, server_pid):
+    base_url = f"http://127.0.0.1:{args.port}"
+    await wait_until_up(base_url)
+    rss_start = rss_bytes(server_pid)
+
+    room_count = max(1, -(-args.clients // args.fan_in))
+    room_codes = await create_rooms(base_url, room_count)
+
+    results = {"join": [], "update": [], "disconnects": 0,
+               "errors": {"connect": 0, "joinTimeout": 0, "updateTimeout": 0}}
+    gold_values = itertools.count(10_000)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    peak_rss = rss_start or 0
+    done = asyncio.Event()
+
+    async def sample_memory():
+        nonlocal peak_rss
+        while not done.is_set():
+            peak_rss = max(peak_rss, rss_bytes(server_pid) or 0)
+            await asyncio.sleep(0.25)
+
+    async def one(i):
+        async with semaphore:
+            player = Player(base_url, room_codes[i % room_count], f"load-{i}", gold_values, args.timeout)
+            await player.run(args.updates, args.think_ms / 1000, results)
+
+    sampler = asyncio.create_task(sample_memory())
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await sampler
+
+    return {
+        "config": {
+            "clients": args.clients, "fanIn": args.fan_in, "rooms": room_count, "updatesPerClient": args.updates,
+            "thinkMs": args.think_ms, "concurrency": args.concurrency,
+        },
+        "durationSeconds": round(elapsed, 3),
+        "join": summarize(results["join"]),
+        "update": summarize(results["update"]),
+        "updatesPerSecond": round(len(results["update"]) / elapsed, 1),
+        "disconnects": results["disconnects"],
+        "errors": results["errors"],
+        "serverRssBytes": {"start": rss_start, "peak": peak_rss or None},
+    }
+
+
+def compare(current, baseline):
+    """Percent change of the headline numbers against a previous run"""
+    def delta(path):
+        a, b = baseline, current
+        for key in path:
+            a, b = a.get(key, {}), b.get(key, {})
+        if not isinstance(a, (int, float)) or not isinstance(b, (int, float)) or not a:
+            return None
+        return round((b - a) / a * 100, 1)
+
+    return {
+        "joinP50Pct": delta(["join", "p50Ms"]),
+        "joinP99Pct": delta(["join", "p99Ms"]),
+        "updateP50Pct": delta(["update", "p50Ms"]),
+        "updateP99Pct": delta(["update", "p99Ms"]),
+        "updatesPerSecondPct": delta(["updatesPerSecond"]),
+        "peakRssPct": delta(["serverRssBytes", "peak"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--fan-in", type=int, default=4, help="players per room")
+    parser.add_argument("--updates", type=int, default=10, help="updates per player")
+    parser.add_argument("--think-ms", type=float, default=50)
+    parser.add_argument("--concurrency", type=int, default=500, help="players active at once")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8199)
+    parser.add_argument("--output", help="write the JSON report here as well")
+    parser.add_argument("--compare", help="previous JSON report to diff against")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return 0
+
+    child = subprocess.Popen([sys.executable, __file__, "--serve", "--port", str(args.port)], cwd=BACKEND_DIR)
+    try:
+        report = asyncio.run(drive(args, child.pid))
+    finally:
+        child.terminate()
+        child.wait(timeout=10)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            report["comparedTo"] = {"file": args.compare, **compare(report, json.load(baseline))}
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as out:
+            out.write(output + "\n")
+    return 0 if not any(report["errors"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Stress check: many simultaneous joins against a room that is not resident
+
+Fires --joins concurrent joinBastion events at a cold room and checks that the
+single-flight loader read MongoDB exactly once and that every joiner ended up
+in the room's player list. Runs in process against a fake bastions collection
+(with simulated latency) and without real sockets, so it needs no MongoDB.
+tests/test_cold_join.py makes the same check part of the test suite. Run
+from the backend directory:
+
+    python benchmarks/stress_cold_join.py --joins 500
+"""
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Fake data must not end up in the room checkpoint a real start would warm from
+os.environ.setdefault("ROOM_CHECKPOINT_PATH", "")
+import server  # noqa: E402
+
+ROOM_CODE = "COLD01"
+
+
+class FakeBastions:
+    """Just enough of a motor collection for load_bastion"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.find_one_calls = 0
+
+    async def find_one(self, query):
+        self.find_one_calls += 1
+        await asyncio.sleep(self.latency)
+        if query.get("room_code") != ROOM_CODE:
+            return None
+        return {"room_code": ROOM_CODE, "bastion_data": server.BastionData().dict(), "revision": 0}
+
+
+class FakeDB:
+    def __init__(self, latency):
+        self.bastions = FakeBastions(latency)
+
+
+async def run(joins, latency):
+    server.db = FakeDB(latency)
+    errors = []
+
+    async def emit(event, data=None, room=None, **kwargs):
+        if event == "error":
+            errors.append(data)
+
+    async def noop(*args, **kwargs):
+        return None
+
+    server.sio.emit = emit
+    server.sio.enter_room = noop
+    server.sio.leave_room = noop
+
+    await asyncio.gather(*(
+        server.joinBastion(f"sid-{i}", {"roomCode": ROOM_CODE, "playerName": f"player-{i}"})
+        for i in range(joins)
+    ))
+
+    bastion_data, _ = await server.store.get_state(ROOM_CODE)
+    player_ids = {p["id"] for p in bastion_data["connectedPlayers"]}
+    session_ids = {server.sessions.lookup(f"sid-{i}")[1] for i in range(joins)}
+    return {
+        "joins": joins,
+        "dbReads": server.db.bastions.find_one_calls,
+        "players": len(bastion_data["connectedPlayers"]),
+        "playersMatchSessions": player_ids == session_ids,
+        "errors": len(errors),
+        "cache": await server.room_cache.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--joins", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated find_one latency in seconds")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.joins, args.latency))
+    print(result)
+
+    ok = (
+        result["dbReads"] == 1
+        and result["players"] == args.joins
+        and result["playersMatchSessions"]
+        and result["errors"] == 0
+    )
+    print("✅ single-flight load held" if ok else "❌ single-flight load violated")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
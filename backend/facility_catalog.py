@@ -0,0 +1,441 @@
+"""Bastion facility catalog (D&D 2024 rules)
+
+The static facility data the tracker works with, plus lookup indexes built
+once at import: special facilities by name, by the level that unlocks them
+and by prerequisite, and the cumulative list unlocked at each level tier.
+
+Catalog responses never change while the process runs, so the JSON body and
+ETag of every ``GET /api/facilities`` variant (full catalog and one per level
+tier) are rendered up front as well and served as-is.
+"""
+import hashlib
+import json
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+BASIC_FACILITIES = [
+    {"name": "Bedroom", "description": "A basic sleeping area"},
+    {"name": "Dining Room", "description": "An area for meals and gatherings"},
+    {"name": "Parlor", "description": "A comfortable social area"},
+    {"name": "Courtyard", "description": "An open area within the bastion"},
+    {"name": "Kitchen", "description": "Food preparation area"},
+    {"name": "Storage", "description": "Area for storing goods and supplies"},
+]
+
+SPECIAL_FACILITIES = [
+    # Level 5 facilities
+    {
+        "name": "Arcane Study",
+        "level": 5,
+        "prerequisite": "Ability to use an Arcane Focus or tool as a Spellcasting Focus",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Craft",
+        "description": "A place of quiet research with desks and bookshelves.",
+        "charm": "Arcane Study Charm: Cast Identify without spell slot once per week",
+        "craftOptions": ["Arcane Focus (7 days, free)", "Book (7 days, 10 GP)", "Magic Item - Arcana (level 9+)"],
+    },
+    {
+        "name": "Armory",
+        "level": 5,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Trade",
+        "description": "Contains mannequins, weapon racks, and armor storage.",
+        "tradeOptions": ["Stock Armory: 100 GP + 100 GP per Bastion Defender (50% off with Smithy)"],
+        "effect": "Stocked armory: Roll d8 instead of d6 for defender losses",
+    },
+    {
+        "name": "Barrack",
+        "level": 5,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Recruit",
+        "description": "Sleeping quarters for up to 12 Bastion Defenders.",
+        "recruitOptions": ["Recruit up to 4 Bastion Defenders (free, 7 days)"],
+        "enlargement": "Vast: 2,000 GP, houses 25 defenders",
+    },
+    {
+        "name": "Garden",
+        "level": 5,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Harvest",
+        "description": "Choose type: Decorative, Food, Herb, or Poison garden.",
+        "harvestOptions": {"Decorative": "10 bouquets (5 GP each), 10 perfumes, or 10 candles", "Food": "100 days of rations", "Herb": "10 Healer's Kits or 1 Potion of Healing", "Poison": "2 vials Antitoxin or 1 vial Basic Poison"},
+        "enlargement": "Vast: 2,000 GP, equivalent to 2 gardens",
+    },
+    {
+        "name": "Library",
+        "level": 5,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Research",
+        "description": "Collection of books with desks and reading chairs.",
+        "researchOptions": ["Topical Lore: Research any topic, gain 3 accurate pieces of info (7 days)"],
+    },
+    {
+        "name": "Sanctuary",
+        "level": 5,
+        "prerequisite": "Ability to use a Holy Symbol or Druidic Focus as a Spellcasting Focus",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Craft",
+        "description": "Icons of your religion with a quiet place for worship.",
+        "charm": "Sanctuary Charm: Cast Healing Word without spell slot once per week",
+        "craftOptions": ["Sacred Focus: Druidic Focus or Holy Symbol (7 days, free)"],
+    },
+    {
+        "name": "Smithy",
+        "level": 5,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 2,
+        "order": "Craft",
+        "description": "Contains forge, anvil, and smithing tools.",
+        "craftOptions": ["Smith's Tools crafting", "Magic Item - Armaments (level 9+)"],
+    },
+    {
+        "name": "Storehouse",
+        "level": 5,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Trade",
+        "description": "Cool, dark space for storing trade goods.",
+        "tradeOptions": ["Buy/sell goods: 500 GP limit (2,000 GP at lvl 9, 5,000 GP at lvl 13)"],
+        "profit": "Sell for +10% (+20% lvl 9, +50% lvl 13, +100% lvl 17)",
+    },
+    {
+        "name": "Workshop",
+        "level": 5,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 3,
+        "order": "Craft",
+        "description": "Creative space with 6 different Artisan's Tools.",
+        "craftOptions": ["Adventuring Gear with chosen tools", "Magic Item - Implements (level 9+)"],
+        "bonus": "Source of Inspiration: Gain Heroic Inspiration after short rest",
+        "enlargement": "Vast: 2,000 GP, +2 hirelings, +3 tools",
+    },
+    # Level 9 facilities
+    {
+        "name": "Gaming Hall",
+        "level": 9,
+        "prerequisite": "None",
+        "space": "Vast",
+        "hirelings": 4,
+        "order": "Trade",
+        "description": "Recreational activities like chess, cards, dice.",
+        "tradeOptions": ["Gambling Hall (7 days): Roll d100 for winnings 1d6×10 to 10d6×10 GP"],
+    },
+    {
+        "name": "Greenhouse",
+        "level": 9,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Harvest",
+        "description": "Controlled climate for rare plants and fungi.",
+        "bonus": "Fruit of Restoration: 3 fruits daily, each gives Lesser Restoration effect",
+        "harvestOptions": ["Potion of Healing (greater) (7 days)", "Poison: Assassin's Blood, Malice, Pale Tincture, or Truth Serum (7 days)"],
+    },
+    {
+        "name": "Laboratory",
+        "level": 9,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Craft",
+        "description": "Alchemical supplies and crafting workspaces.",
+        "craftOptions": ["Alchemist's Supplies crafting", "Poison: Burnt Othur Fumes, Essence of Ether, or Torpor (7 days, half cost)"],
+    },
+    {
+        "name": "Sacristy",
+        "level": 9,
+        "prerequisite": "Ability to use a Holy Symbol or Druidic Focus as a Spellcasting Focus",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Craft",
+        "description": "Preparation and storage for sacred items and vestments.",
+        "craftOptions": ["Holy Water (7 days, free, +100 GP for +1d8 damage up to 500 GP)", "Magic Item - Relics"],
+        "bonus": "Spell Refreshment: Regain 1 spell slot (level 5 or lower) after short rest",
+    },
+    {
+        "name": "Scriptorium",
+        "level": 9,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Craft",
+        "description": "Desks and writing supplies for document creation.",
+        "craftOptions": ["Book Replica (7 days, needs blank book)", "Spell Scroll (Cleric/Wizard spell level 3 or lower)", "Paperwork (50 copies, 7 days, 1 GP per copy)"],
+    },
+    {
+        "name": "Stable",
+        "level": 9,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Trade",
+        "description": "Houses 3 Large animals. Comes with 1 Riding Horse/Camel, 2 Ponies/Mules.",
+        "tradeOptions": ["Buy/sell mounts at standard cost (7 days)"],
+        "profit": "Sell for +20% (+50% lvl 13, +100% lvl 17)",
+        "bonus": "Animal Handling advantage after 14 days in facility",
+        "enlargement": "Vast: 2,000 GP, houses 6 Large animals",
+    },
+    {
+        "name": "Teleportation Circle",
+        "level": 9,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Recruit",
+        "description": "Permanent teleportation circle inscribed on floor.",
+        "recruitOptions": ["Spellcaster: Roll die, even = friendly NPC spellcaster arrives for 14 days"],
+        "spellcasting": "Cast Wizard spell level 4 or lower (level 8 or lower at level 17+)",
+    },
+    {
+        "name": "Theater",
+        "level": 9,
+        "prerequisite": "None",
+        "space": "Vast",
+        "hirelings": 4,
+        "order": "Empower",
+        "description": "Stage, backstage, and seating area for small audience.",
+        "empowerOptions": ["Theatrical Event: 14 days rehearsal + 7+ days performance"],
+        "bonus": "Theater die (d6, d8 at lvl 13, d10 at lvl 17) if performance succeeds",
+    },
+    {
+        "name": "Training Area",
+        "level": 9,
+        "prerequisite": "None",
+        "space": "Vast",
+        "hirelings": 4,
+        "order": "Empower",
+        "description": "Courtyard, gymnasium, or training gauntlet with expert trainer.",
+        "empowerOptions": ["Training (7 days, 8 hours daily): Battle, Skills, Tools, Unarmed Combat, or Weapon Expert"],
+        "trainers": "Choose trainer type: affects benefit gained from training",
+    },
+    {
+        "name": "Trophy Room",
+        "level": 9,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Research",
+        "description": "Collection of mementos, weapons, mounted heads, trinkets.",
+        "researchOptions": ["Lore: Research topic, gain 3 info pieces (7 days)", "Trinket Trophy: Roll die, even = find Common magic item (7 days)"],
+    },
+    # Level 13 facilities
+    {
+        "name": "Archive",
+        "level": 13,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Research",
+        "description": "Repository of valuable books, maps, scrolls behind locked door.",
+        "researchOptions": ["Helpful Lore: Hireling gains Legend Lore knowledge (7 days)"],
+        "referenceBook": "Choose 1: Arcana, History, Investigation, Nature, or Religion advantage",
+        "enlargement": "Vast: 2,000 GP, gain 2 additional reference books",
+    },
+    {
+        "name": "Meditation Chamber",
+        "level": 13,
+        "prerequisite": "None",
+        "space": "Cramped",
+        "hirelings": 1,
+        "order": "Empower",
+        "description": "Relaxing space for aligning mind, body, and spirit.",
+        "empowerOptions": ["Inner Peace: Roll twice for next Bastion event, choose result"],
+        "bonus": "Fortify Self: 7-day meditation grants advantage on 2 random saving throw types",
+    },
+    {
+        "name": "Menagerie",
+        "level": 13,
+        "prerequisite": "None",
+        "space": "Vast",
+        "hirelings": 2,
+        "order": "Recruit",
+        "description": "Enclosures for up to 4 Large creatures (or equivalent Small/Medium).",
+        "recruitOptions": ["Creature: Add beast from table (7 days, various costs)"],
+        "creatures": "Ape, Bears, Snakes, Crocodile, Dire Wolf, etc. (50-3,500 GP)",
+        "bonus": "Creatures count as Bastion Defenders",
+    },
+    {
+        "name": "Observatory",
+        "level": 13,
+        "prerequisite": "Ability to use a Spellcasting Focus",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Empower",
+        "description": "Telescope aimed at night sky atop bastion.",
+        "charm": "Observatory Charm: Cast Contact Other Plane without spell slot once per week",
+        "empowerOptions": ["Eldritch Discovery: 7 nights study, odd roll = gain Charm (Darkvision, Heroism, or Vitality)"],
+    },
+    {
+        "name": "Pub",
+        "level": 13,
+        "prerequisite": "None",
+        "space": "Roomy",
+        "hirelings": 1,
+        "order": "Research",
+        "description": "Bar, coffee shop, or tea room with spy network.",
+        "researchOptions": ["Information Gathering: Locate familiar creature within 50 miles (7 days)"],
+        "pubSpecial": "Choose magical beverage: Burden, Spider Kiss, Moonlight, Positive, or Sterner",
+        "enlargement": "Vast: 2,000 GP, 2 beverages, +3 server hirelings",
+    },
+    {
+        "name": "Reliquary",
+        "level": 13,
+        "prerequisite": "Ability to use a Holy Symbol or Druidic Focus as a Spellcasting Focus",
+        "space": "Cramped",
+        "hirelings": 1,
+        "order": "Harvest",
+        "description": "Vault holding sacred objects.",
+        "charm": "Reliquary Charm: Cast Greater Restoration without spell slot once per week",
+        "harvestOptions": ["Talisman: Replace spell components up to 1,000 GP value (7 days, reusable)"],
+    },
+    # Level 17 facilities
+    {
+        "name": "Demiplane",
+        "level": 17,
+        "prerequisite": "Ability to use an Arcane Focus or tool as a Spellcasting Focus",
+        "space": "Vast",
+        "hirelings": 1,
+        "order": "Empower",
+        "description": "Door leads to extradimensional stone room.",
+        "empowerOptions": ["Arcane Resilience: Magical runes give temp HP = 5×level after long rest (7 days)"],
+        "bonus": "Fabrication: Create 5 GP nonmagical object once per long rest",
+    },
+    {
+        "name": "Guildhall",
+        "level": 17,
+        "prerequisite": "Expertise in a skill",
+        "space": "Vast",
+        "hirelings": 1,
+        "order": "Recruit",
+        "description": "Meeting room for your guild (~50 members).",
+        "recruitOptions": ["Guild Assignment: Send members on special mission"],
+        "guilds": "Adventurers, Bakers, Brewers, Masons, Shipbuilders, or Thieves",
+    },
+    {
+        "name": "Sanctum",
+        "level": 17,
+        "prerequisite": "Ability to use a Holy Symbol or Druidic Focus as a Spellcasting Focus",
+        "space": "Roomy",
+        "hirelings": 4,
+        "order": "Empower",
+        "description": "Place of solace and healing.",
+        "charm": "Sanctum Charm: Cast Heal without spell slot once per week",
+        "empowerOptions": ["Fortifying Rites: Target gains temp HP = your level after long rests (7 days)"],
+        "bonus": "Sanctum Recall: Word of Recall always prepared, can target Sanctum",
+    },
+    {
+        "name": "War Room",
+        "level": 17,
+        "prerequisite": "Fighting Style feature or Unarmored Defense feature",
+        "space": "Vast",
+        "hirelings": "2+",
+        "order": "Recruit",
+        "description": "War planning with loyal Veteran lieutenants.",
+        "recruitOptions": ["Lieutenant: Add up to 10 total", "Soldiers: 100 Guards per lieutenant (or 20 mounted)"],
+        "bonus": "Lieutenants in bastion reduce attack dice by 1 each",
+    },
+]
+
+SPACE_LIMITS = {"Cramped": 4, "Roomy": 16, "Vast": 36}
+
+FACILITY_COSTS = {
+    "Cramped": {"cost": 500, "time": 20},
+    "Roomy": {"cost": 1000, "time": 45},
+    "Vast": {"cost": 3000, "time": 125},
+}
+
+# Levels at which new special facilities unlock, and the slots each allows
+FACILITY_LEVELS = (5, 9, 13, 17)
+SPECIAL_SLOTS = {5: 2, 9: 4, 13: 5, 17: 6}
+
+FACILITIES_BY_NAME: Dict[str, Dict[str, Any]] = {f["name"]: f for f in SPECIAL_FACILITIES}
+FACILITIES_BY_LEVEL: Dict[int, Tuple[Dict[str, Any], ...]] = {
+    level: tuple(f for f in SPECIAL_FACILITIES if f["level"] == level) for level in FACILITY_LEVELS
+}
+FACILITIES_BY_PREREQUISITE: Dict[str, Tuple[Dict[str, Any], ...]] = {
+    prerequisite: tuple(f for f in SPECIAL_FACILITIES if f["prerequisite"] == prerequisite)
+    for prerequisite in sorted({f["prerequisite"] for f in SPECIAL_FACILITIES})
+}
+# level tier -> every special facility unlocked at or below it, in catalog order
+UNLOCKED_BY_LEVEL: Dict[int, Tuple[Dict[str, Any], ...]] = {
+    level: tuple(f for f in SPECIAL_FACILITIES if f["level"] <= level) for level in FACILITY_LEVELS
+}
+
+
+def level_tier(level: int) -> int:
+    """The facility level tier a character level falls into (below 5 counts as 5)"""
+    return FACILITY_LEVELS[max(0, bisect_right(FACILITY_LEVELS, level) - 1)]
+
+
+MAX_CHARACTER_LEVEL = 20
+
+
+def _character_level(character: Any) -> Optional[int]:
+    """A party member's level clamped to 1-20, or None if it is not a number"""
+    if not isinstance(character, Mapping):
+        return None
+    try:
+        level = int(character.get("level") or 0)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return min(max(level, 1), MAX_CHARACTER_LEVEL)
+
+
+def party_level(party: Iterable[Mapping[str, Any]]) -> int:
+    """Highest character level in the party, at least 5; levels that are not numbers are skipped"""
+    levels = [level for level in map(_character_level, party) if level is not None]
+    return max(levels + [FACILITY_LEVELS[0]])
+
+
+def special_slots(level: int) -> int:
+    return SPECIAL_SLOTS[level_tier(level)]
+
+
+def available_special_facilities(party: Iterable[Mapping[str, Any]],
+                                 built: Iterable[Mapping[str, Any]]) -> List[Dict[str, Any]]:
+    """Special facilities the party's level unlocks that the bastion does not have yet"""
+    built_names = {facility.get("name") for facility in built if isinstance(facility, Mapping)}
+    return [f for f in UNLOCKED_BY_LEVEL[level_tier(party_level(party))] if f["name"] not in built_names]
+
+
+def _render(payload: Dict[str, Any]) -> Tuple[bytes, str]:
+    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode()
+    return body, '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+# level tier (None for the whole catalog) -> (JSON body, ETag)
+_RESPONSES: Dict[Optional[int], Tuple[bytes, str]] = {
+    None: _render({
+        "basicFacilities": BASIC_FACILITIES,
+        "specialFacilities": SPECIAL_FACILITIES,
+        "spaceLimits": SPACE_LIMITS,
+        "facilityCosts": FACILITY_COSTS,
+        "specialSlots": SPECIAL_SLOTS,
+    }),
+    **{
+        level: _render({
+            "level": level,
+            "specialSlots": SPECIAL_SLOTS[level],
+            "specialFacilities": list(UNLOCKED_BY_LEVEL[level]),
+        })
+        for level in FACILITY_LEVELS
+    },
+}
+
+
+def catalog_response(level: Optional[int] = None) -> Tuple[bytes, str]:
+    """Pre-rendered (body, etag) for the whole catalog or for what a level unlocks"""
+    return _RESPONSES[None if level is None else level_tier(level)]
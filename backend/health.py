@@ -0,0 +1,54 @@
+"""Liveness and readiness for process supervisors and load balancers
+
+Liveness only says the event loop is answering; it never looks at
+dependencies, so a slow database cannot get a healthy worker restarted.
+Readiness runs every registered check concurrently, each under the same
+timeout, and is what the entrypoint polls before putting a worker behind
+nginx. A worker that is shutting down reports itself unready first, so it is
+taken out of rotation before its connections are drained.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Raises (or times out) when the dependency is not usable
+Check = Callable[[], Awaitable[None]]
+
+
+class Readiness:
+    """Named readiness checks plus a draining flag"""
+
+    def __init__(self, timeout: float = 2.0):
+        self.timeout = timeout
+        self.draining = False
+        self._checks: Dict[str, Check] = {}
+
+    def check(self, name: str) -> Callable[[Check], Check]:
+        """Decorator registering a readiness check under name"""
+        def register(check: Check) -> Check:
+            self._checks[name] = check
+            return check
+        return register
+
+    async def _run(self, check: Check) -> str:
+        try:
+            await asyncio.wait_for(check(), self.timeout)
+        except asyncio.TimeoutError:
+            return f"timed out after {self.timeout}s"
+        except Exception as e:
+            return str(e) or type(e).__name__
+        return "ok"
+
+    async def probe(self) -> Tuple[bool, Dict[str, str]]:
+        """(ready, {check name: "ok" or what failed})"""
+        names = list(self._checks)
+        results = await asyncio.gather(*(self._run(self._checks[name]) for name in names))
+        checks = dict(zip(names, results))
+        if self.draining:
+            checks["draining"] = "shutting down"
+        ready = all(result == "ok" for result in checks.values())
+        if not ready:
+            logger.debug(f"Not ready: {checks}")
+        return ready, checks
@@ -0,0 +1,112 @@
+"""Prometheus metrics and sampled structured logging for the socket and REST layers
+
+Metrics are per worker process; with several workers, scrape each worker's
+``/metrics`` directly rather than through nginx.
+
+Hot-path events (connects, disconnects, bastion updates) are logged through
+structlog with a ``sample`` rate so that only a fraction of them reach the
+log handlers under load. Events without a sample rate are always logged.
+"""
+import random
+import time
+from contextlib import contextmanager
+
+import structlog
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import monitoring
+
+from serialization import JsonOnlyPacket
+
+SOCKET_HANDLER_SECONDS = Histogram(
+    "bastion_socket_handler_seconds",
+    "Socket event handling latency by phase",
+    ["event", "phase"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+SOCKET_EMITS = Counter("bastion_socket_emits_total", "Socket.IO events encoded for sending", ["event"])
+SOCKET_BYTES_OUT = Counter(
+    "bastion_socket_encoded_bytes_total",
+    "Bytes of encoded Socket.IO events (once per broadcast, before fan-out)",
+    ["event"],
+)
+LIVE_ROOMS = Gauge("bastion_live_rooms", "Rooms resident in the room store")
+LIVE_PLAYERS = Gauge("bastion_live_players", "Players seated in a room on this worker")
+LIVE_SOCKETS = Gauge("bastion_live_sockets", "Connected Socket.IO clients on this worker")
+UPDATES_DROPPED = Counter(
+    "bastion_updates_dropped_total",
+    "Client bastion updates dropped before being applied",
+    ["reason"],
+)
+SESSIONS_REAPED = Counter(
+    "bastion_sessions_reaped_total",
+    "Dead sockets and orphaned seats cleaned up by the session reaper",
+    ["reason"],
+)
+UPDATE_CONFLICTS = Counter(
+    "bastion_update_conflicts_total",
+    "Client bastion updates that raced another write: retried after a revision mismatch, or rejected",
+    ["outcome"],
+)
+MONGO_OPERATION_SECONDS = Histogram(
+    "bastion_mongo_operation_seconds",
+    "MongoDB command latency",
+    ["command", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+
+@contextmanager
+def observe_phase(event: str, phase: str):
+    """Time a block into SOCKET_HANDLER_SECONDS"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SOCKET_HANDLER_SECONDS.labels(event, phase).observe(time.perf_counter() - start)
+
+
+class InstrumentedPacket(JsonOnlyPacket):
+    """JsonOnlyPacket that counts outgoing events and their encoded size"""
+
+    def encode(self):
+        encoded = super().encode()
+        if self.packet_type == 2 and self.data:  # EVENT
+            event = self.data[0]
+            SOCKET_EMITS.labels(event).inc()
+            SOCKET_BYTES_OUT.labels(event).inc(len(encoded))
+        return encoded
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Feeds every MongoDB command's duration into MONGO_OPERATION_SECONDS"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_OPERATION_SECONDS.labels(event.command_name, "success").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_OPERATION_SECONDS.labels(event.command_name, "failure").observe(event.duration_micros / 1e6)
+
+
+def _sample(logger, method_name, event_dict):
+    rate = event_dict.pop("sample", None)
+    if rate is not None and random.random() >= rate:
+        raise structlog.DropEvent
+    return event_dict
+
+
+def configure_structlog() -> None:
+    """Route structlog events through the stdlib handlers configured by the app"""
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            _sample,
+            structlog.processors.format_exc_info,
+            structlog.processors.JSONRenderer(),
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
@@ -0,0 +1,186 @@
+"""Write-behind persistence for bastion updates
+
+Socket handlers mark the changed fields of a room as dirty instead of awaiting
+a Mongo write per event. A background task flushes every dirty room on a fixed
+interval (or sooner once enough rooms are dirty), coalescing all pending
+changes for a room into a single update of ``bastion_data.<field>`` paths and
+sending every room in one ``bulk_write``.
+
+The update is conditional per field rather than a blind ``$set``: each
+document keeps ``field_revisions`` next to ``bastion_data``, and a field is
+only overwritten when the revision being written is at least the stored one.
+A flush that lost a race with a newer write of the same field, from another
+worker or a retried batch, leaves that field alone instead of rolling it
+back. This uses an update pipeline and so needs MongoDB 4.2 or later.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from bastion_sync import MISSING
+
+logger = logging.getLogger(__name__)
+
+# (room_code, fields) -> (current field values, field revisions, revision), or None if the room is gone
+FieldReader = Callable[[str, Iterable[str]], Awaitable[Optional[Tuple[Dict[str, Any], Dict[str, int], int]]]]
+
+
+def conditional_update(fields: Dict[str, Any], field_revisions: Dict[str, int], revision: int) -> list:
+    """Update pipeline writing each field only if field_revisions is not behind the stored one
+
+    A field whose value is MISSING is removed.
+    """
+    stage = {}
+    for field, value in fields.items():
+        field_revision = field_revisions.get(field, revision)
+        stage[f"bastion_data.{field}"] = {"$cond": [
+            {"$gt": [f"$field_revisions.{field}", field_revision]},
+            f"$bastion_data.{field}",
+            "$$REMOVE" if value is MISSING else {"$literal": value},
+        ]}
+        stage[f"field_revisions.{field}"] = {"$max": [f"$field_revisions.{field}", field_revision]}
+    stage["revision"] = {"$max": ["$revision", revision]}
+    return [{"$set": stage}]
+
+
+class WriteBehindPersister:
+    """Coalescing write-behind buffer in front of the bastions collection"""
+
+    def __init__(self, collection, flush_interval: float = 1.0, max_dirty_rooms: int = 500,
+                 read_fields: Optional[FieldReader] = None):
+        self._collection = collection
+        # When set, dirty fields are re-read at flush time instead of using the marked values
+        self._read_fields = read_fields
+        self.flush_interval = flush_interval
+        self.max_dirty_rooms = max_dirty_rooms
+
+        # room_code -> {"fields": {field: value}, "revisions": {field: int}, "revision": int, "since": monotonic}
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+        self.flushes = 0
+        self.flush_errors = 0
+        self.rooms_written = 0
+        self.updates_coalesced = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+
+    def mark_dirty(self, room_code: str, changes: Dict[str, Any], revision: int) -> None:
+        """Queue changed top-level bastion_data fields for the next flush"""
+        entry = self._dirty.get(room_code)
+        if entry is None:
+            entry = self._dirty[room_code] = {"fields": {}, "revisions": {}, "revision": revision,
+                                              "since": time.monotonic()}
+        else:
+            self.updates_coalesced += 1
+        entry["fields"].update(changes)
+        revisions = entry["revisions"]
+        for field in changes:
+            revisions[field] = max(revisions.get(field, 0), revision)
+        entry["revision"] = max(entry["revision"], revision)
+
+        if len(self._dirty) >= self.max_dirty_rooms:
+            self._wakeup.set()
+
+    def is_dirty(self, room_code: str) -> bool:
+        return room_code in self._dirty
+
+    @property
+    def dirty_rooms(self) -> int:
+        return len(self._dirty)
+
+    async def flush(self) -> int:
+        """Write every dirty room in one bulk_write; returns the number of rooms written"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+
+            batch, self._dirty = self._dirty, {}
+            now = time.monotonic()
+            lag = now - min(entry["since"] for entry in batch.values())
+
+            try:
+                operations = []
+                for room_code, entry in batch.items():
+                    fields, revisions, revision = entry["fields"], entry["revisions"], entry["revision"]
+                    if self._read_fields is not None:
+                        current = await self._read_fields(room_code, list(fields))
+                        if current is not None:
+                            values, stored, revision = current
+                            # A dirty field the store no longer has was removed
+                            fields = {f: values.get(f, MISSING) for f in fields}
+                            # A room reloaded from MongoDB starts its fields at revision 0
+                            revisions = {f: max(stored.get(f, 0), revisions.get(f, 0)) for f in fields}
+                    operations.append(UpdateOne(
+                        {"room_code": room_code},
+                        conditional_update(fields, revisions, revision),
+                    ))
+                await self._collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                self.flush_errors += 1
+                logger.error(f"Write-behind flush of {len(batch)} rooms failed: {e}")
+                self._requeue(batch)
+                return 0
+
+            self.flushes += 1
+            self.rooms_written += len(batch)
+            self.last_batch_size = len(batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            self.last_flush_lag = lag
+            self.max_flush_lag = max(self.max_flush_lag, lag)
+            return len(batch)
+
+    def _requeue(self, batch: Dict[str, Dict[str, Any]]) -> None:
+        """Put a failed batch back without clobbering newer changes queued meanwhile"""
+        for room_code, entry in batch.items():
+            newer = self._dirty.get(room_code)
+            if newer is not None:
+                entry["fields"].update(newer["fields"])
+                for field, revision in newer["revisions"].items():
+                    entry["revisions"][field] = max(entry["revisions"].get(field, 0), revision)
+                entry["revision"] = max(entry["revision"], newer["revision"])
+            self._dirty[room_code] = entry
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write out everything still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "dirtyRooms": len(self._dirty),
+            "flushes": self.flushes,
+            "flushErrors": self.flush_errors,
+            "roomsWritten": self.rooms_written,
+            "updatesCoalesced": self.updates_coalesced,
+            "lastBatchSize": self.last_batch_size,
+            "maxBatchSize": self.max_batch_size,
+            "lastFlushLagSeconds": round(self.last_flush_lag, 4),
+            "maxFlushLagSeconds": round(self.max_flush_lag, 4),
+        }
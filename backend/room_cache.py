@@ -0,0 +1,203 @@
+"""Bounded residency for rooms in the room store
+
+Rooms are faulted into the store from MongoDB on first use and, once empty,
+evicted again when they are the least recently used beyond ``capacity`` or
+have been idle for ``idle_ttl`` seconds. Before anything is evicted pending
+write-behind changes are flushed, and a room is only dropped if its players,
+pending writes and queued updates are all gone, so eviction never loses an
+update. Reloading an evicted room is transparent to callers of ``ensure``.
+
+Loads are single-flight: concurrent misses for the same room code share one
+in-flight MongoDB read instead of each issuing their own. ``ensure_many``
+resolves all of its misses with one batch read when a batch loader is given.
+
+A caller that reads rooms after making them resident holds them with
+``pinned``; the sweeper skips pinned rooms, so a room cannot be evicted
+between being loaded and being read.
+"""
+import asyncio
+import contextlib
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# room_code -> (bastion_data, revision) from MongoDB, or None if there is no such bastion
+RoomLoader = Callable[[str], Awaitable[Optional[Tuple[Dict[str, Any], int]]]]
+# room_codes -> {room_code: (bastion_data, revision)} for those that exist
+BatchRoomLoader = Callable[[List[str]], Awaitable[Dict[str, Tuple[Dict[str, Any], int]]]]
+
+
+class RoomCache:
+    """Load-on-miss and LRU/TTL eviction in front of a room store"""
+
+    def __init__(self, store, loader: RoomLoader, capacity: int = 10000, idle_ttl: float = 900.0,
+                 sweep_interval: float = 30.0,
+                 flush: Optional[Callable[[], Awaitable[Any]]] = None,
+                 can_evict: Optional[Callable[[str], bool]] = None,
+                 batch_loader: Optional[BatchRoomLoader] = None):
+        self._store = store
+        self._loader = loader
+        self._batch_loader = batch_loader
+        self.capacity = capacity
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._flush = flush
+        self._can_evict = can_evict
+        self._task: Optional[asyncio.Task] = None
+        # room_code -> in-flight load shared by every concurrent miss
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # room_code -> number of callers holding it resident
+        self._pins: Dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.coalesced_loads = 0
+        self.evictions = 0
+
+    async def ensure(self, room_code: str) -> bool:
+        """Make sure room_code is resident, loading it from MongoDB on a miss"""
+        if await self._store.exists(room_code):
+            self.hits += 1
+            return True
+        self.misses += 1
+
+        pending = self._inflight.get(room_code)
+        if pending is None:
+            pending = self._share(room_code, self._load(room_code))
+        else:
+            self.coalesced_loads += 1
+        # A cancelled waiter must not cancel the load the others are sharing
+        return await asyncio.shield(pending)
+
+    async def ensure_many(self, room_codes: Iterable[str]) -> Set[str]:
+        """Make many rooms resident at once; return the codes that exist
+
+        Misses already being loaded join those loads, and the rest are read
+        with a single batch load.
+        """
+        room_codes = list(dict.fromkeys(room_codes))
+        exists = await asyncio.gather(*(self._store.exists(room_code) for room_code in room_codes))
+        resident = {room_code for room_code, found in zip(room_codes, exists) if found}
+        missing = [room_code for room_code in room_codes if room_code not in resident]
+        self.hits += len(resident)
+        self.misses += len(missing)
+        if not missing:
+            return resident
+
+        pending = {room_code: self._inflight[room_code] for room_code in missing if room_code in self._inflight}
+        self.coalesced_loads += len(pending)
+        fresh = [room_code for room_code in missing if room_code not in pending]
+        if fresh and self._batch_loader is not None:
+            batch = asyncio.ensure_future(self._load_many(fresh))
+            for room_code in fresh:
+                pending[room_code] = self._share(room_code, self._loaded_by(batch, room_code))
+        else:
+            for room_code in fresh:
+                pending[room_code] = self._share(room_code, self._load(room_code))
+
+        loaded = await asyncio.shield(asyncio.gather(*pending.values()))
+        resident.update(room_code for room_code, found in zip(pending, loaded) if found)
+        return resident
+
+    @contextlib.asynccontextmanager
+    async def pinned(self, room_codes: Iterable[str]) -> AsyncIterator[Set[str]]:
+        """``ensure_many`` the rooms and keep them from being evicted until the block exits"""
+        room_codes = list(dict.fromkeys(room_codes))
+        # Pinned before loading, so a sweep during the load cannot drop them either
+        for room_code in room_codes:
+            self._pins[room_code] = self._pins.get(room_code, 0) + 1
+        try:
+            yield await self.ensure_many(room_codes)
+        finally:
+            for room_code in room_codes:
+                if self._pins[room_code] == 1:
+                    del self._pins[room_code]
+                else:
+                    self._pins[room_code] -= 1
+
+    def _share(self, room_code: str, load: Awaitable[bool]) -> asyncio.Future:
+        """Register load as the in-flight load of room_code until it finishes"""
+        pending = self._inflight[room_code] = asyncio.ensure_future(load)
+        pending.add_done_callback(lambda _: self._inflight.pop(room_code, None))
+        return pending
+
+    async def _load(self, room_code: str) -> bool:
+        loaded = await self._loader(room_code)
+        if loaded is None:
+            return False
+        bastion_data, revision = loaded
+        await self._store.seed(room_code, bastion_data, revision)
+        self.loads += 1
+        return True
+
+    async def _load_many(self, room_codes: List[str]) -> Set[str]:
+        loaded = await self._batch_loader(room_codes)
+        for room_code, (bastion_data, revision) in loaded.items():
+            await self._store.seed(room_code, bastion_data, revision)
+        self.loads += len(loaded)
+        return set(loaded)
+
+    @staticmethod
+    async def _loaded_by(batch: asyncio.Future, room_code: str) -> bool:
+        return room_code in await batch
+
+    async def sweep(self) -> int:
+        """Flush and evict empty rooms over capacity or past the idle TTL"""
+        candidates = await self._store.eviction_candidates(self.capacity, self.idle_ttl)
+        if not candidates:
+            return 0
+
+        # Write out pending changes first so nothing unpersisted is dropped
+        if self._flush is not None:
+            await self._flush()
+
+        evicted = 0
+        for room_code in candidates:
+            if room_code in self._pins:
+                continue
+            if self._can_evict is not None and not self._can_evict(room_code):
+                continue
+            if await self._store.evict(room_code):
+                evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                evicted = await self.sweep()
+                if evicted:
+                    logger.info(f"Evicted {evicted} idle rooms")
+            except Exception as e:
+                logger.error(f"Room cache sweep failed: {e}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "residentRooms": await self._store.size(),
+            "residentBytes": await self._store.resident_bytes(),
+            "capacity": self.capacity,
+            "idleTtlSeconds": self.idle_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else None,
+            "loads": self.loads,
+            "coalescedLoads": self.coalesced_loads,
+            "evictions": self.evictions,
+        }
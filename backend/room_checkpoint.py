@@ -0,0 +1,300 @@
+"""On-disk checkpoint of resident rooms for warm restarts
+
+After a restart the room store is empty, and every active table would fault
+back in through its own MongoDB read the moment its players reconnect. To
+avoid that read spike, the worker periodically writes every resident room to
+a checkpoint file, and once more on shutdown after the final write-behind
+flush. The next process maps that file and serves rooms from it as they are
+first used.
+
+File layout (little-endian), written to a temporary file and renamed into
+place so readers never see a partial checkpoint:
+
+    b"BSTCKPT1"
+    records: <u32 length><bastion_data JSON>, one per room
+    index:   JSON {room_code: [record offset, length, revision]}
+    trailer: <u64 index offset><u64 index length>b"BSTCKPT1"
+
+Only the index is parsed on startup. A record is decoded from the mapping
+when its room is first loaded, and then it is dropped from the index.
+
+Before anything is served, the checkpoint is reconciled with MongoDB in a
+single projected query for the revisions of every checkpointed room:
+
+* rooms that no longer exist, or whose stored revision is newer, are dropped
+  and load from MongoDB as usual;
+* rooms whose checkpoint is newer than MongoDB (writes still buffered when
+  the previous process died) are served from the checkpoint. ``take``
+  reports the persisted revision so the caller can queue the state for
+  writing again.
+
+Rooms not yet reclaimed when the next checkpoint is written are carried
+over, so a room that stays away across several restarts remains warm.
+"""
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"BSTCKPT1"
+_LENGTH = struct.Struct("<I")
+_TRAILER = struct.Struct("<QQ8s")
+
+# (room_code, bastion_data, revision) for every resident room
+RoomDump = Callable[[], Awaitable[List[Tuple[str, Dict[str, Any], int]]]]
+# (bastion_data, checkpointed revision, revision stored in MongoDB)
+WarmRoom = Tuple[Dict[str, Any], int, int]
+
+
+def _dumps(value: Any) -> bytes:
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS, default=str)
+
+
+def write_checkpoint(path: str, rooms: Iterable[Tuple[str, Dict[str, Any], int]],
+                     carried: Iterable[Tuple[str, bytes, int]] = ()) -> Tuple[int, int]:
+    """Write rooms, plus already-encoded carried records, to path; return (rooms, bytes)"""
+    index: Dict[str, List[int]] = {}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        offset = len(MAGIC)
+
+        def append(room_code: str, record: bytes, revision: int) -> None:
+            nonlocal offset
+            f.write(_LENGTH.pack(len(record)))
+            f.write(record)
+            index[room_code] = [offset + _LENGTH.size, len(record), revision]
+            offset += _LENGTH.size + len(record)
+
+        for room_code, bastion_data, revision in rooms:
+            append(room_code, _dumps(bastion_data), revision)
+        for room_code, record, revision in carried:
+            if room_code not in index:
+                append(room_code, record, revision)
+
+        encoded_index = _dumps(index)
+        f.write(encoded_index)
+        f.write(_TRAILER.pack(offset, len(encoded_index), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(tmp_path, path)
+    return len(index), size
+
+
+class CheckpointFile:
+    """Read-only mapping of a checkpoint and its index"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._map) < len(MAGIC) + _TRAILER.size or self._map[:len(MAGIC)] != MAGIC:
+                raise ValueError("not a room checkpoint")
+            index_offset, index_length, magic = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+            if magic != MAGIC or index_offset + index_length + _TRAILER.size != len(self._map):
+                raise ValueError("truncated room checkpoint")
+            # room_code -> [offset, length, revision]
+            self.index: Dict[str, List[int]] = orjson.loads(self._map[index_offset:index_offset + index_length])
+        except Exception:
+            self._map.close()
+            raise
+
+    def record(self, room_code: str) -> bytes:
+        offset, length, _ = self.index[room_code]
+        (stored,) = _LENGTH.unpack_from(self._map, offset - _LENGTH.size)
+        if stored != length:
+            raise ValueError(f"corrupt checkpoint record for {room_code}")
+        return self._map[offset:offset + length]
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class RoomCheckpoint:
+    """Periodic checkpoints of resident rooms, and warm loads from the last one
+
+    With no path every method is a no-op and ``take`` never has a room, so
+    callers need not special-case a disabled checkpoint.
+    """
+
+    def __init__(self, path: Optional[str], dump_rooms: RoomDump, interval: float = 60.0):
+        self.path = path
+        self._dump_rooms = dump_rooms
+        self.interval = interval
+        self._file: Optional[CheckpointFile] = None
+        # room_code -> revision stored in MongoDB, for the rooms that survived reconciliation
+        self._persisted: Dict[str, int] = {}
+        self._reconciled = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.opened_rooms = 0
+        self.stale_rooms = 0
+        self.warm_loads = 0
+        self.recovered_rooms = 0
+        self.checkpoints = 0
+        self.checkpoint_errors = 0
+        self.last_checkpoint_rooms = 0
+        self.last_checkpoint_bytes = 0
+        self.last_checkpoint_seconds = 0.0
+
+    def open(self) -> int:
+        """Map the checkpoint left by the previous process; return the number of rooms in it"""
+        if self.path and os.path.exists(self.path):
+            try:
+                self._file = CheckpointFile(self.path)
+                self.opened_rooms = len(self._file.index)
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable room checkpoint {self.path}: {e}")
+        self._release_if_done()
+        if self._file is None:
+            self._reconciled.set()
+        return self.opened_rooms
+
+    async def reconcile(self, collection) -> None:
+        """Keep only the rooms whose checkpoint is at least as new as MongoDB, in one query"""
+        if self._file is None:
+            self._reconciled.set()
+            return
+        index = self._file.index
+        stored: Dict[str, int] = {}
+        cursor = collection.find({"room_code": {"$in": list(index)}}, {"_id": 0, "room_code": 1, "revision": 1})
+        async for doc in cursor:
+            stored[doc["room_code"]] = doc.get("revision", 0)
+        for room_code, (_, _, revision) in list(index.items()):
+            if room_code in stored and stored[room_code] <= revision:
+                self._persisted[room_code] = stored[room_code]
+            else:
+                del index[room_code]
+                self.stale_rooms += 1
+        logger.info(f"Room checkpoint: {len(index)} warm rooms, {self.stale_rooms} stale")
+        self._release_if_done()
+        self._reconciled.set()
+
+    def discard(self) -> None:
+        """Give up on the checkpoint; every room loads from MongoDB"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._persisted.clear()
+        self._reconciled.set()
+
+    @property
+    def reconciled(self) -> bool:
+        """False only while a mapped checkpoint is waiting for ``reconcile``"""
+        return self._file is None or self._reconciled.is_set()
+
+    async def take(self, room_code: str) -> Optional[WarmRoom]:
+        """Claim a room from the checkpoint, or None if it has to come from MongoDB"""
+        return (await self.take_many([room_code])).get(room_code)
+
+    async def take_many(self, room_codes: Iterable[str]) -> Dict[str, WarmRoom]:
+        """Claim the given rooms that the checkpoint has; each room is handed out once"""
+        warm: Dict[str, WarmRoom] = {}
+        # Never opened, nothing to open, or fully claimed: there is nothing to wait for
+        if self._file is None:
+            return warm
+        await self._reconciled.wait()
+        if self._file is None:
+            return warm
+        for room_code in room_codes:
+            entry = self._file.index.get(room_code)
+            if entry is None:
+                continue
+            try:
+                bastion_data = orjson.loads(self._file.record(room_code))
+            except Exception as e:
+                logger.warning(f"Loading {room_code} from MongoDB instead of the checkpoint: {e}")
+                bastion_data = None
+            del self._file.index[room_code]
+            persisted = self._persisted.pop(room_code)
+            if bastion_data is None:
+                continue
+            warm[room_code] = bastion_data, entry[2], persisted
+            self.warm_loads += 1
+            if entry[2] > persisted:
+                self.recovered_rooms += 1
+        self._release_if_done()
+        return warm
+
+    def _release_if_done(self) -> None:
+        if self._file is not None and not self._file.index:
+            self._file.close()
+            self._file = None
+
+    def _unclaimed(self, resident: Iterable[str]) -> List[Tuple[str, bytes, int]]:
+        """Raw records still unclaimed, for carrying over into the next checkpoint"""
+        if self._file is None:
+            return []
+        resident = set(resident)
+        carried = []
+        for room_code, (_, _, revision) in self._file.index.items():
+            if room_code not in resident:
+                carried.append((room_code, self._file.record(room_code), revision))
+        return carried
+
+    async def write(self) -> int:
+        """Checkpoint every resident room now; return the number of rooms written"""
+        if not self.path:
+            return 0
+        async with self._write_lock:
+            started = time.monotonic()
+            rooms = await self._dump_rooms()
+            carried = self._unclaimed(room_code for room_code, _, _ in rooms) if self.reconciled else []
+            try:
+                # Encoding and fsync run off the event loop; the dumped dicts are not touched again here
+                count, size = await asyncio.to_thread(write_checkpoint, self.path, rooms, carried)
+            except Exception as e:
+                self.checkpoint_errors += 1
+                logger.error(f"Room checkpoint to {self.path} failed: {e}")
+                return 0
+            self.checkpoints += 1
+            self.last_checkpoint_rooms = count
+            self.last_checkpoint_bytes = size
+            self.last_checkpoint_seconds = time.monotonic() - started
+            return count
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.write()
+
+    def start(self) -> None:
+        if self.path and self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the periodic checkpoints and write a final one"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.write()
+        self.discard()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": bool(self.path),
+            "reconciled": self.reconciled,
+            "openedRooms": self.opened_rooms,
+            "warmRooms": len(self._file.index) if self._file is not None else 0,
+            "staleRooms": self.stale_rooms,
+            "warmLoads": self.warm_loads,
+            "recoveredRooms": self.recovered_rooms,
+            "checkpoints": self.checkpoints,
+            "checkpointErrors": self.checkpoint_errors,
+            "lastCheckpointRooms": self.last_checkpoint_rooms,
+            "lastCheckpointBytes": self.last_checkpoint_bytes,
+            "lastCheckpointSeconds": round(self.last_checkpoint_seconds, 4),
+        }
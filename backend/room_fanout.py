@@ -0,0 +1,156 @@
+"""Coalesced fan-out for crowded rooms
+
+Players in a room get every ``bastionPatch`` as soon as it is applied.
+Spectators, the read-only audience of a streamed game, sit in a separate
+Socket.IO room (``spectators:<code>``) and get at most ``frame_rate`` frames a
+second: everything applied between two frames is merged into one
+``bastionPatch`` whose ``base`` is the revision the previous frame ended at.
+
+Membership changes are debounced per room for ``membership_delay`` seconds.
+Players get one ``playersChanged {joined, left}`` and one
+``connectedPlayersUpdate`` per window instead of one of each per join or
+leave; spectators never see the roster, only ``memberCount {players,
+spectators}``. A storm of n joins thus costs a few messages per member per
+window rather than n roster lists to each of n members.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bastion_sync import patch_payload
+
+logger = logging.getLogger(__name__)
+
+# sio.emit(event, data, room=...)
+Emitter = Callable[..., Awaitable[None]]
+
+
+def spectator_room(room_code: str) -> str:
+    return f"spectators:{room_code}"
+
+
+class _Frame:
+    __slots__ = ("base", "revision", "changes")
+
+    def __init__(self, base: int):
+        self.base = base
+        self.revision = base
+        self.changes: Dict[str, Any] = {}
+
+
+class _Membership:
+    __slots__ = ("joined", "left", "players")
+
+    def __init__(self):
+        self.joined: List[Dict[str, str]] = []
+        self.left: List[Dict[str, str]] = []
+        self.players: Optional[List[Dict[str, str]]] = None
+
+
+class RoomFanout:
+    """Throttled spectator frames and debounced membership notices, per room"""
+
+    def __init__(self, emit: Emitter, frame_rate: float = 4.0, membership_delay: float = 0.25):
+        self._emit = emit
+        self.frame_interval = 1.0 / frame_rate if frame_rate > 0 else 0.0
+        self.membership_delay = membership_delay
+        self._frames: Dict[str, _Frame] = {}
+        self._last_frame: Dict[str, float] = {}
+        self._membership: Dict[str, _Membership] = {}
+        # room_code -> [players, spectators] as last reported by the store
+        self._counts: Dict[str, List[int]] = {}
+
+        self.frames_sent = 0
+        self.patches_coalesced = 0
+        self.membership_notices = 0
+
+    def publish(self, room_code: str, revision: int, changes: Dict[str, Any]) -> None:
+        """Fold an applied patch into the room's next spectator frame"""
+        frame = self._frames.get(room_code)
+        if frame is None:
+            frame = self._frames[room_code] = _Frame(revision - 1)
+            due = self._last_frame.get(room_code, 0.0) + self.frame_interval
+            asyncio.get_running_loop().call_later(max(0.0, due - time.monotonic()), self._send_frame, room_code)
+        else:
+            self.patches_coalesced += 1
+        frame.revision = revision
+        frame.changes.update(changes)
+
+    def _send_frame(self, room_code: str) -> None:
+        frame = self._frames.pop(room_code, None)
+        if frame is None:
+            return
+        sent_at = self._last_frame[room_code] = time.monotonic()
+        # The timestamp only matters for one interval; drop it after that unless a newer frame replaced it
+        asyncio.get_running_loop().call_later(self.frame_interval, self._forget_frame_time, room_code, sent_at)
+        self.frames_sent += 1
+        self._spawn(self._emit(
+            'bastionPatch', patch_payload(frame.revision, frame.changes, base=frame.base),
+            room=spectator_room(room_code),
+        ))
+
+    def _forget_frame_time(self, room_code: str, sent_at: float) -> None:
+        if self._last_frame.get(room_code) == sent_at:
+            del self._last_frame[room_code]
+
+    def members_changed(self, room_code: str, players: Optional[List[Dict[str, str]]] = None,
+                        spectators: Optional[int] = None, joined: Optional[Dict[str, str]] = None,
+                        left: Optional[Dict[str, str]] = None, player_count: Optional[int] = None) -> None:
+        """Record a join or leave; the room hears about it once the debounce window closes
+
+        ``players`` is the new roster after a player joined or left; a
+        spectator join or leave passes only the counts.
+        """
+        counts = self._counts.setdefault(room_code, [0, 0])
+        if players is not None:
+            counts[0] = len(players)
+        elif player_count is not None:
+            counts[0] = player_count
+        if spectators is not None:
+            counts[1] = spectators
+
+        membership = self._membership.get(room_code)
+        if membership is None:
+            membership = self._membership[room_code] = _Membership()
+            asyncio.get_running_loop().call_later(self.membership_delay, self._send_membership, room_code)
+        if players is not None:
+            membership.players = players
+        if joined is not None:
+            membership.joined.append(joined)
+        if left is not None:
+            membership.left.append(left)
+
+    def _send_membership(self, room_code: str) -> None:
+        membership = self._membership.pop(room_code, None)
+        if membership is None:
+            return
+        players, spectators = self._counts.get(room_code, (0, 0))
+        if not players and not spectators:
+            self._counts.pop(room_code, None)
+        self.membership_notices += 1
+        if membership.joined or membership.left:
+            self._spawn(self._emit('playersChanged', {"joined": membership.joined, "left": membership.left},
+                                   room=room_code))
+        if membership.players is not None:
+            self._spawn(self._emit('connectedPlayersUpdate', membership.players, room=room_code))
+        self._spawn(self._emit('memberCount', {"players": players, "spectators": spectators},
+                               room=spectator_room(room_code)))
+
+    @staticmethod
+    def _spawn(emit: Awaitable[None]) -> None:
+        task = asyncio.ensure_future(emit)
+        task.add_done_callback(_log_failure)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pendingFrames": len(self._frames),
+            "framesSent": self.frames_sent,
+            "patchesCoalesced": self.patches_coalesced,
+            "membershipNotices": self.membership_notices,
+        }
+
+
+def _log_failure(task: asyncio.Future) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Fan-out emit failed: {task.exception()}")
@@ -0,0 +1,127 @@
+"""Per-room mailboxes that serialize bastion mutations
+
+Every ``updateBastion`` and turn advance for a room is queued on that room's
+mailbox and applied by a single consumer task, so updates from different
+players can never interleave across an ``await``. Whatever has queued up while the consumer was
+busy is handed over as one batch, letting a burst of edits collapse into a
+single apply, broadcast and persist.
+
+A caller that needs the outcome of its own item (a REST undo or turn
+advance) waits for that item alone with ``submit_and_wait``. Unlike
+``join``, it returns once the item's batch has been handled, however busy
+the room stays.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (sid, update) pairs in arrival order; an update is a field dict or a queued turn
+Batch = List[Tuple[Optional[str], Any]]
+BatchHandler = Callable[[str, Batch], Awaitable[None]]
+
+
+class RoomMailbox:
+    """FIFO of pending updates for one room, drained by one task"""
+
+    def __init__(self, room_code: str, handler: BatchHandler, batch_window: float = 0.0):
+        self.room_code = room_code
+        self._handler = handler
+        self._batch_window = batch_window
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = None
+        # id(update) -> future resolved once the batch holding that update has been handled
+        self._waiters: Dict[int, asyncio.Future] = {}
+
+    def submit(self, sid: Optional[str], update: Any) -> None:
+        self._queue.put_nowait((sid, update))
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit_and_wait(self, sid: Optional[str], update: Any) -> None:
+        """Queue an update and wait until it has been applied (or its batch failed)"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[id(update)] = waiter
+        self.submit(sid, update)
+        try:
+            await waiter
+        finally:
+            self._waiters.pop(id(update), None)
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def idle(self) -> bool:
+        return self._task is None and self._queue.empty()
+
+    async def _run(self) -> None:
+        while not self._queue.empty():
+            batch = [self._queue.get_nowait()]
+            if self._batch_window:
+                await asyncio.sleep(self._batch_window)
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._handler(self.room_code, batch)
+            except Exception as e:
+                logger.error(f"Error applying {len(batch)} updates to bastion {self.room_code}: {e}")
+            if self._waiters:
+                for _, update in batch:
+                    waiter = self._waiters.pop(id(update), None)
+                    if waiter is not None and not waiter.done():
+                        waiter.set_result(None)
+        # Idle: let the next submit start a fresh consumer
+        self._task = None
+
+    async def join(self) -> None:
+        """Wait until everything queued so far has been applied"""
+        while self._task is not None:
+            await asyncio.shield(self._task)
+
+
+class RoomMailboxes:
+    """Lazily created mailbox per room code"""
+
+    def __init__(self, handler: BatchHandler, batch_window: float = 0.0):
+        self._handler = handler
+        self._batch_window = batch_window
+        self._mailboxes: Dict[str, RoomMailbox] = {}
+
+    def _mailbox(self, room_code: str) -> RoomMailbox:
+        mailbox = self._mailboxes.get(room_code)
+        if mailbox is None:
+            mailbox = self._mailboxes[room_code] = RoomMailbox(room_code, self._handler, self._batch_window)
+        return mailbox
+
+    def submit(self, room_code: str, sid: Optional[str], update: Any) -> None:
+        self._mailbox(room_code).submit(sid, update)
+
+    async def submit_and_wait(self, room_code: str, sid: Optional[str], update: Any) -> None:
+        """Queue an update for a room and wait until it has been applied"""
+        await self._mailbox(room_code).submit_and_wait(sid, update)
+
+    def discard(self, room_code: str) -> None:
+        """Forget an idle room's mailbox"""
+        mailbox = self._mailboxes.get(room_code)
+        if mailbox is not None and mailbox.idle:
+            del self._mailboxes[room_code]
+
+    def is_idle(self, room_code: str) -> bool:
+        mailbox = self._mailboxes.get(room_code)
+        return mailbox is None or mailbox.idle
+
+    async def join(self, room_code: str) -> None:
+        """Wait for one room's pending updates to be applied"""
+        mailbox = self._mailboxes.get(room_code)
+        if mailbox is not None:
+            await mailbox.join()
+
+    async def drain(self) -> None:
+        """Wait for every room's pending updates to be applied"""
+        for mailbox in list(self._mailboxes.values()):
+            await mailbox.join()
+
+    def __len__(self) -> int:
+        return len(self._mailboxes)
@@ -0,0 +1,226 @@
+"""Compact resident state for rooms held by ``LocalRoomStore``
+
+Idle rooms vastly outnumber active ones, so a room's resident form is kept
+small and only expanded back into plain bastion_data dicts when it is read:
+
+* ``RoomState`` and ``Player`` use ``__slots__`` instead of per-room dicts.
+* Facilities become ``Facility`` objects. A special facility whose catalog
+  fields (description, options, prerequisite...) still match the catalog
+  keeps a reference to the shared catalog entry instead of its own copies,
+  and field names, facility names and hireling races/roles are interned.
+* The connectedPlayers projection is built once and reused until the
+  membership changes.
+* Per-field versions keep the compact value a field held before its last
+  change, which is just the object that change replaced.
+
+Expanded values share catalog objects with every other room, so callers must
+treat what they read as read-only.
+"""
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bastion_sync import MISSING, FieldVersion
+from facility_catalog import FACILITIES_BY_NAME
+
+FACILITY_FIELDS = frozenset({"basicFacilities", "specialFacilities"})
+
+# Facility keys stored on the object itself rather than taken from the catalog
+_OWN_FIELDS = ("id", "name", "space", "hirelings")
+_INTERNED_HIRELING_FIELDS = frozenset({"race", "role"})
+
+
+def _sizeof(value: Any) -> int:
+    """Approximate resident size of a JSON-like value, not counting dict keys (interned)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_sizeof(v) for v in value.values())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_sizeof(v) for v in value)
+    elif isinstance(value, Facility):
+        size = value.sizeof()
+    return size
+
+
+def _compact_hireling(hireling: Any) -> Any:
+    if not isinstance(hireling, dict):
+        return hireling
+    return {
+        sys.intern(key): sys.intern(value) if key in _INTERNED_HIRELING_FIELDS and type(value) is str else value
+        for key, value in hireling.items()
+    }
+
+
+class Player:
+    __slots__ = ("id", "name")
+
+    def __init__(self, id: str, name: str):
+        self.id = id
+        self.name = name
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"id": self.id, "name": self.name}
+
+
+class Facility:
+    """A built facility, storing only what differs from its catalog entry"""
+    __slots__ = ("id", "name", "space", "hirelings", "catalog", "extra")
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Facility":
+        facility = cls()
+        name = data.get("name", MISSING)
+        catalog = FACILITIES_BY_NAME.get(name) if type(name) is str else None
+        # Only lean on the catalog if every catalog field is present and unchanged
+        if catalog is not None and any(
+            data.get(key, MISSING) != value for key, value in catalog.items() if key not in _OWN_FIELDS
+        ):
+            catalog = None
+        if type(name) is str:
+            name = catalog["name"] if catalog is not None else sys.intern(name)
+
+        facility.id = data.get("id", MISSING)
+        facility.name = name
+        space = data.get("space", MISSING)
+        facility.space = sys.intern(space) if type(space) is str else space
+        hirelings = data.get("hirelings", MISSING)
+        facility.hirelings = [_compact_hireling(h) for h in hirelings] if type(hirelings) is list else hirelings
+        facility.catalog = catalog
+        extra = {
+            sys.intern(key): value
+            for key, value in data.items()
+            if key not in _OWN_FIELDS and (catalog is None or key not in catalog)
+        }
+        facility.extra = extra or None
+        return facility
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = dict(self.catalog) if self.catalog is not None else {}
+        for key in _OWN_FIELDS:
+            value = getattr(self, key)
+            if value is not MISSING:
+                data[key] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def sizeof(self) -> int:
+        return (sys.getsizeof(self) + _sizeof(self.id) + _sizeof(self.hirelings)
+                + (_sizeof(self.extra) if self.extra else 0))
+
+
+def _compact(key: str, value: Any) -> Any:
+    if key in FACILITY_FIELDS and type(value) is list and all(type(f) is dict for f in value):
+        return tuple(Facility.from_dict(f) for f in value)
+    return value
+
+
+def _expand(value: Any) -> Any:
+    if type(value) is tuple:
+        return [f.to_dict() for f in value]
+    return value
+
+
+class RoomState:
+    """One resident room: bastion fields, seated players and bookkeeping"""
+    __slots__ = ("fields", "versions", "players", "spectators", "revision", "touched", "bytes", "_connected")
+
+    def __init__(self, bastion_data: Dict[str, Any], revision: int):
+        self.fields: Dict[str, Any] = {}
+        # field -> FieldVersion with compact ``previous`` and no ``value``; unversioned until first changed
+        self.versions: Dict[str, FieldVersion] = {}
+        self.players: Dict[str, Player] = {}
+        self.spectators = 0
+        self.revision = revision
+        self.touched = time.monotonic()
+        self.bytes: Optional[int] = None
+        self._connected: Optional[List[Dict[str, str]]] = None
+        self.update(bastion_data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Expanded value of one field (so a RoomState can be diffed like a dict)"""
+        value = self.fields.get(key, MISSING)
+        return default if value is MISSING else _expand(value)
+
+    def update(self, changes: Dict[str, Any]) -> None:
+        fields = self.fields
+        for key, value in changes.items():
+            if value is MISSING:
+                fields.pop(key, None)
+            else:
+                fields[sys.intern(key)] = _compact(key, value)
+        self.bytes = None
+
+    def commit(self, changes: Dict[str, Any], revision: int,
+               writers: Optional[Dict[str, Optional[str]]] = None) -> None:
+        """Apply changes as the given revision, recording who changed each field"""
+        versions, fields = self.versions, self.fields
+        for key in changes:
+            writer = writers.get(key) if writers else None
+            version = versions.get(key)
+            if version is None:
+                versions[sys.intern(key)] = FieldVersion(MISSING, revision, writer, fields.get(key, MISSING))
+                continue
+            if writer != version.writer:
+                version.run_revision = version.revision
+                version.writer = writer
+            version.previous, version.previous_revision = fields.get(key, MISSING), version.revision
+            version.revision = revision
+        self.update(changes)
+        self.revision = revision
+
+    def field_revision(self, key: str) -> int:
+        version = self.versions.get(key)
+        return version.revision if version is not None else 0
+
+    def version(self, key: str) -> FieldVersion:
+        """Expanded FieldVersion of one field"""
+        value = _expand(self.fields.get(key, MISSING))
+        version = self.versions.get(key)
+        if version is None:
+            return FieldVersion(value)
+        return FieldVersion(value, version.revision, version.writer, _expand(version.previous),
+                            version.previous_revision, version.run_revision)
+
+    def bastion_data(self) -> Dict[str, Any]:
+        return {key: _expand(value) for key, value in self.fields.items()}
+
+    def snapshot(self) -> Tuple[Dict[str, Any], int]:
+        """(bastion_data with connectedPlayers, revision)"""
+        bastion_data = self.bastion_data()
+        bastion_data["connectedPlayers"] = self.connected_players
+        return bastion_data, self.revision
+
+    def read(self, keys: Iterable[str]) -> Dict[str, Any]:
+        fields = self.fields
+        return {key: _expand(fields[key]) for key in keys if key in fields}
+
+    @property
+    def connected_players(self) -> List[Dict[str, str]]:
+        """[{id, name}] of the seated players, rebuilt only after a join or leave"""
+        if self._connected is None:
+            self._connected = [player.to_dict() for player in self.players.values()]
+        return self._connected
+
+    def add_player(self, player_id: str, name: str) -> None:
+        self.players[player_id] = Player(player_id, name)
+        self._connected = None
+        self.bytes = None
+
+    def remove_player(self, player_id: str) -> Optional[Dict[str, str]]:
+        removed = self.players.pop(player_id, None)
+        if removed is None:
+            return None
+        self._connected = None
+        self.bytes = None
+        return removed.to_dict()
+
+    def sizeof(self) -> int:
+        if self.bytes is None:
+            self.bytes = (sys.getsizeof(self) + sys.getsizeof(self.fields)
+                          + sum(_sizeof(value) for value in self.fields.values())
+                          + sum(sys.getsizeof(v) + _sizeof(v.previous) for v in self.versions.values())
+                          + sys.getsizeof(self.players)
+                          + sum(sys.getsizeof(p) + _sizeof(p.name) for p in self.players.values()))
+        return self.bytes
+
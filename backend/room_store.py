@@ -0,0 +1,532 @@
+"""Room membership and bastion state, shared by every worker serving a room
+
+``LocalRoomStore`` keeps everything in process, as compact ``RoomState``
+objects, and is what a single worker (and any test) uses. ``RedisRoomStore``
+keeps the same data in Redis so that several uvicorn workers, each holding a
+slice of the sockets, see one consistent room:
+
+    bastion:room:<code>:state    hash of bastion_data field -> JSON, plus __revision and,
+                                 per changed field, __rev:/__by:/__prev:/__prevrev:/__runrev:<field>
+    bastion:room:<code>:players  hash of player_id -> JSON {id, name}
+    bastion:room:<code>:spectators  count of read-only spectators
+    bastion:room:<code>:owners   hash of player_id -> id of the worker holding that seat
+
+and, per worker, a ``bastion:worker:<id>:alive`` heartbeat key that expires
+``heartbeat_ttl`` seconds after the worker stops refreshing it, plus the
+set ``bastion:worker:<id>:seats`` of its ``<code>:<player_id>`` seats, with
+every worker id listed in ``bastion:workers``. A seat whose worker's
+heartbeat has expired belongs to nobody, and is listed by ``seated_players``
+alongside the worker's own seats so that the session reaper can release it.
+
+Both stores apply an update atomically: only fields whose value actually
+changed are written, and the room revision is bumped once per non-empty apply.
+Each changed field records that revision and its writer (see
+``bastion_sync.FieldVersion``). An apply can be made conditional on field
+revisions read earlier, and raises ``RevisionMismatch`` without writing
+anything if one of them moved on.
+They also track when each room was last used so that ``RoomCache`` can evict
+empty, idle rooms; ``evict`` refuses to drop a room that still has players
+or spectators.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bastion_sync import diff_bastion, FieldVersion, MISSING, RevisionMismatch, SERVER_OWNED_FIELDS
+from room_state import RoomState
+
+logger = logging.getLogger(__name__)
+
+REVISION_FIELD = "__revision"
+
+
+class LocalRoomStore:
+    """In-process room state for a single worker"""
+
+    def __init__(self):
+        # room_code -> RoomState, ordered least recently used first
+        self._rooms: "OrderedDict[str, RoomState]" = OrderedDict()
+
+    def _touch(self, room_code: str) -> Optional[RoomState]:
+        room = self._rooms.get(room_code)
+        if room is not None:
+            room.touched = time.monotonic()
+            self._rooms.move_to_end(room_code)
+        return room
+
+    async def exists(self, room_code: str) -> bool:
+        return self._touch(room_code) is not None
+
+    async def seed(self, room_code: str, bastion_data: Dict[str, Any], revision: int) -> bool:
+        """Install state loaded from MongoDB unless the room is already resident"""
+        if room_code in self._rooms:
+            return False
+        data = {k: v for k, v in bastion_data.items() if k not in SERVER_OWNED_FIELDS}
+        self._rooms[room_code] = RoomState(data, revision)
+        return True
+
+    async def get_state(self, room_code: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Return (bastion_data with connectedPlayers, revision)"""
+        room = self._touch(room_code)
+        if room is None:
+            return None
+        return room.snapshot()
+
+    async def apply(self, room_code: str, updates: Dict[str, Any],
+                    writers: Optional[Dict[str, Optional[str]]] = None,
+                    expected: Optional[Dict[str, int]] = None) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """Apply updates; return (new revision, changed fields) or None if nothing changed
+
+        ``writers`` names who changed each field; with ``expected`` (field ->
+        field revision) nothing is written unless every field is still at it.
+        """
+        room = self._touch(room_code)
+        if room is None:
+            return None
+        if expected:
+            stale = [field for field, revision in expected.items() if room.field_revision(field) != revision]
+            if stale:
+                raise RevisionMismatch(stale)
+        changes = diff_bastion(room, updates)
+        if not changes:
+            return None
+        room.commit(changes, room.revision + 1, writers)
+        return room.revision, changes
+
+    async def read_versions(self, room_code: str, fields: Iterable[str]) -> Optional[Dict[str, FieldVersion]]:
+        """FieldVersion of each given field"""
+        room = self._touch(room_code)
+        if room is None:
+            return None
+        return {field: room.version(field) for field in fields}
+
+    async def read_fields(self, room_code: str, fields: Iterable[str],
+                          ) -> Optional[Tuple[Dict[str, Any], Dict[str, int], int]]:
+        """Current values and field revisions of the given fields, and the room revision"""
+        room = self._rooms.get(room_code)
+        if room is None:
+            return None
+        fields = list(fields)
+        return room.read(fields), {field: room.field_revision(field) for field in fields}, room.revision
+
+    async def add_player(self, room_code: str, player: Dict[str, str]) -> List[Dict[str, str]]:
+        """Add {id, name} to the room and return the connected players"""
+        room = self._touch(room_code)
+        room.add_player(player["id"], player["name"])
+        return room.connected_players
+
+    async def remove_player(self, room_code: str, player_id: str) -> Tuple[Optional[Dict[str, str]], List[Dict[str, str]]]:
+        """Remove a player; return (removed player or None, remaining players)"""
+        room = self._rooms.get(room_code)
+        if room is None:
+            return None, []
+        removed = room.remove_player(player_id)
+        return removed, room.connected_players
+
+    async def add_spectator(self, room_code: str) -> int:
+        """Count a spectator into the room; return the number of spectators"""
+        room = self._touch(room_code)
+        room.spectators += 1
+        return room.spectators
+
+    async def remove_spectator(self, room_code: str) -> int:
+        room = self._rooms.get(room_code)
+        if room is None:
+            return 0
+        room.spectators = max(0, room.spectators - 1)
+        return room.spectators
+
+    async def seated_players(self) -> List[Tuple[str, str]]:
+        """(room_code, player_id) for every seated player"""
+        return [(room_code, player_id) for room_code, room in self._rooms.items() for player_id in room.players]
+
+    async def eviction_candidates(self, capacity: int, idle_ttl: float) -> List[str]:
+        """Least recently used rooms that are over capacity or idle past idle_ttl"""
+        idle_before = time.monotonic() - idle_ttl
+        overflow = len(self._rooms) - capacity
+        candidates = []
+        for room_code, room in self._rooms.items():
+            if overflow <= 0 and room.touched > idle_before:
+                break
+            if not room.players and not room.spectators:
+                candidates.append(room_code)
+                overflow -= 1
+        return candidates
+
+    async def evict(self, room_code: str) -> bool:
+        """Drop a room from memory unless players or spectators are still in it"""
+        room = self._rooms.get(room_code)
+        if room is None or room.players or room.spectators:
+            return False
+        del self._rooms[room_code]
+        return True
+
+    async def size(self) -> int:
+        return len(self._rooms)
+
+    async def resident_bytes(self) -> int:
+        return sum(room.sizeof() for room in self._rooms.values())
+
+    async def resident_rooms(self) -> List[Tuple[str, Dict[str, Any], int]]:
+        """(room_code, bastion_data, revision) for every resident room, for checkpointing"""
+        rooms = []
+        for i, (room_code, room) in enumerate(list(self._rooms.items())):
+            rooms.append((room_code, room.bastion_data(), room.revision))
+            if i % 1000 == 999:
+                # Expanding thousands of rooms takes a while; let the loop breathe
+                await asyncio.sleep(0)
+        return rooms
+
+    def start(self) -> None:
+        """Nothing to keep alive; seats die with the process"""
+
+    async def ping(self) -> None:
+        """Nothing to reach; the store is in-process"""
+
+    async def close(self) -> None:
+        pass
+
+
+# ARGV: number of expected field revisions, that many (field, revision) pairs, then (field, value, writer)
+# triples; an empty value removes the field
+_APPLY_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return {-1}
+end
+local expected = tonumber(ARGV[1])
+local stale = {}
+for i = 2, 2 * expected, 2 do
+  if tonumber(redis.call('HGET', KEYS[1], '__rev:' .. ARGV[i]) or '0') ~= tonumber(ARGV[i + 1]) then
+    table.insert(stale, ARGV[i])
+  end
+end
+if #stale > 0 then
+  return {-2, unpack(stale)}
+end
+local changed = {}
+for i = 2 * expected + 2, #ARGV, 3 do
+  if (redis.call('HGET', KEYS[1], ARGV[i]) or '') ~= ARGV[i + 1] then
+    table.insert(changed, i)
+  end
+end
+if #changed == 0 then
+  return {0}
+end
+local revision = redis.call('HINCRBY', KEYS[1], '__revision', 1)
+local fields = {}
+for _, i in ipairs(changed) do
+  local field, writer = ARGV[i], ARGV[i + 2]
+  local field_revision = redis.call('HGET', KEYS[1], '__rev:' .. field) or '0'
+  if redis.call('HGET', KEYS[1], '__by:' .. field) ~= writer then
+    -- A new writer's run of changes starts at the field's current revision
+    redis.call('HSET', KEYS[1], '__runrev:' .. field, field_revision, '__by:' .. field, writer)
+  end
+  local old = redis.call('HGET', KEYS[1], field)
+  if old then
+    redis.call('HSET', KEYS[1], '__prev:' .. field, old)
+  else
+    redis.call('HDEL', KEYS[1], '__prev:' .. field)
+  end
+  if ARGV[i + 1] == '' then
+    redis.call('HDEL', KEYS[1], field)
+  else
+    redis.call('HSET', KEYS[1], field, ARGV[i + 1])
+  end
+  redis.call('HSET', KEYS[1], '__rev:' .. field, revision, '__prevrev:' .. field, field_revision)
+  table.insert(fields, field)
+end
+return {revision, unpack(fields)}
+"""
+
+_EVICT_SCRIPT = """
+if redis.call('HLEN', KEYS[2]) > 0 or tonumber(redis.call('GET', KEYS[4]) or '0') > 0 then
+  return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[4], KEYS[5])
+redis.call('ZREM', KEYS[3], ARGV[1])
+return 1
+"""
+
+_SEED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+
+def _encode(value: Any) -> str:
+    # Canonical form so the apply script can compare values as plain strings; "" removes the field
+    if value is MISSING:
+        return ""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class RedisRoomStore:
+    """Room state in Redis, shared by every worker pointed at the same server"""
+
+    def __init__(self, redis_url: str, prefix: str = "bastion:room:", worker_prefix: str = "bastion:worker:",
+                 heartbeat_ttl: float = 30.0):
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.from_url(redis_url, decode_responses=True)
+        self._prefix = prefix
+        self._worker_prefix = worker_prefix
+        self._workers_key = f"{worker_prefix.rstrip(':')}s"
+        self.worker_id = uuid.uuid4().hex
+        self.heartbeat_ttl = heartbeat_ttl
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        # Sorted set of room_code scored by last use, shared by all workers
+        self._lru_key = f"{prefix}lru"
+        self._apply = self._redis.register_script(_APPLY_SCRIPT)
+        self._seed = self._redis.register_script(_SEED_SCRIPT)
+        self._evict = self._redis.register_script(_EVICT_SCRIPT)
+
+    def _state_key(self, room_code: str) -> str:
+        return f"{self._prefix}{room_code}:state"
+
+    def _players_key(self, room_code: str) -> str:
+        return f"{self._prefix}{room_code}:players"
+
+    def _spectators_key(self, room_code: str) -> str:
+        return f"{self._prefix}{room_code}:spectators"
+
+    def _owners_key(self, room_code: str) -> str:
+        return f"{self._prefix}{room_code}:owners"
+
+    def _alive_key(self, worker_id: str) -> str:
+        return f"{self._worker_prefix}{worker_id}:alive"
+
+    def _seats_key(self, worker_id: str) -> str:
+        return f"{self._worker_prefix}{worker_id}:seats"
+
+    def _beat(self, pipe) -> None:
+        pipe.set(self._alive_key(self.worker_id), 1, px=int(self.heartbeat_ttl * 1000))
+        pipe.sadd(self._workers_key, self.worker_id)
+
+    async def heartbeat(self) -> None:
+        """Mark this worker's seats as held for another heartbeat_ttl seconds"""
+        async with self._redis.pipeline(transaction=False) as pipe:
+            self._beat(pipe)
+            await pipe.execute()
+
+    async def _touch(self, room_code: str) -> None:
+        await self._redis.zadd(self._lru_key, {room_code: time.time()})
+
+    async def exists(self, room_code: str) -> bool:
+        found = bool(await self._redis.exists(self._state_key(room_code)))
+        if found:
+            await self._touch(room_code)
+        return found
+
+    async def seed(self, room_code: str, bastion_data: Dict[str, Any], revision: int) -> bool:
+        args = [REVISION_FIELD, str(revision)]
+        for key, value in bastion_data.items():
+            if key not in SERVER_OWNED_FIELDS:
+                args.extend((key, _encode(value)))
+        seeded = bool(await self._seed(keys=[self._state_key(room_code)], args=args))
+        if seeded:
+            await self._touch(room_code)
+        return seeded
+
+    async def get_state(self, room_code: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(self._state_key(room_code))
+            pipe.hvals(self._players_key(room_code))
+            raw_state, raw_players = await pipe.execute()
+        if not raw_state:
+            return None
+        revision = int(raw_state.pop(REVISION_FIELD, 0))
+        bastion_data = {key: json.loads(value) for key, value in raw_state.items() if not key.startswith("__")}
+        bastion_data["connectedPlayers"] = [json.loads(p) for p in raw_players]
+        return bastion_data, revision
+
+    async def apply(self, room_code: str, updates: Dict[str, Any],
+                    writers: Optional[Dict[str, Optional[str]]] = None,
+                    expected: Optional[Dict[str, int]] = None) -> Optional[Tuple[int, Dict[str, Any]]]:
+        expected = expected or {}
+        args: List[Any] = [len(expected)]
+        for field, revision in expected.items():
+            args.extend((field, revision))
+        prefix = len(args)
+        for key, value in updates.items():
+            if key not in SERVER_OWNED_FIELDS:
+                args.extend((key, _encode(value), (writers or {}).get(key) or ""))
+        if len(args) == prefix:
+            return None
+        result = await self._apply(keys=[self._state_key(room_code)], args=args)
+        revision = int(result[0])
+        if revision == -2:
+            raise RevisionMismatch(result[1:])
+        if revision <= 0:
+            return None
+        await self._touch(room_code)
+        return revision, {key: updates[key] for key in result[1:]}
+
+    async def read_versions(self, room_code: str, fields: Iterable[str]) -> Optional[Dict[str, FieldVersion]]:
+        fields = list(fields)
+        names = []
+        for field in fields:
+            names.extend((field, f"__rev:{field}", f"__by:{field}", f"__prev:{field}", f"__prevrev:{field}",
+                          f"__runrev:{field}"))
+        values = await self._redis.hmget(self._state_key(room_code), [REVISION_FIELD, *names])
+        if values[0] is None:
+            return None
+        versions = {}
+        for i, field in enumerate(fields):
+            value, revision, writer, previous, previous_revision, run_revision = values[1 + 6 * i:7 + 6 * i]
+            versions[field] = FieldVersion(
+                json.loads(value) if value is not None else MISSING, int(revision or 0), writer or None,
+                json.loads(previous) if previous is not None else MISSING, int(previous_revision or 0),
+                int(run_revision or 0),
+            )
+        return versions
+
+    async def read_fields(self, room_code: str, fields: Iterable[str],
+                          ) -> Optional[Tuple[Dict[str, Any], Dict[str, int], int]]:
+        fields = list(fields)
+        values = await self._redis.hmget(
+            self._state_key(room_code), [REVISION_FIELD, *fields, *(f"__rev:{f}" for f in fields)],
+        )
+        if values[0] is None:
+            return None
+        data = {f: json.loads(v) for f, v in zip(fields, values[1:]) if v is not None}
+        revisions = {f: int(v or 0) for f, v in zip(fields, values[1 + len(fields):])}
+        return data, revisions, int(values[0])
+
+    async def add_player(self, room_code: str, player: Dict[str, str]) -> List[Dict[str, str]]:
+        key = self._players_key(room_code)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            # The heartbeat goes with the seat, so no other worker sees the seat without a live owner
+            self._beat(pipe)
+            pipe.hset(key, player["id"], _encode({"id": player["id"], "name": player["name"]}))
+            pipe.hset(self._owners_key(room_code), player["id"], self.worker_id)
+            pipe.sadd(self._seats_key(self.worker_id), f"{room_code}:{player['id']}")
+            pipe.hvals(key)
+            *_, raw_players = await pipe.execute()
+        return [json.loads(p) for p in raw_players]
+
+    async def remove_player(self, room_code: str, player_id: str) -> Tuple[Optional[Dict[str, str]], List[Dict[str, str]]]:
+        key = self._players_key(room_code)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hget(key, player_id)
+            pipe.hget(self._owners_key(room_code), player_id)
+            pipe.hdel(key, player_id)
+            pipe.hdel(self._owners_key(room_code), player_id)
+            pipe.hvals(key)
+            raw_removed, owner, _, _, raw_players = await pipe.execute()
+        if owner:
+            await self._redis.srem(self._seats_key(owner), f"{room_code}:{player_id}")
+        removed = json.loads(raw_removed) if raw_removed else None
+        return removed, [json.loads(p) for p in raw_players]
+
+    async def add_spectator(self, room_code: str) -> int:
+        return int(await self._redis.incr(self._spectators_key(room_code)))
+
+    async def remove_spectator(self, room_code: str) -> int:
+        remaining = int(await self._redis.decr(self._spectators_key(room_code)))
+        if remaining < 0:
+            await self._redis.set(self._spectators_key(room_code), 0)
+            remaining = 0
+        return remaining
+
+    async def seated_players(self) -> List[Tuple[str, str]]:
+        """(room_code, player_id) for this worker's seats and those of workers whose heartbeat expired"""
+        workers = [w for w in await self._redis.smembers(self._workers_key) if w != self.worker_id]
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for worker_id in workers:
+                pipe.exists(self._alive_key(worker_id))
+            alive = await pipe.execute()
+        dead = [worker_id for worker_id, found in zip(workers, alive) if not found]
+
+        seats = []
+        for worker_id in [self.worker_id, *dead]:
+            members = list(await self._redis.smembers(self._seats_key(worker_id)))
+            if not members and worker_id != self.worker_id:
+                # Every seat of this dead worker has been released; forget it
+                async with self._redis.pipeline(transaction=True) as pipe:
+                    pipe.srem(self._workers_key, worker_id)
+                    pipe.delete(self._seats_key(worker_id))
+                    await pipe.execute()
+                continue
+            held = [tuple(member.split(":", 1)) for member in members]
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for room_code, player_id in held:
+                    pipe.hget(self._owners_key(room_code), player_id)
+                owners = await pipe.execute()
+            stale = []
+            for member, (room_code, player_id), owner in zip(members, held, owners):
+                if owner == worker_id:
+                    seats.append((room_code, player_id))
+                else:
+                    # Released, or taken over by another worker since
+                    stale.append(member)
+            if stale:
+                await self._redis.srem(self._seats_key(worker_id), *stale)
+        return seats
+
+    async def eviction_candidates(self, capacity: int, idle_ttl: float) -> List[str]:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zcard(self._lru_key)
+            pipe.zrangebyscore(self._lru_key, "-inf", time.time() - idle_ttl)
+            total, idle = await pipe.execute()
+        overflow = total - capacity - len(idle)
+        if overflow > 0:
+            oldest = await self._redis.zrange(self._lru_key, len(idle), len(idle) + overflow - 1)
+            idle.extend(oldest)
+        return idle
+
+    async def evict(self, room_code: str) -> bool:
+        keys = [self._state_key(room_code), self._players_key(room_code), self._lru_key,
+                self._spectators_key(room_code), self._owners_key(room_code)]
+        return bool(await self._evict(keys=keys, args=[room_code]))
+
+    async def size(self) -> int:
+        return await self._redis.zcard(self._lru_key)
+
+    async def resident_bytes(self) -> int:
+        info = await self._redis.info("memory")
+        return int(info.get("used_memory", 0))
+
+    async def resident_rooms(self) -> List[Tuple[str, Dict[str, Any], int]]:
+        """Nothing to checkpoint; room state outlives the worker in Redis"""
+        return []
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                logger.error(f"Worker heartbeat failed: {e}")
+            await asyncio.sleep(self.heartbeat_ttl / 3)
+
+    def start(self) -> None:
+        if self._heartbeat_task is None:
+            self._heartbeat_task = asyncio.create_task(self._run_heartbeat())
+
+    async def ping(self) -> None:
+        await self._redis.ping()
+
+    async def close(self) -> None:
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+            # Nobody is left to resume this worker's seats; let the other workers reap them now
+            await self._redis.delete(self._alive_key(self.worker_id))
+        await self._redis.aclose()
+
+
+def create_room_store(redis_url: Optional[str] = None, heartbeat_ttl: float = 30.0):
+    """Shared Redis store when a URL is configured, in-process store otherwise"""
+    if redis_url:
+        return RedisRoomStore(redis_url, heartbeat_ttl=heartbeat_ttl)
+    return LocalRoomStore()
@@ -0,0 +1,38 @@
+"""Packet class and pluggable JSON codec for Socket.IO and Engine.IO packets
+
+python-socketio encodes a broadcast once and reuses the encoded packet for
+every recipient in the room (as long as no ack callback is requested), so the
+cost of a fan-out is that single encode. The stock packet spends most of it
+walking the payload looking for binary attachments, which bastion payloads
+never contain, and then in ``json.dumps``. ``JsonOnlyPacket`` skips the walk
+and the orjson codec speeds up the dump while staying wire-compatible with
+the stock browser client, so nothing has to be negotiated per client.
+"""
+import json
+
+import orjson
+from socketio import packet
+
+
+class OrjsonCodec:
+    """Drop-in for the ``json`` module as used by socketio/engineio packets"""
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        # Packets only ever ask for compact separators, which is orjson's only output
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
+
+
+class JsonOnlyPacket(packet.Packet):
+    """Socket.IO packet that never carries binary attachments"""
+
+    uses_binary_events = False
+
+
+def socket_json_codec(name: str = "orjson"):
+    """Return the codec for SOCKETIO_JSON ("orjson" or "json")"""
+    return OrjsonCodec if name == "orjson" else json
@@ -1,8 +1,11 @@
-from fastapi import FastAPI, HTTPException, APIRouter
+from fastapi import FastAPI, HTTPException, APIRouter, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 import socketio
+import structlog
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 import os
 import logging
 import asyncio
@@ -10,29 +13,186 @@ from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 import uuid
-import string
-import random
 from datetime import datetime
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError
+from session_registry import SessionRegistry
+from bastion_sync import (
+    MISSING, RevisionMismatch, SERVER_OWNED_FIELDS, replacement_changes, state_payload, patch_payload,
+)
+from bastion_merge import ClientUpdate, resolve_updates
+from persistence import WriteBehindPersister
+from room_mailbox import RoomMailboxes
+from room_store import create_room_store
+from room_cache import RoomCache
+from room_checkpoint import RoomCheckpoint
+from serialization import socket_json_codec
+from room_codes import RoomCodeAllocator
+from turn_engine import TurnBatch, TurnOrders, advance_turn
+from facility_catalog import catalog_response, available_special_facilities, party_level, special_slots
+from update_validation import UpdateValidator, UpdateRejected, TokenBucketLimiter
+from bastion_history import BastionHistory, HistoryUnavailable, RestoreOrder
+from session_resume import ResumableSessions
+from session_reaper import SessionReaper
+from room_fanout import RoomFanout, spectator_room
+from analytics import CampaignAnalytics, SECTIONS as ANALYTICS_SECTIONS
+from health import Readiness
+from status_checks import MAX_PAGE_SIZE, page_filter, stream_page, create_status_indexes
+from observability import (
+    InstrumentedPacket, MongoCommandMetrics, observe_phase, configure_structlog,
+    LIVE_ROOMS, LIVE_PLAYERS, LIVE_SOCKETS, UPDATES_DROPPED, UPDATE_CONFLICTS,
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
+# The client connects lazily; timeouts are kept short so a missing database fails a
+# readiness probe or a request within seconds instead of hanging for pymongo's 30s default
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+    maxIdleTimeMS=int(os.environ.get('MONGO_MAX_IDLE_MS', '60000')),
+    serverSelectionTimeoutMS=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+    connectTimeoutMS=int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+    waitQueueTimeoutMS=int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+    event_listeners=[MongoCommandMetrics()],
+)
 db = client[os.environ['DB_NAME']]
 
-# Socket.io setup
-sio = socketio.AsyncServer(cors_allowed_origins="*", async_mode='asgi')
+# Room membership and bastion state; shared through Redis when several workers serve the same rooms
+redis_url = os.environ.get('REDIS_URL')
+store = create_room_store(redis_url, heartbeat_ttl=float(os.environ.get('WORKER_HEARTBEAT_TTL', '30')))
+
+# Bastion updates are buffered and flushed to MongoDB in the background.
+# Values are read back from the store at flush time so the last flush from any worker wins.
+persister = WriteBehindPersister(
+    db.bastions,
+    flush_interval=float(os.environ.get('BASTION_FLUSH_INTERVAL', '1.0')),
+    max_dirty_rooms=int(os.environ.get('BASTION_FLUSH_MAX_DIRTY', '500')),
+    read_fields=store.read_fields,
+)
+
+# Every applied change is also appended to an event log, with periodic snapshots, for history and undo
+history = BastionHistory(
+    db.bastion_events,
+    db.bastion_snapshots,
+    read_state=store.get_state,
+    snapshot_every=int(os.environ.get('BASTION_SNAPSHOT_EVERY', '100')),
+    flush_interval=float(os.environ.get('BASTION_HISTORY_FLUSH_INTERVAL', '1.0')),
+)
+
+# Resident rooms are checkpointed to disk so a restarted worker serves them without a MongoDB read spike.
+# Redis already outlives the worker, so there is nothing to checkpoint with REDIS_URL set.
+checkpoint_path = os.environ.get('ROOM_CHECKPOINT_PATH', str(ROOT_DIR / 'room_checkpoint.bin'))
+room_checkpoint = RoomCheckpoint(
+    checkpoint_path if checkpoint_path and not redis_url else None,
+    store.resident_rooms,
+    interval=float(os.environ.get('ROOM_CHECKPOINT_INTERVAL', '60')),
+)
+
+def warm_bastion(room_code, bastion_data, revision, persisted_revision):
+    """Serve a room from the checkpoint, writing it back if MongoDB missed its last changes"""
+    if revision > persisted_revision:
+        persister.mark_dirty(room_code, bastion_data, revision)
+    history.snapshot(room_code, bastion_data, revision)
+    return bastion_data, revision
+
+async def load_bastion(room_code):
+    """Fetch (bastion_data, revision) for a room from the checkpoint or MongoDB"""
+    warm = await room_checkpoint.take(room_code)
+    if warm is not None:
+        return warm_bastion(room_code, *warm)
+    bastion_doc = await db.bastions.find_one({"room_code": room_code})
+    if not bastion_doc:
+        return None
+    revision = bastion_doc.get("revision", 0)
+    # Baseline for rebuilding history from here on (a no-op if this revision is already snapshotted)
+    history.snapshot(room_code, bastion_doc["bastion_data"], revision)
+    return bastion_doc["bastion_data"], revision
+
+async def load_bastions(room_codes):
+    """Fetch {room_code: (bastion_data, revision)} for the rooms that exist, in one query"""
+    loaded = {
+        room_code: warm_bastion(room_code, *warm)
+        for room_code, warm in (await room_checkpoint.take_many(room_codes)).items()
+    }
+    cold = [room_code for room_code in room_codes if room_code not in loaded]
+    if not cold:
+        return loaded
+    cursor = db.bastions.find(
+        {"room_code": {"$in": cold}}, {"_id": 0, "room_code": 1, "bastion_data": 1, "revision": 1},
+    )
+    async for bastion_doc in cursor:
+        revision = bastion_doc.get("revision", 0)
+        history.snapshot(bastion_doc["room_code"], bastion_doc["bastion_data"], revision)
+        loaded[bastion_doc["room_code"]] = bastion_doc["bastion_data"], revision
+    return loaded
+
+# Campaign reports read MongoDB (after a flush) and are reused until some bastion's turn changes
+analytics = CampaignAnalytics(
+    db.bastions,
+    before_report=persister.flush,
+    chunk_rows=int(os.environ.get('ANALYTICS_CHUNK_ROWS', '65536')),
+)
+
+# Rooms are loaded on demand and evicted once empty and idle, after their pending writes are flushed
+room_cache = RoomCache(
+    store,
+    load_bastion,
+    batch_loader=load_bastions,
+    capacity=int(os.environ.get('ROOM_CACHE_CAPACITY', '10000')),
+    idle_ttl=float(os.environ.get('ROOM_CACHE_IDLE_TTL', '900')),
+    sweep_interval=float(os.environ.get('ROOM_CACHE_SWEEP_INTERVAL', '30')),
+    flush=persister.flush,
+    can_evict=lambda room_code: not persister.is_dirty(room_code) and mailboxes.is_idle(room_code),
+)
+
+# Room codes come from a keyed permutation of a global sequence reserved in blocks, so they never collide
+room_code_key = os.environ.get('ROOM_CODE_KEY')
+code_allocator = RoomCodeAllocator(
+    db.counters,
+    key=(room_code_key or 'bastion-tracker').encode(),
+    block_size=int(os.environ.get('ROOM_CODE_BLOCK_SIZE', '1000')),
+)
+
+# Socket.io setup; the Redis manager relays room emits between workers.
+# Each room broadcast is encoded once with the configured JSON codec and reused for every recipient.
+sio = socketio.AsyncServer(
+    cors_allowed_origins="*",
+    async_mode='asgi',
+    client_manager=socketio.AsyncRedisManager(redis_url) if redis_url else None,
+    serializer=InstrumentedPacket,
+    json=socket_json_codec(os.environ.get('SOCKETIO_JSON', 'orjson')),
+    # Oversized messages are refused by the transport before they are even decoded
+    max_http_buffer_size=int(os.environ.get('SOCKETIO_MAX_MESSAGE_BYTES', str(256 * 1024))),
+)
 
 # Create the main app
 app = FastAPI()
 
+# Structured events; hot-path ones (connects, updates) are only logged for a sampled fraction
+log = structlog.get_logger("bastion")
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# In-memory storage for room management
-rooms = {}  # room_code -> {players: [], bastion_data: {}}
+# Readiness is polled by the entrypoint and load balancer; see the checks below the routes
+readiness = Readiness(timeout=float(os.environ.get('READINESS_TIMEOUT', '2.0')))
+indexes_ready = asyncio.Event()
+
+# Sockets are owned by the worker they connected to, so the session index stays local
+sessions = SessionRegistry()  # sid -> (room_code, player_id)
+spectating: Dict[str, str] = {}  # sid -> room_code of read-only spectators
+
+# Spectators get throttled, coalesced frames; join and leave notices are debounced per room
+fanout = RoomFanout(
+    sio.emit,
+    frame_rate=float(os.environ.get('SPECTATOR_FRAME_RATE', '4')),
+    membership_delay=float(os.environ.get('MEMBERSHIP_DEBOUNCE', '0.25')),
+)
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -54,22 +214,140 @@ class BastionData(BaseModel):
     specialFacilities: List[Dict[str, Any]] = []
     connectedPlayers: List[Dict[str, str]] = []
 
+# Client updates are checked against BastionData and rate limited per socket before they are queued
+update_validator = UpdateValidator(BastionData, exclude=SERVER_OWNED_FIELDS)
+update_limiter = TokenBucketLimiter(
+    rate=float(os.environ.get('UPDATE_RATE_LIMIT', '20')),
+    burst=float(os.environ.get('UPDATE_RATE_BURST', '40')),
+)
+
 class CreateBastionResponse(BaseModel):
     roomCode: str
     bastionData: BastionData
 
-def generate_room_code() -> str:
-    """Generate a unique 6-character room code"""
-    while True:
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-        if code not in rooms:
-            return code
+class BastionTurnOrders(BaseModel):
+    roomCode: str
+    orders: Dict[str, str] = {}
+    goldDelta: int = 0
+    defenderDelta: int = 0
+
+# Upper bound on the rooms a single batch request may create, fetch or advance
+MAX_BATCH_BASTIONS = int(os.environ.get('MAX_BATCH_BASTIONS', '500'))
+
+class AdvanceTurnsRequest(BaseModel):
+    bastions: List[BastionTurnOrders] = Field(max_length=MAX_BATCH_BASTIONS)
+
+class BatchCreateRequest(BaseModel):
+    count: int = Field(ge=1, le=MAX_BATCH_BASTIONS)
+
+class BatchGetRequest(BaseModel):
+    roomCodes: List[str] = Field(max_length=MAX_BATCH_BASTIONS)
+
+class UndoRequest(BaseModel):
+    revision: Optional[int] = None
+    turn: Optional[int] = None
+
+async def release_seat(room_code: str, player_id: str) -> Optional[Dict[str, Any]]:
+    """Take a player out of their room for good, notifying the remaining players"""
+    resumable.revoke(player_id)
+    removed_player, players = await store.remove_player(room_code, player_id)
+    if not removed_player:
+        return None
+    if not players:
+        mailboxes.discard(room_code)
+
+    # Other players hear about it with the next debounced membership notice
+    fanout.members_changed(room_code, players=players, left=removed_player)
+    return removed_player
+
+async def stop_spectating(sid: str) -> None:
+    room_code = spectating.pop(sid, None)
+    if room_code is None:
+        return
+    await sio.leave_room(sid, spectator_room(room_code))
+    fanout.members_changed(room_code, spectators=await store.remove_spectator(room_code))
+
+async def remove_session(sid: str) -> Optional[Dict[str, Any]]:
+    """Drop sid from the session index and release its seat"""
+    session = sessions.unbind(sid)
+    if not session:
+        return None
+    room_code, player_id = session
+    await sio.leave_room(sid, room_code)
+    return await release_seat(room_code, player_id)
+
+# A dropped player's seat is held for a grace period so a quick reconnect can resume it unnoticed
+resumable = ResumableSessions(release_seat, grace=float(os.environ.get('SESSION_RESUME_GRACE', '20')))
+
+async def release_socket(sid: str) -> None:
+    """Forget a socket that went away: stop its spectating and park (or release) its seat"""
+    update_limiter.discard(sid)
+    await stop_spectating(sid)
+    session = sessions.unbind(sid)
+    if session and not resumable.park(session[1]):
+        await release_seat(*session)
+
+async def orphaned_seats():
+    """Seats of this worker, or of a worker that stopped heartbeating, that no session or parked token holds"""
+    return [(room_code, player_id) for room_code, player_id in await store.seated_players()
+            if not resumable.holds(player_id)]
+
+# Sockets that died without a clean disconnect are found from their heartbeat state and cleaned up
+# in the background, and rooms emptied by that are evicted right away if they are idle
+reaper = SessionReaper(
+    sio,
+    tracked_sids=lambda: [*sessions, *spectating],
+    release_socket=release_socket,
+    orphaned_seats=orphaned_seats,
+    release_seat=release_seat,
+    after_reap=room_cache.sweep,
+    interval=float(os.environ.get('REAPER_INTERVAL', '30')),
+    batch_size=int(os.environ.get('REAPER_BATCH_SIZE', '500')),
+    ping_grace=float(os.environ.get('REAPER_PING_GRACE', '5')),
+)
 
 # Basic API routes
 @api_router.get("/")
 async def root():
     return {"message": "Bastion Tracker API is running"}
 
+@api_router.get("/health/live")
+async def liveness():
+    """The process is up and its event loop is answering"""
+    return {"status": "alive"}
+
+@api_router.get("/health/ready")
+async def readiness_probe():
+    """200 once MongoDB, the room store and Socket.IO are usable and indexes exist, 503 until then"""
+    ready, checks = await readiness.probe()
+    return JSONResponse({"status": "ready" if ready else "unavailable", "checks": checks},
+                        status_code=200 if ready else 503)
+
+@readiness.check("mongo")
+async def mongo_ready():
+    await db.command("ping")
+
+@readiness.check("store")
+async def store_ready():
+    await store.ping()
+
+@readiness.check("socketio")
+async def socketio_ready():
+    # The pub/sub listener only exists when emits are relayed through Redis
+    listener = getattr(sio.manager, "thread", None)
+    if listener is not None and listener.done():
+        raise RuntimeError("Socket.IO pub/sub listener stopped")
+
+@readiness.check("indexes")
+async def indexes_created():
+    if not indexes_ready.is_set():
+        raise RuntimeError("still creating indexes")
+
+@readiness.check("checkpoint")
+async def checkpoint_reconciled():
+    if not room_checkpoint.reconciled:
+        raise RuntimeError("still reconciling the room checkpoint with MongoDB")
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
@@ -77,108 +355,290 @@ async def create_status_check(input: StatusCheckCreate):
     _ = await db.status_checks.insert_one(status_obj.dict())
     return status_obj
 
-@api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+@api_router.get("/status")
+async def get_status_checks(limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None):
+    """Newest status checks first, one page at a time; pass nextCursor back as cursor for the next page
+
+    Returns ``{"items": [...], "nextCursor": ...}``. This is a breaking change:
+    the endpoint used to return a bare list of every check, so clients must
+    now read ``items`` and follow ``nextCursor`` (null on the last page).
+    """
+    try:
+        page_filter(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(stream_page(db.status_checks, cursor, limit), media_type="application/json")
 
 # Bastion management endpoints
 @api_router.post("/bastion/create", response_model=CreateBastionResponse)
 async def create_bastion():
     """Create a new bastion with a unique room code"""
-    room_code = generate_room_code()
     bastion_data = BastionData()
     
-    rooms[room_code] = {
-        "players": [],
-        "bastion_data": bastion_data.dict()
-    }
+    # Store in MongoDB for persistence; skip codes taken by the old random generator
+    while True:
+        room_code = await code_allocator.allocate()
+        try:
+            await db.bastions.insert_one({
+                "room_code": room_code,
+                "bastion_data": bastion_data.dict(),
+                "revision": 0,
+                "created_at": datetime.utcnow()
+            })
+            break
+        except DuplicateKeyError:
+            log.warning("room_code_in_use", room=room_code)
     
-    # Store in MongoDB for persistence
-    await db.bastions.insert_one({
-        "room_code": room_code,
-        "bastion_data": bastion_data.dict(),
-        "created_at": datetime.utcnow()
-    })
+    await store.seed(room_code, bastion_data.dict(), 0)
+    history.snapshot(room_code, bastion_data.dict(), 0)
     
     return CreateBastionResponse(
         roomCode=room_code,
         bastionData=bastion_data
     )
 
+@api_router.post("/bastions/batch-create")
+async def batch_create_bastions(request: BatchCreateRequest):
+    """Create many bastions with one code allocation and one insert_many"""
+    bastion_data = BastionData().dict()
+    created, errors = [], {}
+    room_codes = await code_allocator.allocate_many(request.count)
+    while room_codes:
+        now = datetime.utcnow()
+        try:
+            await db.bastions.insert_many([
+                {"room_code": room_code, "bastion_data": bastion_data, "revision": 0, "created_at": now}
+                for room_code in room_codes
+            ], ordered=False)
+            failed = {}
+        except BulkWriteError as e:
+            failed = {error["index"]: error for error in e.details.get("writeErrors", [])}
+        
+        # Codes taken by the old random generator are replaced; anything else fails that item
+        retry = []
+        for index, room_code in enumerate(room_codes):
+            error = failed.get(index)
+            if error is None:
+                created.append(room_code)
+            elif error.get("code") == 11000:
+                log.warning("room_code_in_use", room=room_code)
+                retry.append(room_code)
+            else:
+                errors[room_code] = error.get("errmsg", "Insert failed")
+        room_codes = await code_allocator.allocate_many(len(retry)) if retry else []
+    
+    # Each room gets its own copy; resident state must not share mutable lists between rooms
+    await asyncio.gather(*(store.seed(room_code, BastionData().dict(), 0) for room_code in created))
+    for room_code in created:
+        history.snapshot(room_code, bastion_data, 0)
+    
+    return {"results": [{"roomCode": room_code, "bastionData": bastion_data} for room_code in created]
+            + [{"roomCode": room_code, "error": error} for room_code, error in errors.items()]}
+
+@api_router.post("/bastions/batch-get")
+async def batch_get_bastions(request: BatchGetRequest):
+    """Bastion data for many rooms; resident rooms are served from memory, the rest with one $in query"""
+    room_codes = [room_code.upper() for room_code in request.roomCodes]
+    async with room_cache.pinned(room_codes) as resident:
+        resident = list(resident)
+        states = await asyncio.gather(*(store.get_state(room_code) for room_code in resident))
+    found = {room_code: state[0] for room_code, state in zip(resident, states) if state}
+    return {"results": [
+        {"roomCode": room_code, "bastionData": found[room_code]} if room_code in found
+        else {"roomCode": room_code, "error": "Bastion not found"}
+        for room_code in room_codes
+    ]}
+
+@api_router.get("/analytics")
+async def get_analytics():
+    """Campaign-wide report over every persisted bastion, cached until the next turn boundary"""
+    return await analytics.report()
+
+@api_router.get("/analytics/{section}")
+async def get_analytics_section(section: str):
+    """One section of the campaign report: gold, defenders, hirelings, turns, levels or facilities"""
+    if section not in ANALYTICS_SECTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown analytics section {section}")
+    report = await analytics.report()
+    return {"bastions": report["bastions"], section: report[section], "generatedAt": report["generatedAt"]}
+
+@api_router.get("/facilities")
+async def get_facilities(request: Request, level: Optional[int] = None):
+    """Facility catalog, or only the special facilities unlocked at a character level"""
+    # Pre-rendered at import; clients revalidate with the ETag
+    body, etag = catalog_response(level)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=3600"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+@api_router.get("/bastion/{room_code}/available-facilities")
+async def get_available_facilities(room_code: str):
+    """Names of the special facilities this bastion's party can still build, and its slot usage"""
+    room_code = room_code.upper()
+    state = await store.get_state(room_code) if await room_cache.ensure(room_code) else None
+    if not state:
+        raise HTTPException(status_code=404, detail="Bastion not found")
+    
+    bastion_data = state[0]
+    party = bastion_data.get("party") or []
+    built = bastion_data.get("specialFacilities") or []
+    level = party_level(party)
+    return {
+        "level": level,
+        "specialSlots": special_slots(level),
+        "slotsUsed": len(built),
+        "facilities": [facility["name"] for facility in available_special_facilities(party, built)],
+    }
+
 @api_router.get("/bastion/{room_code}")
 async def get_bastion(room_code: str):
     """Get bastion data by room code"""
     room_code = room_code.upper()
     
-    # Try memory first
-    if room_code in rooms:
-        return rooms[room_code]["bastion_data"]
-    
-    # Try database
-    bastion_doc = await db.bastions.find_one({"room_code": room_code})
-    if bastion_doc:
-        # Load into memory
-        rooms[room_code] = {
-            "players": [],
-            "bastion_data": bastion_doc["bastion_data"]
-        }
-        return bastion_doc["bastion_data"]
+    # Served from the room store, loading from the database on a miss
+    async with room_cache.pinned([room_code]) as resident:
+        state = await store.get_state(room_code) if resident else None
+    if state:
+        return state[0]
     
     raise HTTPException(status_code=404, detail="Bastion not found")
 
+@api_router.post("/bastions/advance-turn")
+async def advance_bastion_turns(request: AdvanceTurnsRequest):
+    """Advance the turn of many bastions at once, e.g. for a campaign's downtime or a scheduled job"""
+    turns = {}
+    for item in request.bastions:
+        room_code = item.roomCode.upper()
+        if room_code in turns:
+            raise HTTPException(status_code=400, detail=f"{item.roomCode}: listed more than once")
+        try:
+            turns[room_code] = TurnOrders.from_payload(item.dict())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"{item.roomCode}: {e}")
+    
+    # Queued like any other update so a turn never interleaves with players' edits;
+    # the rooms meet in the batch and are advanced in one engine pass
+    async with room_cache.pinned(turns) as resident:
+        batch = TurnBatch({room_code: turn for room_code, turn in turns.items() if room_code in resident})
+        await asyncio.gather(*(mailboxes.submit_and_wait(room_code, None, batch) for room_code in batch.turns))
+    
+    return {"results": [
+        {"roomCode": room_code, "advanced": turn.report is not None, "report": turn.report}
+        for room_code, turn in turns.items()
+    ]}
+
+async def resolve_history_revision(room_code: str, revision: Optional[int], turn: Optional[int]) -> int:
+    """Revision named by an explicit revision or by the start of a turn"""
+    if revision is not None:
+        return revision
+    if turn is not None:
+        found = await history.revision_at_turn(room_code, turn)
+        if found is None:
+            raise HTTPException(status_code=404, detail=f"No history of turn {turn}")
+        return found
+    raise HTTPException(status_code=400, detail="Give a revision or a turn")
+
+@api_router.get("/bastion/{room_code}/history")
+async def get_bastion_history(room_code: str, limit: int = 50):
+    """Most recent changes to a bastion, newest first"""
+    return {"events": await history.recent(room_code.upper(), min(max(limit, 1), 500))}
+
+@api_router.get("/bastion/{room_code}/history/state")
+async def get_bastion_state_at(room_code: str, revision: Optional[int] = None, turn: Optional[int] = None):
+    """Bastion state as of a revision, or as of the start of a turn"""
+    room_code = room_code.upper()
+    target = await resolve_history_revision(room_code, revision, turn)
+    try:
+        bastion_data, at_revision = await history.state_at(room_code, target)
+    except HistoryUnavailable as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"revision": at_revision, "bastionData": bastion_data}
+
+@api_router.post("/bastion/{room_code}/undo")
+async def undo_bastion(room_code: str, request: Optional[UndoRequest] = None):
+    """Restore an earlier state (by default the one before the last change) as a new change"""
+    room_code = room_code.upper()
+    state = await store.get_state(room_code) if await room_cache.ensure(room_code) else None
+    if not state:
+        raise HTTPException(status_code=404, detail="Bastion not found")
+    revision = state[1]
+    
+    request = request or UndoRequest()
+    if request.revision is None and request.turn is None:
+        target = revision - 1
+    else:
+        target = await resolve_history_revision(room_code, request.revision, request.turn)
+    if target < 0 or target >= revision:
+        raise HTTPException(status_code=400, detail=f"Revision {target} is not before the current revision {revision}")
+    try:
+        restored, restored_revision = await history.state_at(room_code, target)
+    except HistoryUnavailable as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    # Queued like any other update so it is broadcast, persisted and itself recorded in the history;
+    # only this restore is waited for, not whatever players keep queueing behind it
+    restore = RestoreOrder(restored)
+    await mailboxes.submit_and_wait(room_code, None, restore)
+    if restore.revision is None:
+        raise HTTPException(status_code=404, detail="Bastion not found")
+    return {"restoredRevision": restored_revision, "revision": restore.revision, "fields": restore.fields}
+
+@api_router.get("/persistence/stats")
+async def get_persistence_stats():
+    """Write-behind flush lag and batch size metrics"""
+    return {**persister.stats(), "history": history.stats()}
+
+@api_router.get("/rooms/stats")
+async def get_room_cache_stats():
+    """Resident rooms, cache hit/miss and eviction counters"""
+    return {**await room_cache.stats(), "sessions": resumable.stats(), "fanout": fanout.stats(),
+            "checkpoint": room_checkpoint.stats(), "reaper": reaper.stats()}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for this worker"""
+    LIVE_ROOMS.set(await store.size())
+    LIVE_PLAYERS.set(len(sessions))
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # Socket.io event handlers
 @sio.event
 async def connect(sid, environ):
     """Handle client connection"""
-    logging.info(f"Client {sid} connected")
+    LIVE_SOCKETS.inc()
+    log.info("client_connected", sid=sid, sample=LOG_SAMPLE_RATE)
     await sio.emit('connect_status', {'status': 'connected'}, room=sid)
 
 @sio.event
 async def disconnect(sid):
     """Handle client disconnection"""
-    logging.info(f"Client {sid} disconnected")
-    
-    # Find and remove player from all rooms
-    for room_code, room_data in rooms.items():
-        for i, player in enumerate(room_data["players"]):
-            if player.get("sid") == sid:
-                # Remove player
-                removed_player = room_data["players"].pop(i)
-                
-                # Update connected players list in bastion data
-                room_data["bastion_data"]["connectedPlayers"] = [
-                    p for p in room_data["bastion_data"]["connectedPlayers"] 
-                    if p.get("id") != removed_player.get("id")
-                ]
-                
-                # Notify other players in the room
-                await sio.emit('playerLeft', removed_player, room=room_code)
-                await sio.emit('connectedPlayersUpdate', 
-                             room_data["bastion_data"]["connectedPlayers"], 
-                             room=room_code)
-                break
+    LIVE_SOCKETS.dec()
+    log.info("client_disconnected", sid=sid, sample=LOG_SAMPLE_RATE)
+    await release_socket(sid)
 
 @sio.event
 async def joinBastion(sid, data):
     """Handle player joining a bastion"""
     try:
         room_code = data['roomCode'].upper()
+        if data.get('role') == 'spectator':
+            await spectate(sid, room_code)
+            return
         player_name = data['playerName']
         
-        # Check if room exists
-        if room_code not in rooms:
-            # Try to load from database
-            bastion_doc = await db.bastions.find_one({"room_code": room_code})
-            if not bastion_doc:
-                await sio.emit('error', {'message': 'Bastion not found'}, room=sid)
-                return
-            
-            # Load room into memory
-            rooms[room_code] = {
-                "players": [],
-                "bastion_data": bastion_doc["bastion_data"]
-            }
+        # A socket rejoining (same or another room) replaces its previous seat
+        if sid in sessions:
+            await remove_session(sid)
+        await stop_spectating(sid)
+        
+        # Check if room exists, loading it from the database if it is not resident
+        with observe_phase("joinBastion", "load"):
+            found = await room_cache.ensure(room_code)
+        if not found:
+            await sio.emit('error', {'message': 'Bastion not found'}, room=sid)
+            return
         
         # Create player object
         player = {
@@ -187,77 +647,318 @@ async def joinBastion(sid, data):
             "sid": sid
         }
         
-        # Add player to room
-        rooms[room_code]["players"].append(player)
-        
-        # Add player to Socket.io room
-        await sio.enter_room(sid, room_code)
-        
-        # Update connected players in bastion data
-        rooms[room_code]["bastion_data"]["connectedPlayers"] = [
-            {"id": p["id"], "name": p["name"]} 
-            for p in rooms[room_code]["players"]
-        ]
-        
-        # Send current bastion state to the new player
-        await sio.emit('bastionState', rooms[room_code]["bastion_data"], room=sid)
-        
-        # Notify other players about the new player
-        await sio.emit('playerJoined', {"id": player["id"], "name": player["name"]}, room=room_code)
+        with observe_phase("joinBastion", "apply"):
+            # The token is issued before the seat exists, so a reaper sweep while add_player
+            # is in flight never sees the seat without its holder
+            sessions.bind(sid, room_code, player["id"])
+            resume_token = resumable.issue(sid, room_code, player["id"])
+            try:
+                players = await store.add_player(room_code, player)
+            except Exception:
+                sessions.unbind(sid)
+                resumable.revoke(player["id"])
+                raise
+            
+            # Add player to Socket.io room
+            await sio.enter_room(sid, room_code)
+            
+            # Current bastion state for the new player; reload if another worker evicted it meanwhile
+            state = await store.get_state(room_code)
+            if not state:
+                await room_cache.ensure(room_code)
+                state = await store.get_state(room_code)
+            bastion_data, revision = state
         
-        # Send updated connected players list to all players in room
-        await sio.emit('connectedPlayersUpdate', 
-                     rooms[room_code]["bastion_data"]["connectedPlayers"], 
-                     room=room_code)
+        with observe_phase("joinBastion", "emit"):
+            await sio.emit('sessionStarted', {
+                "playerId": player["id"], "resumeToken": resume_token,
+                "roomCode": room_code, "playerName": player_name,
+            }, room=sid)
+            await sio.emit('bastionState', state_payload(bastion_data, revision), room=sid)
+            
+            # Everyone else gets the new roster with the next debounced membership notice
+            fanout.members_changed(room_code, players=players, joined={"id": player["id"], "name": player["name"]})
         
-        logging.info(f"Player {player_name} joined bastion {room_code}")
+        log.info("player_joined", room=room_code, player=player_name)
         
     except Exception as e:
-        logging.error(f"Error in joinBastion: {e}")
+        log.error("join_failed", error=str(e))
         await sio.emit('error', {'message': 'Failed to join bastion'}, room=sid)
 
+def not_seated_message(sid: str) -> str:
+    return 'Spectators cannot change the bastion' if sid in spectating else 'Player not in any room'
+
+async def spectate(sid: str, room_code: str) -> None:
+    """Join a room read-only: throttled state frames and a member count, no seat and no roster"""
+    if sid in sessions:
+        await remove_session(sid)
+    await stop_spectating(sid)
+    
+    if not await room_cache.ensure(room_code):
+        await sio.emit('error', {'message': 'Bastion not found'}, room=sid)
+        return
+    spectators = await store.add_spectator(room_code)
+    spectating[sid] = room_code
+    await sio.enter_room(sid, spectator_room(room_code))
+    
+    state = await store.get_state(room_code)
+    if not state:
+        await room_cache.ensure(room_code)
+        state = await store.get_state(room_code)
+    bastion_data, revision = state
+    players = bastion_data.pop("connectedPlayers", [])
+    await sio.emit('bastionState', state_payload(bastion_data, revision), room=sid)
+    await sio.emit('memberCount', {"players": len(players), "spectators": spectators}, room=sid)
+    fanout.members_changed(room_code, spectators=spectators, player_count=len(players))
+    log.info("spectator_joined", room=room_code, spectators=spectators, sample=LOG_SAMPLE_RATE)
+
 @sio.event
 async def updateBastion(sid, data):
     """Handle bastion data updates"""
     try:
         # Find which room this player is in
-        player_room = None
-        for room_code, room_data in rooms.items():
-            for player in room_data["players"]:
-                if player["sid"] == sid:
-                    player_room = room_code
-                    break
-            if player_room:
-                break
+        session = sessions.lookup(sid)
+        player_room = session[0] if session else None
         
         if not player_room:
-            await sio.emit('error', {'message': 'Player not in any room'}, room=sid)
+            await sio.emit('error', {'message': not_seated_message(sid)}, room=sid)
             return
         
-        # Update bastion data
-        rooms[player_room]["bastion_data"].update(data)
-        
-        # Update connected players list to maintain consistency
-        rooms[player_room]["bastion_data"]["connectedPlayers"] = [
-            {"id": p["id"], "name": p["name"]} 
-            for p in rooms[player_room]["players"]
-        ]
+        # Floods are dropped quietly; replying to each would only amplify them
+        if not update_limiter.allow(sid):
+            UPDATES_DROPPED.labels("rate_limited").inc()
+            return
         
-        # Broadcast updated state to all players in the room
-        await sio.emit('bastionState', rooms[player_room]["bastion_data"], room=player_room)
+        # The revision the client's edit was made against; without it the update simply wins
+        base = data.pop('base', None) if type(data) is dict else None
         
-        # Save to database for persistence
-        await db.bastions.update_one(
-            {"room_code": player_room},
-            {"$set": {"bastion_data": rooms[player_room]["bastion_data"]}}
-        )
+        try:
+            if base is not None and (type(base) is not int or base < 0):
+                raise UpdateRejected("invalid_base")
+            update_validator.validate(data)
+        except UpdateRejected as e:
+            UPDATES_DROPPED.labels(e.reason).inc()
+            log.info("update_rejected", sid=sid, room=player_room, reason=e.reason, field=e.field,
+                     sample=LOG_SAMPLE_RATE)
+            await sio.emit('error', {'message': 'Invalid bastion update'}, room=sid)
+            return
         
-        logging.info(f"Bastion {player_room} updated by player {sid}")
+        # Queue behind any other pending updates for this room
+        mailboxes.submit(player_room, sid, ClientUpdate(data, base, session[1]))
         
     except Exception as e:
-        logging.error(f"Error in updateBastion: {e}")
+        log.error("update_failed", error=str(e))
         await sio.emit('error', {'message': 'Failed to update bastion'}, room=sid)
 
+# Conditional writes tried per run of updates before its edits are all rejected as conflicts
+UPDATE_COMMIT_ATTEMPTS = int(os.environ.get('UPDATE_COMMIT_ATTEMPTS', '3'))
+
+async def apply_bastion_updates(room_code, batch):
+    """Apply a room's queued updates and turns in order, each run of plain updates as one patch"""
+    pending = []
+    try:
+        for sid, update in batch:
+            if isinstance(update, (TurnOrders, TurnBatch, RestoreOrder)):
+                # A turn or restore is applied on top of every update queued before it
+                if pending:
+                    await commit_client_updates(room_code, pending)
+                    pending = []
+                if isinstance(update, TurnOrders):
+                    await resolve_bastion_turn(room_code, update)
+                elif isinstance(update, TurnBatch):
+                    await resolve_batched_turn(room_code, update)
+                else:
+                    await restore_bastion_state(room_code, update)
+            else:
+                # Server-side changes queued as plain dicts always win
+                pending.append((sid, update if isinstance(update, ClientUpdate) else ClientUpdate(update)))
+        if pending:
+            await commit_client_updates(room_code, pending)
+    finally:
+        # If this room failed before reaching a turn batch, the other rooms in it must not wait on it
+        for _, update in batch:
+            if isinstance(update, TurnBatch):
+                update.release(room_code)
+
+async def commit_client_updates(room_code, pending):
+    """Resolve a run of client updates against the fields' revisions, then commit them as one patch"""
+    updates = [update for _, update in pending]
+    fields = list(dict.fromkeys(field for update in updates for field in update.changes))
+    for _ in range(UPDATE_COMMIT_ATTEMPTS):
+        with observe_phase("updateBastion", "resolve"):
+            versions = await store.read_versions(room_code, fields)
+            if versions is None:
+                return
+            merged, writers, conflicts = resolve_updates(versions, updates, update_validator.validate)
+        try:
+            if merged:
+                expected = {field: versions[field].revision for field in merged}
+                await commit_bastion_changes(room_code, merged, len(updates), writers, expected)
+            break
+        except RevisionMismatch:
+            # Another worker wrote one of these fields since they were read: a cheap re-read, not a resend
+            UPDATE_CONFLICTS.labels("retried").inc()
+    else:
+        merged, conflicts = {}, [(update, list(update.changes)) for update in updates]
+    
+    if not conflicts:
+        return
+    # Rejected edits get the fields' current values back, so the sender can drop its local copy
+    senders = {id(update): sid for sid, update in pending}
+    for update, rejected in conflicts:
+        UPDATE_CONFLICTS.labels("rejected").inc()
+        sid = senders[id(update)]
+        if sid is None:
+            continue
+        current = {}
+        for field in rejected:
+            value = merged.get(field, versions[field].value if field in versions else MISSING)
+            if value is not MISSING:
+                current[field] = value
+        await sio.emit('updateConflict', {"fields": current}, room=sid)
+    log.info("update_conflict", room=room_code, updates=len(conflicts), sample=LOG_SAMPLE_RATE)
+
+async def commit_bastion_changes(room_code, merged, update_count, writers=None, expected=None):
+    """Write merged field updates to the store, broadcast and persist them; return the new revision or None"""
+    # Only the fields that actually changed are written; connectedPlayers is owned by join/disconnect
+    with observe_phase("updateBastion", "apply"):
+        result = await store.apply(room_code, merged, writers, expected)
+    if not result:
+        return
+    revision, changes = result
+    
+    # Broadcast only the changed keys to all players in the room; spectators get the next coalesced frame
+    with observe_phase("updateBastion", "emit"):
+        await sio.emit('bastionPatch', patch_payload(revision, changes), room=room_code)
+        fanout.publish(room_code, revision, changes)
+    
+    # Queue the changed fields for the next write-behind flush
+    with observe_phase("updateBastion", "persist"):
+        persister.mark_dirty(room_code, changes, revision)
+        await history.record(room_code, revision, changes)
+    if "bastionTurn" in changes:
+        analytics.turn_boundary()
+    
+    log.info("bastion_updated", room=room_code, updates=update_count, revision=revision,
+             fields=list(changes), sample=LOG_SAMPLE_RATE)
+    return revision
+
+async def restore_bastion_state(room_code, restore):
+    """Replace a room's bastion fields with a restored state, removing fields it did not have"""
+    state = await store.get_state(room_code)
+    if not state:
+        return
+    changes = replacement_changes(state[0], restore.bastion_data)
+    restore.fields = list(changes)
+    restore.revision = (await commit_bastion_changes(room_code, changes, 1) if changes else None) or state[1]
+
+async def resolve_bastion_turn(room_code, turn):
+    """Run the turn engine on a room's current state and apply the outcome"""
+    state = await store.get_state(room_code)
+    if not state:
+        return
+    with observe_phase("advanceTurn", "resolve"):
+        changes, report = advance_turn(state[0], turn)
+    await commit_bastion_turn(room_code, turn, changes, report)
+
+async def resolve_batched_turn(room_code, batch):
+    """Check a room's current state into a turn batch and apply its share of the outcome"""
+    state = await store.get_state(room_code)
+    outcome = await batch.resolve(room_code, state[0] if state else None)
+    if outcome:
+        await commit_bastion_turn(room_code, batch.turns[room_code], *outcome)
+
+async def commit_bastion_turn(room_code, turn, changes, report):
+    await commit_bastion_changes(room_code, changes, 1)
+    turn.report = report
+    await sio.emit('turnAdvanced', {"bastionTurn": changes["bastionTurn"], "report": report}, room=room_code)
+    log.info("turn_advanced", room=room_code, turn=changes["bastionTurn"])
+
+mailboxes = RoomMailboxes(
+    apply_bastion_updates,
+    batch_window=float(os.environ.get('BASTION_BATCH_WINDOW', '0')),
+)
+
+@sio.event
+async def advanceTurn(sid, data=None):
+    """Resolve this turn's facility orders and move the bastion to the next turn"""
+    session = sessions.lookup(sid)
+    if not session:
+        await sio.emit('error', {'message': not_seated_message(sid)}, room=sid)
+        return
+    
+    if not update_limiter.allow(sid):
+        UPDATES_DROPPED.labels("rate_limited").inc()
+        return
+    
+    try:
+        turn = TurnOrders.from_payload(data if isinstance(data, dict) else None)
+    except (TypeError, ValueError) as e:
+        await sio.emit('error', {'message': f'Invalid turn orders: {e}'}, room=sid)
+        return
+    
+    mailboxes.submit(session[0], sid, turn)
+
+@sio.event
+async def leaveBastion(sid, data=None):
+    """Give up the seat for good; a player leaving on purpose has nothing to resume"""
+    await stop_spectating(sid)
+    await remove_session(sid)
+
+@sio.event
+async def resumeSession(sid, data):
+    """Take over a seat held for a dropped connection and catch up from the client's last revision"""
+    token = data.get('token') if isinstance(data, dict) else None
+    if sid in sessions:
+        await remove_session(sid)
+    
+    resumed = resumable.resume(token, sid)
+    if not resumed:
+        await sio.emit('resumeFailed', {}, room=sid)
+        return
+    room_code, player_id, previous_sid = resumed
+    # The old socket may not have been noticed as dead yet; it no longer owns the seat
+    if previous_sid is not None:
+        sessions.unbind(previous_sid)
+        await sio.leave_room(previous_sid, room_code)
+    sessions.bind(sid, room_code, player_id)
+    await sio.enter_room(sid, room_code)
+    
+    state = await store.get_state(room_code)
+    if not state:
+        await remove_session(sid)
+        await sio.emit('resumeFailed', {}, room=sid)
+        return
+    bastion_data, revision = state
+    await sio.emit('sessionResumed', {"playerId": player_id, "revision": revision}, room=sid)
+    log.info("session_resumed", room=room_code, player=player_id, sample=LOG_SAMPLE_RATE)
+    
+    # Only what changed while the client was away, if the history still covers it
+    since = data.get('revision')
+    if type(since) is int and 0 <= since <= revision:
+        if since == revision:
+            return
+        changes = await history.changes_since(room_code, since, revision)
+        if changes is not None:
+            await sio.emit('bastionPatch', patch_payload(revision, changes, base=since), room=sid)
+            return
+    await sio.emit('bastionState', state_payload(bastion_data, revision), room=sid)
+
+@sio.event
+async def resyncBastion(sid, data=None):
+    """Resend the full bastion state to a client that detected a revision gap"""
+    session = sessions.lookup(sid)
+    room_code = session[0] if session else spectating.get(sid)
+    state = await store.get_state(room_code) if room_code else None
+    if not state:
+        await sio.emit('error', {'message': 'Player not in any room'}, room=sid)
+        return
+    
+    bastion_data, revision = state
+    if not session:
+        bastion_data.pop("connectedPlayers", None)
+    await sio.emit('bastionState', state_payload(bastion_data, revision), room=sid)
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -268,6 +969,8 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    # The frontend caches the facility catalog and revalidates it with its ETag
+    expose_headers=["ETag"],
 )
 
 # Configure logging
@@ -276,23 +979,76 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+configure_structlog()
+
+async def create_indexes():
+    """Create database indexes, retrying until MongoDB is reachable, then let readiness pass"""
+    while True:
+        try:
+            await db.bastions.create_index("room_code", unique=True)
+            await create_status_indexes(db.status_checks, int(os.environ.get('STATUS_CHECK_TTL', str(7 * 24 * 3600))))
+            await history.create_indexes()
+            logger.info("Database indexes created successfully")
+        except ConnectionFailure as e:
+            logger.warning(f"MongoDB is not reachable yet, retrying index creation: {e}")
+            await asyncio.sleep(2)
+            continue
+        except Exception as e:
+            logger.warning(f"Could not create database indexes: {e}")
+        break
+    indexes_ready.set()
+
+async def reconcile_checkpoint():
+    """Check the checkpoint left by the previous process against MongoDB, retrying until it is reachable"""
+    while True:
+        try:
+            await room_checkpoint.reconcile(db.bastions)
+        except ConnectionFailure as e:
+            logger.warning(f"MongoDB is not reachable yet, retrying checkpoint reconciliation: {e}")
+            await asyncio.sleep(2)
+            continue
+        except Exception as e:
+            logger.warning(f"Could not reconcile the room checkpoint, rooms will load from MongoDB: {e}")
+            room_checkpoint.discard()
+        break
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize application on startup"""
     logger.info("Bastion Tracker API starting up...")
+    if not room_code_key:
+        logger.warning("ROOM_CODE_KEY is not set; room codes will follow a predictable sequence")
     
-    # Create database indexes
-    try:
-        await db.bastions.create_index("room_code", unique=True)
-        await db.status_checks.create_index("timestamp")
-        logger.info("Database indexes created successfully")
-    except Exception as e:
-        logger.warning(f"Could not create database indexes: {e}")
+    # Index builds wait on MongoDB, so they run in the background and gate readiness instead of startup
+    asyncio.create_task(create_indexes())
+    if room_checkpoint.open():
+        asyncio.create_task(reconcile_checkpoint())
+    # Start the Socket.IO manager (and its Redis listener) now rather than on the first event
+    if not sio.manager_initialized:
+        sio.manager_initialized = True
+        sio.manager.initialize()
+    
+    store.start()
+    persister.start()
+    history.start()
+    room_cache.start()
+    room_checkpoint.start()
+    reaper.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     """Clean up on shutdown"""
+    readiness.draining = True
+    await reaper.stop()
+    await room_cache.stop()
+    await mailboxes.drain()
+    await persister.stop()
+    await history.stop()
+    logger.info(f"Flushed pending bastion updates: {persister.stats()}")
+    # Written after the final flush, so the next process finds every room in step with MongoDB
+    await room_checkpoint.stop()
+    logger.info(f"Checkpointed resident rooms: {room_checkpoint.stats()}")
+    await store.close()
     client.close()
     logger.info("Database connection closed")
 
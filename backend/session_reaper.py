@@ -0,0 +1,166 @@
+"""Background cleanup of dead sockets and seats nobody holds
+
+Engine.IO pings every client and closes those that stop answering, and the
+disconnect handler then releases their seats. Nothing checks that this
+actually happened, and the failures are quiet. A disconnect handler that
+raised halfway, or a ping loop that stopped behind a proxy holding the
+connection open, leaves a ghost in ``connectedPlayers``. The ghost is
+rebroadcast with every roster and keeps its room resident for good.
+
+Every ``interval`` seconds the reaper checks each sid this worker tracks, as
+a player or a spectator, against the Socket.IO manager and the Engine.IO
+heartbeat state:
+
+* ``gone``: the manager has forgotten the sid, so its disconnect handler
+  is not going to run; the sid's seat is cleaned up directly.
+* ``closed``: the transport is closed or missing, but the sid was never
+  disconnected.
+* ``ping_timeout``: a ping has gone unanswered for longer than Engine.IO's
+  ping timeout plus ``ping_grace``.
+
+A closed or timed-out sid is disconnected through the server, so the
+regular disconnect handler parks or releases its seat. Sids are reaped
+``batch_size`` at a time, yielding to the event loop between batches.
+
+The reaper then releases seats in the room store that no session or parked
+resume token holds. With the Redis store these are this worker's own seats
+plus those of workers whose heartbeat has expired. After anything was reaped, ``after_reap`` runs; the
+server uses it to sweep the room cache, which flushes and evicts rooms
+that are now empty and idle.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from observability import SESSIONS_REAPED
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "/"
+
+
+def dead_reason(sio, sid: str, now: float, ping_grace: float = 5.0) -> Optional[str]:
+    """Why sid is dead according to the manager and its Engine.IO socket, or None if it looks alive"""
+    eio_sid = sio.manager.eio_sid_from_sid(sid, NAMESPACE)
+    if eio_sid is None:
+        return "gone"
+    socket = sio.eio.sockets.get(eio_sid)
+    if socket is None or socket.closed:
+        return "closed"
+    # last_ping is when the outstanding ping was sent; it is cleared when the pong arrives
+    if socket.last_ping and now - socket.last_ping > sio.eio.ping_timeout + ping_grace:
+        return "ping_timeout"
+    return None
+
+
+class SessionReaper:
+    """Periodic sweep that disconnects dead sids and releases orphaned seats"""
+
+    def __init__(self, sio, tracked_sids: Callable[[], Iterable[str]],
+                 release_socket: Callable[[str], Awaitable[Any]],
+                 orphaned_seats: Callable[[], Awaitable[List[Tuple[str, str]]]],
+                 release_seat: Callable[[str, str], Awaitable[Any]],
+                 after_reap: Optional[Callable[[], Awaitable[Any]]] = None,
+                 interval: float = 30.0, batch_size: int = 500, ping_grace: float = 5.0):
+        self._sio = sio
+        self._tracked_sids = tracked_sids
+        self._release_socket = release_socket
+        self._orphaned_seats = orphaned_seats
+        self._release_seat = release_seat
+        self._after_reap = after_reap
+        self.interval = interval
+        self.batch_size = batch_size
+        self.ping_grace = ping_grace
+        self._task: Optional[asyncio.Task] = None
+
+        self.sweeps = 0
+        self.checked = 0
+        self.reaped: Counter = Counter()
+        self.last_sweep_seconds = 0.0
+
+    async def sweep(self) -> int:
+        """Reap dead sids and orphaned seats once; return how many were reaped"""
+        started = time.monotonic()
+        now = time.time()
+        sids = list(dict.fromkeys(self._tracked_sids()))
+        self.checked += len(sids)
+        dead = []
+        for sid in sids:
+            reason = dead_reason(self._sio, sid, now, self.ping_grace)
+            if reason is not None:
+                dead.append((sid, reason))
+
+        reaped = 0
+        for start in range(0, len(dead), self.batch_size):
+            for sid, reason in dead[start:start + self.batch_size]:
+                try:
+                    await self._reap(sid, reason)
+                except Exception as e:
+                    logger.error(f"Reaping {reason} socket {sid} failed: {e}")
+                    continue
+                self._count(reason)
+                reaped += 1
+            await asyncio.sleep(0)
+
+        for room_code, player_id in await self._orphaned_seats():
+            try:
+                await self._release_seat(room_code, player_id)
+            except Exception as e:
+                logger.error(f"Releasing orphaned seat of {player_id} in {room_code} failed: {e}")
+                continue
+            self._count("orphaned_seat")
+            reaped += 1
+
+        if reaped and self._after_reap is not None:
+            await self._after_reap()
+        self.sweeps += 1
+        self.last_sweep_seconds = time.monotonic() - started
+        return reaped
+
+    async def _reap(self, sid: str, reason: str) -> None:
+        if reason == "gone":
+            await self._release_socket(sid)
+            return
+        sio = self._sio
+        eio_sid = sio.manager.eio_sid_from_sid(sid, NAMESPACE)
+        # Runs the disconnect handler, which parks or releases the seat
+        await sio.disconnect(sid, namespace=NAMESPACE, ignore_queue=True)
+        if eio_sid in sio.eio.sockets:
+            await sio.eio.disconnect(eio_sid)
+
+    def _count(self, reason: str) -> None:
+        self.reaped[reason] += 1
+        SESSIONS_REAPED.labels(reason).inc()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                reaped = await self.sweep()
+                if reaped:
+                    logger.info(f"Reaped {reaped} dead sessions and seats")
+            except Exception as e:
+                logger.error(f"Session reaper sweep failed: {e}")
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sweeps": self.sweeps,
+            "checked": self.checked,
+            "reaped": dict(self.reaped),
+            "lastSweepSeconds": round(self.last_sweep_seconds, 4),
+        }
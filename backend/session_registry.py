@@ -0,0 +1,34 @@
+"""Index of connected Socket.IO sessions to the room and player they joined"""
+from typing import Dict, Iterator, Optional, Tuple
+
+
+class SessionRegistry:
+    """O(1) sid -> (room_code, player_id) lookup
+
+    Kept alongside the per-room ``players`` map (player_id -> player) so that
+    socket handlers never have to scan every room to find a sender.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, Tuple[str, str]] = {}
+
+    def bind(self, sid: str, room_code: str, player_id: str) -> None:
+        """Record that sid is playing as player_id in room_code"""
+        self._sessions[sid] = (room_code, player_id)
+
+    def lookup(self, sid: str) -> Optional[Tuple[str, str]]:
+        """Return (room_code, player_id) for sid, or None if it never joined"""
+        return self._sessions.get(sid)
+
+    def unbind(self, sid: str) -> Optional[Tuple[str, str]]:
+        """Forget sid and return the (room_code, player_id) it was bound to"""
+        return self._sessions.pop(sid, None)
+
+    def __contains__(self, sid: str) -> bool:
+        return sid in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sessions)
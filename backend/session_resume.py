@@ -0,0 +1,114 @@
+"""Resume tokens and a grace period for dropped connections
+
+Every seated player gets an opaque resume token on join. When their socket
+drops, the seat is parked rather than released: the player stays in the room
+and nobody is told they left. If a new socket presents the token within the
+grace period it takes over the seat; otherwise the expiry callback releases
+the seat and the departure is broadcast as before. A player who leaves on
+purpose says so first, and their seat is released at once rather than parked.
+
+Tokens live in the worker that issued them, like the sockets themselves;
+sticky routing sends a reconnecting client back to the same worker, and a
+client whose token is unknown simply joins again.
+"""
+import asyncio
+import logging
+import secrets
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (room_code, player_id) -> release the seat and announce the departure
+ExpiryHandler = Callable[[str, str], Awaitable[None]]
+
+
+class _Seat:
+    __slots__ = ("room_code", "player_id", "sid", "expiry")
+
+    def __init__(self, room_code: str, player_id: str, sid: Optional[str]):
+        self.room_code = room_code
+        self.player_id = player_id
+        self.sid = sid
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+
+class ResumableSessions:
+    """resume token -> seat, with parked seats released after ``grace`` seconds"""
+
+    def __init__(self, on_expire: ExpiryHandler, grace: float = 20.0):
+        self._on_expire = on_expire
+        self.grace = grace
+        self._seats: Dict[str, _Seat] = {}
+        self._tokens: Dict[str, str] = {}  # player_id -> token
+
+        self.parked = 0
+        self.resumed = 0
+        self.expired = 0
+
+    def issue(self, sid: str, room_code: str, player_id: str) -> str:
+        """New token for a freshly seated player"""
+        token = secrets.token_urlsafe(16)
+        self._seats[token] = _Seat(room_code, player_id, sid)
+        self._tokens[player_id] = token
+        return token
+
+    def park(self, player_id: str) -> bool:
+        """Hold a disconnected player's seat for the grace period; False if it cannot be held"""
+        token = self._tokens.get(player_id)
+        if token is None or self.grace <= 0:
+            return False
+        seat = self._seats[token]
+        seat.sid = None
+        if seat.expiry is None:
+            seat.expiry = asyncio.get_running_loop().call_later(self.grace, self._expire, token)
+        self.parked += 1
+        return True
+
+    def resume(self, token: str, sid: str) -> Optional[Tuple[str, str, Optional[str]]]:
+        """Move a seat to sid; return (room_code, player_id, sid it was taken from) or None"""
+        seat = self._seats.get(token) if isinstance(token, str) else None
+        if seat is None:
+            return None
+        if seat.expiry is not None:
+            seat.expiry.cancel()
+            seat.expiry = None
+        previous, seat.sid = seat.sid, sid
+        self.resumed += 1
+        return seat.room_code, seat.player_id, previous
+
+    def revoke(self, player_id: str) -> None:
+        """Forget a player's token once they have left for good"""
+        token = self._tokens.pop(player_id, None)
+        seat = self._seats.pop(token, None) if token else None
+        if seat is not None and seat.expiry is not None:
+            seat.expiry.cancel()
+
+    def _expire(self, token: str) -> None:
+        seat = self._seats.get(token)
+        if seat is None or seat.sid is not None:
+            return
+        self.revoke(seat.player_id)
+        self.expired += 1
+        asyncio.ensure_future(self._release(seat))
+
+    async def _release(self, seat: _Seat) -> None:
+        try:
+            await self._on_expire(seat.room_code, seat.player_id)
+        except Exception as e:
+            logger.error(f"Releasing the parked seat of {seat.player_id} in {seat.room_code} failed: {e}")
+
+    def holds(self, player_id: str) -> bool:
+        """Whether player_id has a live or parked seat issued by this worker"""
+        return player_id in self._tokens
+
+    def __len__(self) -> int:
+        return len(self._seats)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "seats": len(self._seats),
+            "parkedNow": sum(1 for seat in self._seats.values() if seat.sid is None),
+            "parked": self.parked,
+            "resumed": self.resumed,
+            "expired": self.expired,
+        }
@@ -0,0 +1,96 @@
+"""Keyset-paged, streamed listing of status checks
+
+``GET /api/status`` pages newest first on a ``(timestamp, id)`` index. The
+cursor is the position of the last item returned, so every page is one
+bounded index range scan however deep into the collection it starts; an
+offset would make page N cost N pages of scanning. Only the public fields
+are projected, and the page is written out as it comes off the Mongo cursor
+rather than collected into a list of models first.
+
+Retention is a TTL on ``timestamp``: MongoDB's TTL monitor deletes checks
+older than ``STATUS_CHECK_TTL`` seconds, which keeps ``POST /api/status`` from
+growing the collection without bound.
+"""
+import base64
+import logging
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import orjson
+from pymongo import DESCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+PROJECTION = {"_id": 0, "id": 1, "client_name": 1, "timestamp": 1}
+SORT = [("timestamp", DESCENDING), ("id", DESCENDING)]
+MAX_PAGE_SIZE = 1000
+
+_EPOCH = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+# MongoDB's code for an existing index with the same keys but different options
+_INDEX_OPTIONS_CONFLICT = 85
+
+
+def encode_cursor(timestamp: datetime, check_id: str) -> str:
+    """Opaque cursor for the position just after (timestamp, check_id)"""
+    millis = (timestamp - _EPOCH) // _MILLISECOND
+    return base64.urlsafe_b64encode(f"{millis}:{check_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """(timestamp, id) from a cursor; raises ValueError if it was not made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        millis, check_id = raw.split(":", 1)
+        return _EPOCH + int(millis) * _MILLISECOND, check_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def page_filter(cursor: Optional[str]) -> Dict[str, Any]:
+    """Mongo filter for the checks strictly after cursor in (timestamp, id) descending order"""
+    if not cursor:
+        return {}
+    timestamp, check_id = decode_cursor(cursor)
+    return {"$or": [
+        {"timestamp": {"$lt": timestamp}},
+        {"timestamp": timestamp, "id": {"$lt": check_id}},
+    ]}
+
+
+async def stream_page(collection, cursor: Optional[str], limit: int) -> AsyncIterator[bytes]:
+    """JSON ``{"items": [...], "nextCursor": ...}`` for one page, a chunk per item
+
+    One extra item is read to learn whether another page follows; it is not
+    sent, and ``nextCursor`` is null on the last page.
+    """
+    query = collection.find(page_filter(cursor), PROJECTION).sort(SORT).limit(limit + 1)
+    yield b'{"items":['
+    sent, last, next_cursor = 0, None, None
+    async for check in query:
+        if sent == limit:
+            next_cursor = encode_cursor(last["timestamp"], last["id"])
+            break
+        yield (b"," if sent else b"") + orjson.dumps(check)
+        sent, last = sent + 1, check
+    yield b'],"nextCursor":' + orjson.dumps(next_cursor) + b"}"
+
+
+async def create_status_indexes(collection, ttl_seconds: int) -> None:
+    """Paging index, plus the TTL (or plain) index on timestamp
+
+    An existing timestamp index whose expiry differs is changed in place with
+    collMod rather than dropped and rebuilt.
+    """
+    await collection.create_index(SORT)
+    options = {"expireAfterSeconds": ttl_seconds} if ttl_seconds > 0 else {}
+    try:
+        await collection.create_index("timestamp", **options)
+    except OperationFailure as e:
+        if e.code != _INDEX_OPTIONS_CONFLICT or not options:
+            raise
+        await collection.database.command(
+            "collMod", collection.name, index={"keyPattern": {"timestamp": 1}, "expireAfterSeconds": ttl_seconds},
+        )
+        logger.info(f"Changed status check retention to {ttl_seconds}s")
@@ -0,0 +1,224 @@
+"""Bastion turn engine
+
+A bastion turn (7 days of downtime) applies the orders given to special
+facilities plus any manual gold/defender adjustments, then advances
+``bastionTurn``. Facility rules are compiled once at import from the
+facility catalog into a flat name -> ``FacilityRule`` table of small integer
+codes, so advancing a turn is a dict lookup and an integer dispatch per
+facility; ``advance_turns`` runs a whole batch of bastions through that in
+one pass. A ``TurnBatch`` lets that pass cover many rooms while each
+room's turn is still applied in order by its own mailbox.
+
+Only outcomes with a fixed mechanical effect on the tracked state are
+automated (recruiting defenders, stocking the armory, gambling hall
+winnings). Every other order is recorded on the facility as issued and left
+to the DM.
+"""
+import asyncio
+import random
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from facility_catalog import SPECIAL_FACILITIES
+
+ORDERS = ("Maintain", "Craft", "Empower", "Harvest", "Recruit", "Research", "Trade")
+ORDER_CODES = {name: code for code, name in enumerate(ORDERS)}
+MAINTAIN = ORDER_CODES["Maintain"]
+
+# Effect codes dispatched when a facility carries out its own order
+EFFECT_NONE = 0
+EFFECT_RECRUIT_DEFENDERS = 1
+EFFECT_STOCK_ARMORY = 2
+EFFECT_GAMBLING = 3
+
+# name: (effect, amount, housing, housing when Vast); every other facility has no automated effect
+_FACILITY_EFFECTS = {
+    "Armory": (EFFECT_STOCK_ARMORY, 100, 0, 0),
+    "Barrack": (EFFECT_RECRUIT_DEFENDERS, 4, 12, 25),
+    "Gaming Hall": (EFFECT_GAMBLING, 10, 0, 0),
+}
+
+# Gaming Hall: d100 -> number of d6 rolled for winnings (x10 GP)
+_GAMBLING_TABLE = ((50, 1), (85, 2), (95, 4), (100, 10))
+
+
+class FacilityRule:
+    __slots__ = ("order", "effect", "amount", "housing", "vast_housing")
+
+    def __init__(self, order: int, effect: int, amount: int, housing: int, vast_housing: int):
+        self.order = order
+        self.effect = effect
+        self.amount = amount
+        self.housing = housing
+        self.vast_housing = vast_housing
+
+
+FACILITY_RULES: Dict[str, FacilityRule] = {
+    facility["name"]: FacilityRule(ORDER_CODES[facility["order"]],
+                                   *_FACILITY_EFFECTS.get(facility["name"], (EFFECT_NONE, 0, 0, 0)))
+    for facility in SPECIAL_FACILITIES
+}
+
+
+class TurnOrders:
+    """What happens to one bastion this turn
+
+    ``orders`` maps special facility id to an order name; facilities without
+    an entry maintain. ``gold`` and ``defenders`` are signed adjustments made
+    by the DM (events, purchases, losses) applied before the orders.
+    """
+    __slots__ = ("orders", "gold", "defenders", "report")
+
+    def __init__(self, orders: Optional[Mapping[Any, str]] = None, gold: int = 0, defenders: int = 0):
+        self.orders = {str(facility_id): order for facility_id, order in (orders or {}).items()}
+        self.gold = gold
+        self.defenders = defenders
+        # Filled in by whoever resolves the turn
+        self.report: Optional[List[Dict[str, Any]]] = None
+
+    @classmethod
+    def from_payload(cls, data: Optional[Mapping[str, Any]]) -> "TurnOrders":
+        """Build from a client payload ``{orders, goldDelta, defenderDelta}``"""
+        data = data or {}
+        orders = data.get("orders") or {}
+        if not isinstance(orders, Mapping):
+            raise ValueError("orders must map facility ids to order names")
+        for order in orders.values():
+            if order not in ORDER_CODES:
+                raise ValueError(f"Unknown order: {order}")
+        return cls(orders, int(data.get("goldDelta") or 0), int(data.get("defenderDelta") or 0))
+
+
+def _roll_gambling(rng: random.Random) -> int:
+    roll = rng.randint(1, 100)
+    for ceiling, dice in _GAMBLING_TABLE:
+        if roll <= ceiling:
+            return sum(rng.randint(1, 6) for _ in range(dice))
+    return 0
+
+
+def advance_turn(bastion: Mapping[str, Any], turn: TurnOrders,
+                 rng: Optional[random.Random] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Resolve one turn for a bastion
+
+    Returns (changes, report): the bastion fields to write and one entry per
+    special facility describing what its order did. ``bastion`` is not
+    modified.
+    """
+    rng = rng or random
+    next_turn = int(bastion.get("bastionTurn") or 1) + 1
+    gold = max(0, int(bastion.get("bastionGold") or 0) + turn.gold)
+    defenders = max(0, int(bastion.get("bastionDefenders") or 0) + turn.defenders)
+    armory_stocked = bool(bastion.get("armoryStocked"))
+    facilities = bastion.get("specialFacilities") or []
+
+    # Housing and discounts depend on the whole bastion, so collect them first
+    housing = 0
+    has_smithy = False
+    for facility in facilities:
+        rule = FACILITY_RULES.get(facility.get("name"))
+        if rule is None:
+            continue
+        if rule.housing:
+            housing += rule.vast_housing if facility.get("space") == "Vast" else rule.housing
+        if facility.get("name") == "Smithy":
+            has_smithy = True
+
+    orders = turn.orders
+    report = []
+    updated_facilities = []
+    for facility in facilities:
+        order_name = orders.get(str(facility.get("id")), "Maintain")
+        rule = FACILITY_RULES.get(facility.get("name"))
+        order = ORDER_CODES.get(order_name, -1)
+
+        if order == MAINTAIN:
+            result = "Maintained"
+        elif rule is None or order != rule.order:
+            order_name, result = "Maintain", f"Cannot {order_name.lower()}; maintained instead"
+        elif not facility.get("hirelings"):
+            order_name, result = "Maintain", "No hirelings to carry out the order"
+        elif rule.effect == EFFECT_RECRUIT_DEFENDERS:
+            recruited = max(0, min(rule.amount, housing - defenders))
+            defenders += recruited
+            result = f"Recruited {recruited} defenders"
+        elif rule.effect == EFFECT_STOCK_ARMORY:
+            cost = rule.amount * (1 + defenders)
+            if has_smithy:
+                cost //= 2
+            if armory_stocked:
+                result = "Armory already stocked"
+            elif cost > gold:
+                result = f"Not enough gold to stock the armory ({cost} GP)"
+            else:
+                gold -= cost
+                armory_stocked = True
+                result = f"Stocked the armory for {cost} GP"
+        elif rule.effect == EFFECT_GAMBLING:
+            winnings = _roll_gambling(rng) * rule.amount
+            gold += winnings
+            result = f"Won {winnings} GP"
+        else:
+            result = f"{order_name} order issued"
+
+        report.append({"facilityId": facility.get("id"), "name": facility.get("name"),
+                       "order": order_name, "result": result})
+        updated = dict(facility)
+        updated["lastOrder"] = {"turn": next_turn - 1, "order": order_name, "result": result}
+        updated_facilities.append(updated)
+
+    changes = {
+        "bastionTurn": next_turn,
+        "bastionGold": gold,
+        "bastionDefenders": defenders,
+        "armoryStocked": armory_stocked,
+    }
+    if updated_facilities:
+        changes["specialFacilities"] = updated_facilities
+    return changes, report
+
+
+def advance_turns(bastions: Iterable[Tuple[Mapping[str, Any], TurnOrders]],
+                  seed: Optional[int] = None) -> List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """Resolve one turn for each (bastion, orders) pair in a single pass"""
+    rng = random.Random(seed)
+    return [advance_turn(bastion, turn, rng) for bastion, turn in bastions]
+
+
+class TurnBatch:
+    """One turn for many rooms, resolved by a single ``advance_turns`` pass
+
+    Queued as an item in each room's mailbox. When a room's mailbox reaches
+    it, every update queued before it has been applied; the room checks in
+    its current state with ``resolve`` and waits. Once every room has
+    checked in (or been released with ``release``), the batch is advanced in
+    one pass and each room gets back its own (changes, report) to commit.
+    """
+
+    def __init__(self, turns: Mapping[str, TurnOrders], seed: Optional[int] = None):
+        self.turns = dict(turns)
+        self.seed = seed
+        self._states: Dict[str, Optional[Mapping[str, Any]]] = {}
+        self._outcomes: Dict[str, Tuple[Dict[str, Any], List[Dict[str, Any]]]] = {}
+        self._resolved = asyncio.Event()
+
+    def _check_in(self, room_code: str, bastion: Optional[Mapping[str, Any]]) -> None:
+        self._states[room_code] = bastion
+        if len(self._states) < len(self.turns):
+            return
+        present = [room_code for room_code, bastion in self._states.items() if bastion is not None]
+        outcomes = advance_turns(((self._states[room_code], self.turns[room_code]) for room_code in present),
+                                 self.seed)
+        self._outcomes = dict(zip(present, outcomes))
+        self._resolved.set()
+
+    async def resolve(self, room_code: str, bastion: Optional[Mapping[str, Any]]
+                      ) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """Check in a room's current bastion (None if it is gone) and wait for its outcome"""
+        self._check_in(room_code, bastion)
+        await self._resolved.wait()
+        return self._outcomes.get(room_code)
+
+    def release(self, room_code: str) -> None:
+        """Drop a room that will never check in, so the rest of the batch is not left waiting"""
+        if room_code in self.turns and room_code not in self._states:
+            self._check_in(room_code, None)
@@ -0,0 +1,181 @@
+"""Validation and rate limiting for client-sent bastion updates
+
+``UpdateValidator`` compiles the ``BastionData`` model into one check per
+field at startup, so validating an update is a dict lookup and a type/bounds
+check per key. Unknown keys, server-owned keys, wrong types, out-of-range
+numbers and oversized lists are rejected before the update is queued, so
+nothing invalid is ever broadcast or persisted.
+
+List fields are capped by item count and encoded size, and the item keys
+the server itself reads (ids, character levels, facility names, spaces and
+hirelings) are type-checked when present. The size is that of the orjson
+encoding.
+
+``TokenBucketLimiter`` caps how fast each socket may send updates.
+"""
+import time
+import typing
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional
+
+import orjson
+
+MAX_ABS_INT = 10 ** 9
+MAX_STRING_LENGTH = 2000
+
+# field -> (max items, max encoded bytes); list fields not listed get DEFAULT_LIST_LIMITS
+LIST_LIMITS = {
+    "party": (20, 16 * 1024),
+    "basicFacilities": (50, 32 * 1024),
+    "specialFacilities": (12, 32 * 1024),
+}
+DEFAULT_LIST_LIMITS = (50, 16 * 1024)
+
+MAX_CHARACTER_LEVEL = 20
+
+
+class UpdateRejected(Exception):
+    """An update failed validation; ``reason`` is a short label for metrics"""
+
+    def __init__(self, reason: str, field: Optional[str] = None):
+        super().__init__(f"{reason}: {field}" if field else reason)
+        self.reason = reason
+        self.field = field
+
+
+def _fits(value: Any, max_bytes: int) -> bool:
+    try:
+        return len(orjson.dumps(value)) <= max_bytes
+    except orjson.JSONEncodeError:
+        return False
+
+
+def _int_check(value: Any) -> bool:
+    return type(value) is int and -MAX_ABS_INT <= value <= MAX_ABS_INT
+
+
+def _bool_check(value: Any) -> bool:
+    return type(value) is bool
+
+
+def _str_check(value: Any) -> bool:
+    return type(value) is str and len(value) <= MAX_STRING_LENGTH
+
+
+def _id_check(value: Any) -> bool:
+    # Clients use Date.now() for ids, so these are not held to MAX_ABS_INT
+    return type(value) is int or _str_check(value)
+
+
+def _level_check(value: Any) -> bool:
+    # The client sends null while a level input is being retyped
+    return value is None or (type(value) is int and 1 <= value <= MAX_CHARACTER_LEVEL)
+
+
+def _hirelings_check(value: Any) -> bool:
+    return type(value) is list and all(type(h) is dict and _id_check(h.get("id", 0)) for h in value)
+
+
+_FACILITY_ITEM_CHECKS = {"id": _id_check, "name": _str_check, "space": _str_check, "hirelings": _hirelings_check}
+
+# field -> {item key: check} for the keys of list items that the server reads
+ITEM_CHECKS: Dict[str, Dict[str, Callable[[Any], bool]]] = {
+    "party": {"id": _id_check, "level": _level_check},
+    "basicFacilities": _FACILITY_ITEM_CHECKS,
+    "specialFacilities": _FACILITY_ITEM_CHECKS,
+}
+
+
+def _list_check(max_items: int, max_bytes: int, item_type: Optional[type],
+                item_checks: Optional[Mapping[str, Callable[[Any], bool]]] = None) -> Callable[[Any], bool]:
+    def check(value: Any) -> bool:
+        if type(value) is not list or len(value) > max_items:
+            return False
+        if item_type is not None:
+            for item in value:
+                if type(item) is not item_type:
+                    return False
+        if item_checks:
+            for item in value:
+                for key, item_check in item_checks.items():
+                    if key in item and not item_check(item[key]):
+                        return False
+        return _fits(value, max_bytes)
+    return check
+
+
+def _compile_field(name: str, annotation: Any) -> Callable[[Any], bool]:
+    if annotation is int:
+        return _int_check
+    if annotation is bool:
+        return _bool_check
+    if annotation is str:
+        return _str_check
+    if typing.get_origin(annotation) is list:
+        args = typing.get_args(annotation)
+        item_type = typing.get_origin(args[0]) or args[0] if args else None
+        max_items, max_bytes = LIST_LIMITS.get(name, DEFAULT_LIST_LIMITS)
+        return _list_check(max_items, max_bytes, item_type if isinstance(item_type, type) else None,
+                           ITEM_CHECKS.get(name))
+    raise TypeError(f"No update check for field {name} of type {annotation}")
+
+
+class UpdateValidator:
+    """Per-field checks compiled from a pydantic model"""
+
+    def __init__(self, model, exclude: Iterable[str] = ()):
+        excluded = set(exclude)
+        self._checks: Dict[str, Callable[[Any], bool]] = {
+            name: _compile_field(name, field.annotation)
+            for name, field in model.model_fields.items()
+            if name not in excluded
+        }
+        self._excluded = frozenset(excluded)
+
+    @property
+    def fields(self):
+        return frozenset(self._checks)
+
+    def validate(self, update: Any) -> Mapping[str, Any]:
+        """Return the update if every key is known and valid, else raise UpdateRejected"""
+        if type(update) is not dict:
+            raise UpdateRejected("not_an_object")
+        if len(update) > len(self._checks):
+            raise UpdateRejected("too_many_fields")
+        checks = self._checks
+        for key, value in update.items():
+            check = checks.get(key)
+            if check is None:
+                raise UpdateRejected("server_owned" if key in self._excluded else "unknown_field", str(key)[:64])
+            if not check(value):
+                raise UpdateRejected("invalid_value", key)
+        return update
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets: ``rate`` tokens per second up to ``burst``"""
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        # key -> [tokens, last refill time]
+        self._buckets: Dict[Any, list] = {}
+
+    def allow(self, key: Any, cost: float = 1.0) -> bool:
+        now = self._clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < cost:
+            return False
+        bucket[0] -= cost
+        return True
+
+    def discard(self, key: Any) -> None:
+        self._buckets.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
@@ -70,14 +70,24 @@ class BastionTrackerAPITester:
         )
         
     def test_status_endpoint(self):
-        """Test the status API endpoint"""
-        return self.run_test(
+        """Test the status API endpoint returns a page of checks and the cursor for the next one"""
+        success, response = self.run_test(
             "Status API Endpoint",
             "GET",
-            "status",
+            "status?limit=1",
             200
         )
         
+        if not success:
+            return False, None
+        if not (isinstance(response, dict) and isinstance(response.get('items'), list)
+                and len(response['items']) <= 1 and 'nextCursor' in response):
+            self.tests_passed -= 1
+            print(f'❌ Failed - Expected {{"items": [...], "nextCursor": ...}}, got: {response}')
+            return False, None
+        print(f"Status page: {len(response['items'])} items, nextCursor: {response['nextCursor']}")
+        return True, response
+        
     def test_create_status_check(self):
         """Test creating a status check"""
         return self.run_test(
@@ -4,38 +4,87 @@ set -e
 # Start the FastAPI backend
 cd /backend || { echo "Backend directory not found"; exit 1; }
 
-echo "Starting FastAPI backend"
-# Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
-BACKEND_PID=$!
-
-echo "Waiting for backend to start..."
-sleep 30
-
-if ! kill -0 $BACKEND_PID 2>/dev/null; then
-    echo "Backend failed to start at initialization, exiting"
+# One uvicorn process per worker on consecutive ports. Several workers share
+# room state and relay Socket.IO emits through Redis, so REDIS_URL is required.
+BACKEND_WORKERS=${BACKEND_WORKERS:-1}
+BACKEND_BASE_PORT=${BACKEND_BASE_PORT:-8001}
+if [ "$BACKEND_WORKERS" -gt 1 ] && [ -z "$REDIS_URL" ]; then
+    echo "REDIS_URL must be set when BACKEND_WORKERS > 1"
     exit 1
 fi
 
+# nginx pins each client to one worker (see nginx.conf)
+UPSTREAM_CONF=/etc/nginx/bastion_upstream.conf
+echo "upstream bastion_backend {" > $UPSTREAM_CONF
+echo "  ip_hash;" >> $UPSTREAM_CONF
+
+echo "Starting FastAPI backend with $BACKEND_WORKERS worker(s)"
+BACKEND_PIDS=""
+i=0
+while [ $i -lt "$BACKEND_WORKERS" ]; do
+    port=$((BACKEND_BASE_PORT + i))
+    # Start Uvicorn with proper host binding
+    uvicorn server:socket_app --host 0.0.0.0 --port $port &
+    BACKEND_PIDS="$BACKEND_PIDS $!"
+    echo "  server 127.0.0.1:$port;" >> $UPSTREAM_CONF
+    i=$((i + 1))
+done
+echo "}" >> $UPSTREAM_CONF
+
+backend_alive() {
+    for pid in $BACKEND_PIDS; do
+        kill -0 $pid 2>/dev/null || return 1
+    done
+    return 0
+}
+
+# Ready means MongoDB, the room store and Socket.IO answer on every worker (GET /api/health/ready)
+backend_ready() {
+    w=0
+    while [ $w -lt "$BACKEND_WORKERS" ]; do
+        wget -q -T 2 -O /dev/null "http://127.0.0.1:$((BACKEND_BASE_PORT + w))/api/health/ready" || return 1
+        w=$((w + 1))
+    done
+    return 0
+}
+
+BACKEND_READY_TIMEOUT=${BACKEND_READY_TIMEOUT:-60}
+echo "Waiting for backend to become ready..."
+started=$(date +%s)
+until backend_ready; do
+    if ! backend_alive; then
+        echo "Backend failed to start at initialization, exiting"
+        kill $BACKEND_PIDS 2>/dev/null
+        exit 1
+    fi
+    if [ $(($(date +%s) - started)) -ge "$BACKEND_READY_TIMEOUT" ]; then
+        echo "Backend not ready after ${BACKEND_READY_TIMEOUT}s, exiting"
+        kill $BACKEND_PIDS 2>/dev/null
+        exit 1
+    fi
+    sleep 0.2
+done
+echo "Backend ready after $(($(date +%s) - started))s"
+
 # Start Nginx
 nginx -g 'daemon off;' &
 NGINX_PID=$!
 
 # Handle termination signals
-trap 'kill $BACKEND_PID $NGINX_PID; exit 0' SIGTERM SIGINT
+trap 'kill $BACKEND_PIDS $NGINX_PID; exit 0' SIGTERM SIGINT
 
 # Check if processes are still running
-while kill -0 $BACKEND_PID 2>/dev/null && kill -0 $NGINX_PID 2>/dev/null; do
+while backend_alive && kill -0 $NGINX_PID 2>/dev/null; do
     sleep 1
 done
 
 # If we get here, one of the processes died
-if kill -0 $BACKEND_PID 2>/dev/null; then
+if backend_alive; then
     echo "Nginx died, shutting down backend..."
-    kill $BACKEND_PID
+    kill $BACKEND_PIDS
 else
-    echo "Backend died, shutting down nginx..."
-    kill $NGINX_PID
+    echo "Backend died, shutting down nginx and remaining workers..."
+    kill $BACKEND_PIDS $NGINX_PID 2>/dev/null
 fi
 
 exit 1
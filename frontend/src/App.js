@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import io from 'socket.io-client';
 import './App.css';
 
@@ -16,340 +16,47 @@ const HIRELING_RACES = [
   'Human', 'Elf', 'Dwarf', 'Halfling', 'Dragonborn', 'Gnome', 'Half-Elf', 'Half-Orc', 'Tiefling'
 ];
 
-const SPECIAL_FACILITIES = [
-  // Level 5 Facilities
-  {
-    name: 'Arcane Study',
-    level: 5,
-    prerequisite: 'Ability to use an Arcane Focus or tool as a Spellcasting Focus',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Craft',
-    description: 'A place of quiet research with desks and bookshelves.',
-    charm: 'Arcane Study Charm: Cast Identify without spell slot once per week',
-    craftOptions: ['Arcane Focus (7 days, free)', 'Book (7 days, 10 GP)', 'Magic Item - Arcana (level 9+)']
-  },
-  {
-    name: 'Armory',
-    level: 5,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Trade',
-    description: 'Contains mannequins, weapon racks, and armor storage.',
-    tradeOptions: ['Stock Armory: 100 GP + 100 GP per Bastion Defender (50% off with Smithy)'],
-    effect: 'Stocked armory: Roll d8 instead of d6 for defender losses'
-  },
-  {
-    name: 'Barrack',
-    level: 5,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Recruit',
-    description: 'Sleeping quarters for up to 12 Bastion Defenders.',
-    recruitOptions: ['Recruit up to 4 Bastion Defenders (free, 7 days)'],
-    enlargement: 'Vast: 2,000 GP, houses 25 defenders'
-  },
-  {
-    name: 'Garden',
-    level: 5,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Harvest',
-    description: 'Choose type: Decorative, Food, Herb, or Poison garden.',
-    harvestOptions: {
-      'Decorative': '10 bouquets (5 GP each), 10 perfumes, or 10 candles',
-      'Food': '100 days of rations',
-      'Herb': '10 Healer\'s Kits or 1 Potion of Healing',
-      'Poison': '2 vials Antitoxin or 1 vial Basic Poison'
-    },
-    enlargement: 'Vast: 2,000 GP, equivalent to 2 gardens'
-  },
-  {
-    name: 'Library',
-    level: 5,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Research',
-    description: 'Collection of books with desks and reading chairs.',
-    researchOptions: ['Topical Lore: Research any topic, gain 3 accurate pieces of info (7 days)']
-  },
-  {
-    name: 'Sanctuary',
-    level: 5,
-    prerequisite: 'Ability to use a Holy Symbol or Druidic Focus as a Spellcasting Focus',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Craft',
-    description: 'Icons of your religion with a quiet place for worship.',
-    charm: 'Sanctuary Charm: Cast Healing Word without spell slot once per week',
-    craftOptions: ['Sacred Focus: Druidic Focus or Holy Symbol (7 days, free)']
-  },
-  {
-    name: 'Smithy',
-    level: 5,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 2,
-    order: 'Craft',
-    description: 'Contains forge, anvil, and smithing tools.',
-    craftOptions: ['Smith\'s Tools crafting', 'Magic Item - Armaments (level 9+)']
-  },
-  {
-    name: 'Storehouse',
-    level: 5,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Trade',
-    description: 'Cool, dark space for storing trade goods.',
-    tradeOptions: ['Buy/sell goods: 500 GP limit (2,000 GP at lvl 9, 5,000 GP at lvl 13)'],
-    profit: 'Sell for +10% (+20% lvl 9, +50% lvl 13, +100% lvl 17)'
-  },
-  {
-    name: 'Workshop',
-    level: 5,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 3,
-    order: 'Craft',
-    description: 'Creative space with 6 different Artisan\'s Tools.',
-    craftOptions: ['Adventuring Gear with chosen tools', 'Magic Item - Implements (level 9+)'],
-    bonus: 'Source of Inspiration: Gain Heroic Inspiration after short rest',
-    enlargement: 'Vast: 2,000 GP, +2 hirelings, +3 tools'
-  },
-
-  // Level 9 Facilities
-  {
-    name: 'Gaming Hall',
-    level: 9,
-    prerequisite: 'None',
-    space: 'Vast',
-    hirelings: 4,
-    order: 'Trade',
-    description: 'Recreational activities like chess, cards, dice.',
-    tradeOptions: ['Gambling Hall (7 days): Roll d100 for winnings 1d6×10 to 10d6×10 GP']
-  },
-  {
-    name: 'Greenhouse',
-    level: 9,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Harvest',
-    description: 'Controlled climate for rare plants and fungi.',
-    bonus: 'Fruit of Restoration: 3 fruits daily, each gives Lesser Restoration effect',
-    harvestOptions: ['Potion of Healing (greater) (7 days)', 'Poison: Assassin\'s Blood, Malice, Pale Tincture, or Truth Serum (7 days)']
-  },
-  {
-    name: 'Laboratory',
-    level: 9,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Craft',
-    description: 'Alchemical supplies and crafting workspaces.',
-    craftOptions: ['Alchemist\'s Supplies crafting', 'Poison: Burnt Othur Fumes, Essence of Ether, or Torpor (7 days, half cost)']
-  },
-  {
-    name: 'Sacristy',
-    level: 9,
-    prerequisite: 'Ability to use a Holy Symbol or Druidic Focus as a Spellcasting Focus',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Craft',
-    description: 'Preparation and storage for sacred items and vestments.',
-    craftOptions: ['Holy Water (7 days, free, +100 GP for +1d8 damage up to 500 GP)', 'Magic Item - Relics'],
-    bonus: 'Spell Refreshment: Regain 1 spell slot (level 5 or lower) after short rest'
-  },
-  {
-    name: 'Scriptorium',
-    level: 9,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Craft',
-    description: 'Desks and writing supplies for document creation.',
-    craftOptions: ['Book Replica (7 days, needs blank book)', 'Spell Scroll (Cleric/Wizard spell level 3 or lower)', 'Paperwork (50 copies, 7 days, 1 GP per copy)']
-  },
-  {
-    name: 'Stable',
-    level: 9,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Trade',
-    description: 'Houses 3 Large animals. Comes with 1 Riding Horse/Camel, 2 Ponies/Mules.',
-    tradeOptions: ['Buy/sell mounts at standard cost (7 days)'],
-    profit: 'Sell for +20% (+50% lvl 13, +100% lvl 17)',
-    bonus: 'Animal Handling advantage after 14 days in facility',
-    enlargement: 'Vast: 2,000 GP, houses 6 Large animals'
-  },
-  {
-    name: 'Teleportation Circle',
-    level: 9,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Recruit',
-    description: 'Permanent teleportation circle inscribed on floor.',
-    recruitOptions: ['Spellcaster: Roll die, even = friendly NPC spellcaster arrives for 14 days'],
-    spellcasting: 'Cast Wizard spell level 4 or lower (level 8 or lower at level 17+)'
-  },
-  {
-    name: 'Theater',
-    level: 9,
-    prerequisite: 'None',
-    space: 'Vast',
-    hirelings: 4,
-    order: 'Empower',
-    description: 'Stage, backstage, and seating area for small audience.',
-    empowerOptions: ['Theatrical Event: 14 days rehearsal + 7+ days performance'],
-    bonus: 'Theater die (d6, d8 at lvl 13, d10 at lvl 17) if performance succeeds'
-  },
-  {
-    name: 'Training Area',
-    level: 9,
-    prerequisite: 'None',
-    space: 'Vast',
-    hirelings: 4,
-    order: 'Empower',
-    description: 'Courtyard, gymnasium, or training gauntlet with expert trainer.',
-    empowerOptions: ['Training (7 days, 8 hours daily): Battle, Skills, Tools, Unarmed Combat, or Weapon Expert'],
-    trainers: 'Choose trainer type: affects benefit gained from training'
-  },
-  {
-    name: 'Trophy Room',
-    level: 9,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Research',
-    description: 'Collection of mementos, weapons, mounted heads, trinkets.',
-    researchOptions: ['Lore: Research topic, gain 3 info pieces (7 days)', 'Trinket Trophy: Roll die, even = find Common magic item (7 days)']
-  },
-
-  // Level 13 Facilities
-  {
-    name: 'Archive',
-    level: 13,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Research',
-    description: 'Repository of valuable books, maps, scrolls behind locked door.',
-    researchOptions: ['Helpful Lore: Hireling gains Legend Lore knowledge (7 days)'],
-    referenceBook: 'Choose 1: Arcana, History, Investigation, Nature, or Religion advantage',
-    enlargement: 'Vast: 2,000 GP, gain 2 additional reference books'
-  },
-  {
-    name: 'Meditation Chamber',
-    level: 13,
-    prerequisite: 'None',
-    space: 'Cramped',
-    hirelings: 1,
-    order: 'Empower',
-    description: 'Relaxing space for aligning mind, body, and spirit.',
-    empowerOptions: ['Inner Peace: Roll twice for next Bastion event, choose result'],
-    bonus: 'Fortify Self: 7-day meditation grants advantage on 2 random saving throw types'
-  },
-  {
-    name: 'Menagerie',
-    level: 13,
-    prerequisite: 'None',
-    space: 'Vast',
-    hirelings: 2,
-    order: 'Recruit',
-    description: 'Enclosures for up to 4 Large creatures (or equivalent Small/Medium).',
-    recruitOptions: ['Creature: Add beast from table (7 days, various costs)'],
-    creatures: 'Ape, Bears, Snakes, Crocodile, Dire Wolf, etc. (50-3,500 GP)',
-    bonus: 'Creatures count as Bastion Defenders'
-  },
-  {
-    name: 'Observatory',
-    level: 13,
-    prerequisite: 'Ability to use a Spellcasting Focus',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Empower',
-    description: 'Telescope aimed at night sky atop bastion.',
-    charm: 'Observatory Charm: Cast Contact Other Plane without spell slot once per week',
-    empowerOptions: ['Eldritch Discovery: 7 nights study, odd roll = gain Charm (Darkvision, Heroism, or Vitality)']
-  },
-  {
-    name: 'Pub',
-    level: 13,
-    prerequisite: 'None',
-    space: 'Roomy',
-    hirelings: 1,
-    order: 'Research',
-    description: 'Bar, coffee shop, or tea room with spy network.',
-    researchOptions: ['Information Gathering: Locate familiar creature within 50 miles (7 days)'],
-    pubSpecial: 'Choose magical beverage: Burden, Spider Kiss, Moonlight, Positive, or Sterner',
-    enlargement: 'Vast: 2,000 GP, 2 beverages, +3 server hirelings'
-  },
-  {
-    name: 'Reliquary',
-    level: 13,
-    prerequisite: 'Ability to use a Holy Symbol or Druidic Focus as a Spellcasting Focus',
-    space: 'Cramped',
-    hirelings: 1,
-    order: 'Harvest',
-    description: 'Vault holding sacred objects.',
-    charm: 'Reliquary Charm: Cast Greater Restoration without spell slot once per week',
-    harvestOptions: ['Talisman: Replace spell components up to 1,000 GP value (7 days, reusable)']
-  },
-
-  // Level 17 Facilities
-  {
-    name: 'Demiplane',
-    level: 17,
-    prerequisite: 'Ability to use an Arcane Focus or tool as a Spellcasting Focus',
-    space: 'Vast',
-    hirelings: 1,
-    order: 'Empower',
-    description: 'Door leads to extradimensional stone room.',
-    empowerOptions: ['Arcane Resilience: Magical runes give temp HP = 5×level after long rest (7 days)'],
-    bonus: 'Fabrication: Create 5 GP nonmagical object once per long rest'
-  },
-  {
-    name: 'Guildhall',
-    level: 17,
-    prerequisite: 'Expertise in a skill',
-    space: 'Vast',
-    hirelings: 1,
-    order: 'Recruit',
-    description: 'Meeting room for your guild (~50 members).',
-    recruitOptions: ['Guild Assignment: Send members on special mission'],
-    guilds: 'Adventurers, Bakers, Brewers, Masons, Shipbuilders, or Thieves'
-  },
-  {
-    name: 'Sanctum',
-    level: 17,
-    prerequisite: 'Ability to use a Holy Symbol or Druidic Focus as a Spellcasting Focus',
-    space: 'Roomy',
-    hirelings: 4,
-    order: 'Empower',
-    description: 'Place of solace and healing.',
-    charm: 'Sanctum Charm: Cast Heal without spell slot once per week',
-    empowerOptions: ['Fortifying Rites: Target gains temp HP = your level after long rests (7 days)'],
-    bonus: 'Sanctum Recall: Word of Recall always prepared, can target Sanctum'
-  },
-  {
-    name: 'War Room',
-    level: 17,
-    prerequisite: 'Fighting Style feature or Unarmored Defense feature',
-    space: 'Vast',
-    hirelings: '2+',
-    order: 'Recruit',
-    description: 'War planning with loyal Veteran lieutenants.',
-    recruitOptions: ['Lieutenant: Add up to 10 total', 'Soldiers: 100 Guards per lieutenant (or 20 mounted)'],
-    bonus: 'Lieutenants in bastion reduce attack dice by 1 each'
+// Special facilities come from the server's catalog (GET /api/facilities), kept in localStorage and
+// revalidated with its ETag on every load so an unchanged catalog costs a 304
+const FACILITY_CATALOG_KEY = 'bastionFacilityCatalog';
+
+const loadFacilityCatalog = async () => {
+  let cached = null;
+  try {
+    cached = JSON.parse(localStorage.getItem(FACILITY_CATALOG_KEY));
+  } catch (err) {
+    cached = null;
   }
-];
+
+  const baseUrl = window.location.origin;
+  const backendUrls = [
+    `${baseUrl}/api`,
+    `${baseUrl}:8001/api`,
+    'http://localhost:8001/api',
+  ];
+  for (const url of backendUrls) {
+    try {
+      const response = await fetch(`${url}/facilities`, {
+        headers: cached && cached.etag ? { 'If-None-Match': cached.etag } : {}
+      });
+      if (response.status === 304 && cached) {
+        return cached.catalog;
+      }
+      if (response.ok) {
+        const catalog = await response.json();
+        const etag = response.headers.get('ETag');
+        if (etag) {
+          localStorage.setItem(FACILITY_CATALOG_KEY, JSON.stringify({ etag, catalog }));
+        }
+        return catalog;
+      }
+    } catch (err) {
+      console.log('Failed to load the facility catalog from:', url, err.message);
+    }
+  }
+  // Offline: the last catalog we saw is better than none
+  return cached ? cached.catalog : null;
+};
 
 const SPACE_LIMITS = {
   'Cramped': 4,
@@ -384,6 +91,10 @@ function App() {
   const [armoryStocked, setArmoryStocked] = useState(false);
   const [basicFacilities, setBasicFacilities] = useState([]);
   const [specialFacilities, setSpecialFacilities] = useState([]);
+  // Last bastion revision applied; patches must arrive in order on top of it
+  const revisionRef = useRef(0);
+  // Resume token for the current seat, so a dropped connection can pick it back up
+  const sessionRef = useRef(null);
 
   // UI State
   const [selectedFacility, setSelectedFacility] = useState(null);
@@ -394,6 +105,13 @@ function App() {
   const [newHirelingName, setNewHirelingName] = useState('');
   const [newHirelingRace, setNewHirelingRace] = useState('Human');
   const [activeTab, setActiveTab] = useState('party');
+  const [specialFacilityCatalog, setSpecialFacilityCatalog] = useState([]);
+
+  useEffect(() => {
+    loadFacilityCatalog().then((catalog) => {
+      if (catalog) setSpecialFacilityCatalog(catalog.specialFacilities || []);
+    });
+  }, []);
 
   // Socket connection management
   useEffect(() => {
@@ -417,6 +135,26 @@ function App() {
     newSocket.on('connect', () => {
       setConnectionStatus('connected');
       console.log('Connected to server at:', connectUrl);
+      if (sessionRef.current) {
+        // Reconnected after a drop: take the held seat back and catch up from our revision
+        newSocket.emit('resumeSession', {
+          token: sessionRef.current.resumeToken,
+          revision: revisionRef.current
+        });
+      }
+    });
+
+    newSocket.on('sessionStarted', (session) => {
+      sessionRef.current = session;
+    });
+
+    newSocket.on('resumeFailed', () => {
+      // The seat was already released; join again as a new player
+      const session = sessionRef.current;
+      sessionRef.current = null;
+      if (session) {
+        newSocket.emit('joinBastion', { roomCode: session.roomCode, playerName: session.playerName });
+      }
     });
 
     newSocket.on('disconnect', () => {
@@ -431,6 +169,7 @@ function App() {
 
     newSocket.on('bastionState', (bastionData) => {
       console.log('Received bastion state:', bastionData);
+      revisionRef.current = bastionData.revision || 0;
       setParty(bastionData.party || []);
       setBastionGold(bastionData.bastionGold || 5000);
       setBastionDefenders(bastionData.bastionDefenders || 0);
@@ -442,16 +181,56 @@ function App() {
       setConnectedPlayers(bastionData.connectedPlayers || []);
     });
 
-    newSocket.on('connectedPlayersUpdate', (players) => {
-      setConnectedPlayers(players);
+    newSocket.on('bastionPatch', ({ revision, changes, base, removed = [] }) => {
+      if (revision <= revisionRef.current) return;
+      // Patches replace whole top-level fields, so one based at or before our revision still applies
+      if ((base ?? revision - 1) > revisionRef.current) {
+        // Missed at least one patch; fetch the full state instead
+        newSocket.emit('resyncBastion', { revision: revisionRef.current });
+        return;
+      }
+      revisionRef.current = revision;
+      if ('party' in changes) setParty(changes.party || []);
+      if ('bastionGold' in changes) setBastionGold(changes.bastionGold);
+      if ('bastionDefenders' in changes) setBastionDefenders(changes.bastionDefenders);
+      if ('bastionTurn' in changes) setBastionTurn(changes.bastionTurn);
+      if ('defensiveWalls' in changes) setDefensiveWalls(changes.defensiveWalls);
+      if ('armoryStocked' in changes) setArmoryStocked(changes.armoryStocked);
+      if ('basicFacilities' in changes) setBasicFacilities(changes.basicFacilities || []);
+      if ('specialFacilities' in changes) setSpecialFacilities(changes.specialFacilities || []);
+      // Fields the bastion no longer has (an undo past their creation) fall back to their defaults
+      removed.forEach((field) => {
+        if (field === 'party') setParty([]);
+        if (field === 'bastionGold') setBastionGold(5000);
+        if (field === 'bastionDefenders') setBastionDefenders(0);
+        if (field === 'bastionTurn') setBastionTurn(1);
+        if (field === 'defensiveWalls') setDefensiveWalls(0);
+        if (field === 'armoryStocked') setArmoryStocked(false);
+        if (field === 'basicFacilities') setBasicFacilities([]);
+        if (field === 'specialFacilities') setSpecialFacilities([]);
+      });
     });
 
-    newSocket.on('playerJoined', (player) => {
-      console.log(`${player.name} joined the bastion`);
+    // Our edit raced someone else's change to the same thing and was not applied; show what won
+    newSocket.on('updateConflict', ({ fields }) => {
+      console.warn('Bastion edit conflicted with another player\'s change:', Object.keys(fields));
+      if ('party' in fields) setParty(fields.party || []);
+      if ('bastionGold' in fields) setBastionGold(fields.bastionGold);
+      if ('bastionDefenders' in fields) setBastionDefenders(fields.bastionDefenders);
+      if ('bastionTurn' in fields) setBastionTurn(fields.bastionTurn);
+      if ('defensiveWalls' in fields) setDefensiveWalls(fields.defensiveWalls);
+      if ('armoryStocked' in fields) setArmoryStocked(fields.armoryStocked);
+      if ('basicFacilities' in fields) setBasicFacilities(fields.basicFacilities || []);
+      if ('specialFacilities' in fields) setSpecialFacilities(fields.specialFacilities || []);
     });
 
-    newSocket.on('playerLeft', (player) => {
-      console.log(`${player.name} left the bastion`);
+    newSocket.on('connectedPlayersUpdate', (players) => {
+      setConnectedPlayers(players);
+    });
+
+    newSocket.on('playersChanged', ({ joined, left }) => {
+      joined.forEach((player) => console.log(`${player.name} joined the bastion`));
+      left.forEach((player) => console.log(`${player.name} left the bastion`));
     });
 
     newSocket.on('error', (error) => {
@@ -469,7 +248,8 @@ function App() {
   // Update bastion state on server
   const updateBastionState = useCallback((updates) => {
     if (socket && gameState === 'connected') {
-      socket.emit('updateBastion', updates);
+      // base lets the server merge this edit with changes we have not seen yet
+      socket.emit('updateBastion', { ...updates, base: revisionRef.current });
     }
   }, [socket, gameState]);
 
@@ -540,7 +320,10 @@ function App() {
 
   // Leave bastion
   const leaveBastion = () => {
+    sessionRef.current = null;
     if (socket) {
+      // Release the seat now; a bare disconnect would hold it for a reconnect that never comes
+      socket.emit('leaveBastion');
       socket.disconnect();
     }
     setGameState('menu');
@@ -561,7 +344,7 @@ function App() {
   // Get available special facilities based on party levels and prerequisites
   const getAvailableSpecialFacilities = () => {
     const maxLevel = Math.max(...party.map(char => char.level), 5);
-    return SPECIAL_FACILITIES.filter(facility => 
+    return specialFacilityCatalog.filter(facility => 
       facility.level <= maxLevel &&
       !specialFacilities.find(sf => sf.name === facility.name)
     );
@@ -724,6 +507,13 @@ function App() {
     updateBastionState({ bastionDefenders: newDefenders });
   };
 
+  // The server resolves facility orders and moves to the next turn
+  const advanceTurn = () => {
+    if (socket && gameState === 'connected') {
+      socket.emit('advanceTurn', {});
+    }
+  };
+
   const updateBastionTurn = (newTurn) => {
     setBastionTurn(newTurn);
     updateBastionState({ bastionTurn: newTurn });
@@ -999,7 +789,7 @@ function App() {
                       className="flex-1 border border-gray-300 rounded-md px-3 py-2"
                     />
                     <button
-                      onClick={() => updateBastionTurn(bastionTurn + 1)}
+                      onClick={advanceTurn}
                       className="px-3 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700"
                     >
                       Next
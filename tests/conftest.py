@@ -0,0 +1,44 @@
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+# The backend is a flat set of modules run from its own directory, as uvicorn does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+# The server module is imported against fake data; keep it away from the real room checkpoint
+os.environ.setdefault("ROOM_CHECKPOINT_PATH", "")
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    """server module pointed at an in-process fake database, with Socket.IO emits recorded"""
+    import server
+    from benchmarks.fake_mongo import FakeDatabase
+
+    db = FakeDatabase()
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server.persister, "_collection", db.bastions)
+    monkeypatch.setattr(server.code_allocator, "_counters", db.counters)
+    # A block reserved against another test's counters is not carried over
+    monkeypatch.setattr(server.code_allocator, "_next", 0)
+    monkeypatch.setattr(server.code_allocator, "_end", 0)
+    monkeypatch.setattr(server.history, "_events", db.bastion_events)
+    monkeypatch.setattr(server.history, "_snapshots", db.bastion_snapshots)
+    monkeypatch.setattr(server.analytics, "_collection", db.bastions)
+
+    emitted = []
+
+    async def emit(event, data=None, room=None, **kwargs):
+        emitted.append((event, data, room))
+
+    async def noop(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(server.sio, "emit", emit)
+    # The fan-out holds on to the emit it was built with
+    monkeypatch.setattr(server.fanout, "_emit", emit)
+    monkeypatch.setattr(server.sio, "enter_room", noop)
+    monkeypatch.setattr(server.sio, "leave_room", noop)
+    return SimpleNamespace(server=server, db=db, emitted=emitted)
@@ -0,0 +1,82 @@
+"""Batch turn advance goes through each room's mailbox and one engine pass"""
+import asyncio
+
+import pydantic
+import pytest
+from fastapi import HTTPException
+
+import turn_engine
+from bastion_merge import ClientUpdate
+
+BASE_STATE = {"party": [], "bastionGold": 100, "bastionDefenders": 0, "bastionTurn": 1,
+              "basicFacilities": [], "specialFacilities": []}
+
+
+def request(server, *room_codes, gold=10):
+    return server.AdvanceTurnsRequest(bastions=[{"roomCode": code, "goldDelta": gold} for code in room_codes])
+
+
+def seed_rooms(db, *room_codes):
+    for room_code in room_codes:
+        db.bastions._insert({"room_code": room_code, "bastion_data": dict(BASE_STATE), "revision": 0})
+
+
+def test_batch_is_advanced_in_one_pass_after_queued_edits(fake_server, monkeypatch):
+    server, db = fake_server.server, fake_server.db
+    seed_rooms(db, "TURN01", "TURN02", "TURN03")
+    passes = []
+    advance_turns = turn_engine.advance_turns
+
+    def counting_advance_turns(bastions, seed=None):
+        bastions = list(bastions)
+        passes.append(len(bastions))
+        return advance_turns(bastions, seed)
+
+    monkeypatch.setattr(turn_engine, "advance_turns", counting_advance_turns)
+
+    async def scenario():
+        assert await server.room_cache.ensure("TURN01")
+        # Queued before the turn, so the turn must see it
+        server.mailboxes.submit("TURN01", None, ClientUpdate({"bastionGold": 500}))
+        result = await server.advance_bastion_turns(request(server, "TURN01", "turn02", "TURN03", "NOROOM"))
+        states = {code: (await server.store.get_state(code))[0] for code in ("TURN01", "TURN02", "TURN03")}
+        return result, states
+
+    result, states = asyncio.run(asyncio.wait_for(scenario(), timeout=10))
+
+    assert passes == [3]
+    assert [(r["roomCode"], r["advanced"]) for r in result["results"]] == [
+        ("TURN01", True), ("TURN02", True), ("TURN03", True), ("NOROOM", False)]
+    assert states["TURN01"]["bastionGold"] == 510
+    assert states["TURN02"]["bastionGold"] == states["TURN03"]["bastionGold"] == 110
+    assert all(state["bastionTurn"] == 2 for state in states.values())
+    advanced = sorted(room for event, _, room in fake_server.emitted if event == "turnAdvanced")
+    assert advanced == ["TURN01", "TURN02", "TURN03"]
+
+
+def test_a_failing_room_does_not_hold_up_the_batch(fake_server, monkeypatch):
+    server, db = fake_server.server, fake_server.db
+    seed_rooms(db, "TURN04", "TURN05")
+    get_state = server.store.get_state
+
+    async def failing_get_state(room_code):
+        if room_code == "TURN04":
+            raise RuntimeError("store unavailable")
+        return await get_state(room_code)
+
+    monkeypatch.setattr(server.store, "get_state", failing_get_state)
+
+    result = asyncio.run(asyncio.wait_for(server.advance_bastion_turns(request(server, "TURN04", "TURN05")), 10))
+
+    assert [(r["roomCode"], r["advanced"]) for r in result["results"]] == [("TURN04", False), ("TURN05", True)]
+
+
+def test_batch_rejects_repeated_and_too_many_rooms(fake_server):
+    server = fake_server.server
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(server.advance_bastion_turns(request(server, "TURN06", "turn06")))
+    assert raised.value.status_code == 400
+
+    with pytest.raises(pydantic.ValidationError):
+        request(server, *(f"R{i:05d}" for i in range(server.MAX_BATCH_BASTIONS + 1)))
@@ -0,0 +1,119 @@
+"""Concurrent edits to one bastion are merged by field revision, and conflicts are sent back"""
+import asyncio
+
+from bastion_merge import ClientUpdate
+from benchmarks.fake_mongo import FakeCollection
+from persistence import WriteBehindPersister
+
+FACILITIES = [
+    {"id": "f1", "name": "Workshop", "space": "Roomy", "hirelings": []},
+    {"id": "f2", "name": "Library", "space": "Roomy", "hirelings": []},
+]
+
+
+def edit(facilities, facility_id, **changes):
+    return [{**f, **changes} if f["id"] == facility_id else f for f in facilities]
+
+
+def without(facilities, facility_id):
+    return [f for f in facilities if f["id"] != facility_id]
+
+
+def run_updates(fake_server, room_code, *updates):
+    """Seed a room at revision 0, apply each (sid, update) as its own batch, return the final state"""
+    server, db = fake_server.server, fake_server.db
+
+    async def scenario():
+        db.bastions._insert({"room_code": room_code, "revision": 0,
+                             "bastion_data": {"bastionGold": 100, "specialFacilities": FACILITIES}})
+        assert await server.room_cache.ensure(room_code)
+        for sid, update in updates:
+            await server.mailboxes.submit_and_wait(room_code, sid, update)
+        return await server.store.get_state(room_code)
+
+    return asyncio.run(scenario())
+
+
+def conflicts(fake_server, sid):
+    return [data["fields"] for event, data, room in fake_server.emitted if event == "updateConflict" and room == sid]
+
+
+def test_same_item_edited_on_both_sides_is_a_conflict(fake_server):
+    (state, revision) = run_updates(
+        fake_server, "MERGE1",
+        ("s1", ClientUpdate({"specialFacilities": edit(FACILITIES, "f1", name="Forge")}, 0, "p1")),
+        ("s2", ClientUpdate({"specialFacilities": edit(FACILITIES, "f1", name="Smithy")}, 0, "p2")),
+    )
+
+    assert revision == 1
+    assert state["specialFacilities"][0]["name"] == "Forge"
+    assert conflicts(fake_server, "s1") == []
+    assert conflicts(fake_server, "s2") == [{"specialFacilities": edit(FACILITIES, "f1", name="Forge")}]
+
+
+def test_edits_to_different_items_are_both_kept(fake_server):
+    (state, revision) = run_updates(
+        fake_server, "MERGE2",
+        ("s1", ClientUpdate({"specialFacilities": edit(FACILITIES, "f1", name="Forge")}, 0, "p1")),
+        ("s2", ClientUpdate({"specialFacilities": edit(FACILITIES, "f2", space="Vast")}, 0, "p2")),
+    )
+
+    assert revision == 2
+    assert state["specialFacilities"] == edit(edit(FACILITIES, "f1", name="Forge"), "f2", space="Vast")
+    assert conflicts(fake_server, "s2") == []
+
+
+def test_item_deleted_on_one_side_and_edited_on_the_other_is_a_conflict(fake_server):
+    (state, _) = run_updates(
+        fake_server, "MERGE3",
+        ("s1", ClientUpdate({"specialFacilities": without(FACILITIES, "f2")}, 0, "p1")),
+        ("s2", ClientUpdate({"specialFacilities": edit(FACILITIES, "f2", name="Archive")}, 0, "p2")),
+        # And the other way round: an item edited since the base is not silently dropped
+        ("s1", ClientUpdate({"specialFacilities": edit(without(FACILITIES, "f2"), "f1", name="Forge")}, 1, "p1")),
+        ("s2", ClientUpdate({"specialFacilities": FACILITIES[1:]}, 1, "p2")),
+    )
+
+    assert state["specialFacilities"] == [edit(FACILITIES, "f1", name="Forge")[0]]
+    assert len(conflicts(fake_server, "s2")) == 2
+    assert conflicts(fake_server, "s1") == []
+
+
+def test_stale_base_rejects_other_writers_but_not_the_same_writers_scalars(fake_server):
+    (state, revision) = run_updates(
+        fake_server, "MERGE4",
+        ("s1", ClientUpdate({"specialFacilities": edit(FACILITIES, "f1", name="Forge"), "bastionGold": 90}, 0, "p1")),
+        ("s1", ClientUpdate({"specialFacilities": edit(FACILITIES, "f1", name="Smithy"), "bastionGold": 80}, 1, "p1")),
+        # Based on revision 0, from before either change: the value it was made against is gone
+        ("s2", ClientUpdate({"specialFacilities": edit(FACILITIES, "f2", name="Archive")}, 0, "p2")),
+        ("s2", ClientUpdate({"bastionGold": 500}, 0, "p2")),
+        # p1 racing its own unacknowledged edits of a plain number is not a conflict
+        ("s1", ClientUpdate({"bastionGold": 70}, 0, "p1")),
+    )
+
+    assert revision == 3
+    assert state["specialFacilities"][0]["name"] == "Smithy"
+    assert state["specialFacilities"][1]["name"] == "Library"
+    assert state["bastionGold"] == 70
+    assert [sorted(fields) for fields in conflicts(fake_server, "s2")] == [["specialFacilities"], ["bastionGold"]]
+    assert conflicts(fake_server, "s1") == []
+
+
+def test_older_flush_losing_the_revision_race_keeps_the_newer_fields():
+    bastions = FakeCollection(unique_key="room_code")
+    bastions._insert({"room_code": "MERGE5", "revision": 0, "field_revisions": {},
+                      "bastion_data": {"bastionGold": 100, "armoryStocked": False}})
+    newer, older = WriteBehindPersister(bastions), WriteBehindPersister(bastions)
+
+    async def scenario():
+        # Two workers flushing the same room; the one holding the older change writes last
+        newer.mark_dirty("MERGE5", {"bastionGold": 300}, 5)
+        older.mark_dirty("MERGE5", {"bastionGold": 200, "armoryStocked": True}, 3)
+        await newer.flush()
+        await older.flush()
+
+    asyncio.run(scenario())
+
+    doc = bastions._by_unique["MERGE5"]
+    assert doc["bastion_data"] == {"bastionGold": 300, "armoryStocked": True}
+    assert doc["field_revisions"] == {"bastionGold": 5, "armoryStocked": 3}
+    assert doc["revision"] == 5
@@ -0,0 +1,64 @@
+"""Concurrent joins at a room that is not resident share one MongoDB read"""
+import asyncio
+
+import server
+from benchmarks.fake_mongo import FakeCollection
+from bastion_sync import SERVER_OWNED_FIELDS
+
+ROOM_CODE = "COLDJN"
+JOINS = 500
+
+
+class CountingBastions(FakeCollection):
+    """Fake bastions collection whose find_one takes a round trip and is counted"""
+
+    def __init__(self, latency):
+        super().__init__(unique_key="room_code")
+        self.latency = latency
+        self.find_one_calls = 0
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        self.find_one_calls += 1
+        await asyncio.sleep(self.latency)
+        return await super().find_one(query, projection, sort)
+
+
+class FakeDB:
+    def __init__(self, bastions):
+        self.bastions = bastions
+
+
+def test_concurrent_cold_joins_share_one_read(monkeypatch):
+    bastions = CountingBastions(latency=0.05)
+    bastion_data = {k: v for k, v in server.BastionData().dict().items() if k not in SERVER_OWNED_FIELDS}
+    bastions._insert({"room_code": ROOM_CODE, "bastion_data": bastion_data, "revision": 0})
+    monkeypatch.setattr(server, "db", FakeDB(bastions))
+
+    errors = []
+
+    async def emit(event, data=None, room=None, **kwargs):
+        if event == "error":
+            errors.append(data)
+
+    async def noop(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(server.sio, "emit", emit)
+    monkeypatch.setattr(server.sio, "enter_room", noop)
+    monkeypatch.setattr(server.sio, "leave_room", noop)
+
+    async def join_all():
+        await asyncio.gather(*(
+            server.joinBastion(f"cold-{i}", {"roomCode": ROOM_CODE, "playerName": f"player-{i}"})
+            for i in range(JOINS)
+        ))
+        return await server.store.get_state(ROOM_CODE)
+
+    # A stuck loader fails the test instead of hanging the suite
+    state, _ = asyncio.run(asyncio.wait_for(join_all(), timeout=30))
+
+    assert errors == []
+    assert bastions.find_one_calls == 1
+    player_ids = {player["id"] for player in state["connectedPlayers"]}
+    assert len(state["connectedPlayers"]) == JOINS
+    assert player_ids == {server.sessions.lookup(f"cold-{i}")[1] for i in range(JOINS)}
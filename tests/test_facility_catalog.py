@@ -0,0 +1,23 @@
+"""Facility availability from a party whose levels may not be numbers"""
+import asyncio
+
+from facility_catalog import party_level
+
+
+def test_party_level_skips_levels_that_are_not_numbers():
+    assert party_level([{"level": "abc"}, {"level": None}, {}, "not a character"]) == 5
+    assert party_level([{"level": "abc"}, {"level": 11}, {"level": "9"}]) == 11
+    assert party_level([{"level": 1e9}, {"level": float("inf")}]) == 20
+
+
+def test_available_facilities_with_a_malformed_level(fake_server):
+    server, db = fake_server.server, fake_server.db
+    db.bastions._insert({"room_code": "LEVEL1", "revision": 0, "bastion_data": {
+        "party": [{"id": 1, "name": "X", "level": "abc"}, {"id": 2, "name": "Y", "level": 9}],
+        "specialFacilities": [],
+    }})
+
+    result = asyncio.run(server.get_available_facilities("level1"))
+
+    assert result["level"] == 9
+    assert result["specialSlots"] == 4
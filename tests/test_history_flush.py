@@ -0,0 +1,93 @@
+"""History flush keeps what it can when a write to MongoDB fails"""
+import asyncio
+
+from pymongo.errors import AutoReconnect, BulkWriteError, WriteError
+
+from bastion_history import BastionHistory
+from benchmarks.fake_mongo import FakeCollection
+
+
+class FailingCollection(FakeCollection):
+    """Fake collection whose next writes raise queued errors instead of writing"""
+
+    def __init__(self):
+        super().__init__()
+        self.errors = []
+        self.inserted = []
+
+    async def insert_many(self, docs, ordered=True):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.inserted.extend(docs)
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.errors:
+            raise self.errors.pop(0)
+        await super().bulk_write(operations, ordered)
+
+
+async def no_state(room_code):
+    return None
+
+
+def make_history(max_pending=100_000):
+    events, snapshots = FailingCollection(), FailingCollection()
+    return BastionHistory(events, snapshots, no_state, snapshot_every=0, max_pending=max_pending), events, snapshots
+
+
+def record(history, *revisions):
+    async def run():
+        for revision in revisions:
+            await history.record("HIST01", revision, {"bastionGold": revision})
+    asyncio.run(run())
+
+
+def test_duplicate_events_count_as_written_and_snapshots_still_flush():
+    history, events, snapshots = make_history()
+    record(history, 1, 2, 3)
+    history.snapshot("HIST01", {"bastionGold": 3}, 3)
+    events.errors.append(BulkWriteError({"writeErrors": [
+        {"index": 0, "code": 11000, "errmsg": "E11000 duplicate key"},
+        {"index": 2, "code": 121, "errmsg": "Document failed validation"},
+    ], "nInserted": 1}))
+
+    asyncio.run(history.flush())
+
+    stats = history.stats()
+    assert stats["eventsWritten"] == 2
+    assert stats["snapshotsWritten"] == 1
+    assert stats["flushErrors"] == 1
+    assert stats["pendingEvents"] == stats["pendingSnapshots"] == 0
+    assert len(snapshots) == 1
+
+
+def test_unreachable_mongodb_requeues_in_order():
+    history, events, snapshots = make_history()
+    record(history, 1, 2)
+    history.snapshot("HIST01", {"bastionGold": 2}, 2)
+    events.errors.append(AutoReconnect("connection reset"))
+    snapshots.errors.append(AutoReconnect("connection reset"))
+
+    asyncio.run(history.flush())
+    assert history.stats()["pendingEvents"] == 2
+    assert history.stats()["pendingSnapshots"] == 1
+
+    record(history, 3)
+    asyncio.run(history.flush())
+    assert [event["revision"] for event in events.inserted] == [1, 2, 3]
+    assert history.stats()["eventsWritten"] == 3
+    assert len(snapshots) == 1
+
+
+def test_requeue_is_bounded_and_permanent_errors_are_dropped():
+    history, events, _ = make_history(max_pending=2)
+    record(history, 1, 2, 3)
+    events.errors.append(AutoReconnect("connection reset"))
+    asyncio.run(history.flush())
+    assert history.stats()["pendingEvents"] == 2
+    assert history.stats()["droppedEvents"] == 1
+
+    events.errors.append(WriteError("not retryable"))
+    asyncio.run(history.flush())
+    assert history.stats()["pendingEvents"] == 0
+    assert events.inserted == []
@@ -0,0 +1,27 @@
+"""A seat being taken is never seen by the reaper as orphaned"""
+import asyncio
+
+
+def test_seat_is_held_while_add_player_is_in_flight(fake_server, monkeypatch):
+    server, db = fake_server.server, fake_server.db
+    db.bastions._insert({"room_code": "JOIN01", "revision": 0, "bastion_data": {"bastionGold": 100}})
+    add_player = server.store.add_player
+    seen_orphaned = []
+
+    async def add_player_then_sweep(room_code, player):
+        players = await add_player(room_code, player)
+        # A reaper sweep landing here, before add_player has returned to joinBastion
+        seen_orphaned.extend(await server.orphaned_seats())
+        return players
+
+    monkeypatch.setattr(server.store, "add_player", add_player_then_sweep)
+
+    async def scenario():
+        await server.joinBastion("join-sid", {"roomCode": "JOIN01", "playerName": "Aria"})
+        return (await server.store.get_state("JOIN01"))[0]["connectedPlayers"]
+
+    players = asyncio.run(scenario())
+
+    assert seen_orphaned == []
+    assert [player["name"] for player in players] == ["Aria"]
+    assert server.sessions.lookup("join-sid")[0] == "JOIN01"
@@ -0,0 +1,78 @@
+"""Seats in Redis belong to the worker that holds them and outlive it only until its heartbeat expires"""
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+import room_store  # noqa: E402
+from room_store import RedisRoomStore  # noqa: E402
+
+PLAYER = {"id": "p1", "name": "Aria"}
+
+
+def worker(server, heartbeat_ttl=30.0):
+    """A RedisRoomStore on a shared in-process Redis, as one uvicorn worker would have"""
+    store = RedisRoomStore("redis://localhost", heartbeat_ttl=heartbeat_ttl)
+    store._redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    store._apply = store._redis.register_script(room_store._APPLY_SCRIPT)
+    store._seed = store._redis.register_script(room_store._SEED_SCRIPT)
+    store._evict = store._redis.register_script(room_store._EVICT_SCRIPT)
+    return store
+
+
+def test_seats_of_a_dead_worker_are_listed_until_released():
+    server = fakeredis.FakeServer()
+    a, b = worker(server, heartbeat_ttl=0.05), worker(server)
+
+    async def scenario():
+        await a.seed("SEAT01", {"bastionGold": 1}, 0)
+        await a.add_player("SEAT01", PLAYER)
+        listed = {"a": await a.seated_players(), "b_alive": await b.seated_players()}
+        await asyncio.sleep(0.1)
+        listed["b_dead"] = await b.seated_players()
+        removed, players = await b.remove_player("SEAT01", "p1")
+        listed["b_released"] = await b.seated_players()
+        workers = await b._redis.smembers(b._workers_key)
+        return listed, removed, players, workers
+
+    listed, removed, players, workers = asyncio.run(scenario())
+
+    assert listed["a"] == [("SEAT01", "p1")]
+    assert listed["b_alive"] == []
+    assert listed["b_dead"] == [("SEAT01", "p1")]
+    assert removed == PLAYER and players == []
+    assert listed["b_released"] == []
+    assert a.worker_id not in workers
+
+
+def test_a_seat_taken_over_by_another_worker_is_not_reaped_with_its_old_owner():
+    server = fakeredis.FakeServer()
+    a, b = worker(server), worker(server)
+
+    async def scenario():
+        await a.seed("SEAT02", {"bastionGold": 1}, 0)
+        await a.add_player("SEAT02", PLAYER)
+        # The player resumed on worker b, then a went away without a clean shutdown
+        await b.add_player("SEAT02", PLAYER)
+        await a._redis.delete(a._alive_key(a.worker_id))
+        return await b.seated_players(), await a._redis.smembers(a._seats_key(a.worker_id))
+
+    seats, left_with_a = asyncio.run(scenario())
+    assert seats == [("SEAT02", "p1")]
+    assert left_with_a == set()
+
+
+def test_evicting_a_room_drops_its_seat_owners():
+    server = fakeredis.FakeServer()
+    a = worker(server)
+
+    async def scenario():
+        await a.seed("SEAT03", {"bastionGold": 1}, 0)
+        await a.add_player("SEAT03", PLAYER)
+        await a.remove_player("SEAT03", "p1")
+        evicted = await a.evict("SEAT03")
+        return evicted, await a._redis.exists(a._owners_key("SEAT03"), a._seats_key(a.worker_id))
+
+    assert asyncio.run(scenario()) == (True, 0)
@@ -0,0 +1,70 @@
+"""Rooms held by a reader survive the eviction sweep"""
+import asyncio
+
+from room_cache import RoomCache
+from room_store import LocalRoomStore
+
+ROOMS = {f"ROOM{i:02d}": ({"bastionGold": i}, 0) for i in range(10)}
+
+
+async def batch_loader(room_codes):
+    await asyncio.sleep(0.01)
+    return {room_code: ROOMS[room_code] for room_code in room_codes if room_code in ROOMS}
+
+
+async def loader(room_code):
+    return ROOMS.get(room_code)
+
+
+def make_cache():
+    store = LocalRoomStore()
+    return store, RoomCache(store, loader, idle_ttl=0, batch_loader=batch_loader)
+
+
+def test_sweep_skips_pinned_rooms():
+    store, cache = make_cache()
+
+    async def scenario():
+        async with cache.pinned([*ROOMS, "NOROOM"]) as resident:
+            assert resident == set(ROOMS)
+            assert await cache.sweep() == 0
+            states = await asyncio.gather(*(store.get_state(room_code) for room_code in resident))
+        return states, await cache.sweep()
+
+    states, evicted = asyncio.run(scenario())
+    assert all(states)
+    assert evicted == len(ROOMS)
+
+
+def test_sweep_during_the_load_leaves_pinned_rooms():
+    store, cache = make_cache()
+
+    async def read_pinned():
+        async with cache.pinned(ROOMS) as resident:
+            # Give the concurrent sweeper a turn between loading and reading
+            await asyncio.sleep(0.02)
+            return await asyncio.gather(*(store.get_state(room_code) for room_code in resident))
+
+    async def keep_sweeping():
+        for _ in range(10):
+            await cache.sweep()
+            await asyncio.sleep(0.005)
+
+    async def scenario():
+        states, _ = await asyncio.gather(read_pinned(), keep_sweeping())
+        return states
+
+    assert all(asyncio.run(scenario()))
+
+
+def test_overlapping_pins_release_independently():
+    _, cache = make_cache()
+
+    async def scenario():
+        async with cache.pinned(["ROOM01", "ROOM02"]):
+            async with cache.pinned(["ROOM02"]):
+                pass
+            assert await cache.sweep() == 0
+        return await cache.sweep()
+
+    assert asyncio.run(scenario()) == 2
@@ -0,0 +1,94 @@
+"""Resident rooms are checkpointed to disk and served from it after a restart unless MongoDB is newer"""
+import asyncio
+
+import pytest
+
+from benchmarks.fake_mongo import FakeCollection
+from room_checkpoint import CheckpointFile, RoomCheckpoint, write_checkpoint
+
+ROOMS = [("ROOM01", {"bastionGold": 1, "party": [{"id": 1, "name": "Aria"}]}, 4),
+         ("ROOM02", {"bastionGold": 2}, 7)]
+
+
+def test_records_round_trip_through_the_mapped_file(tmp_path):
+    path = str(tmp_path / "rooms.bin")
+    count, size = write_checkpoint(path, ROOMS, carried=[("ROOM03", b'{"bastionGold":3}', 2),
+                                                         ("ROOM01", b'{"shadowed":true}', 1)])
+
+    checkpoint = CheckpointFile(path)
+    try:
+        assert (count, size) == (3, (tmp_path / "rooms.bin").stat().st_size)
+        assert {room: entry[2] for room, entry in checkpoint.index.items()} == {"ROOM01": 4, "ROOM02": 7, "ROOM03": 2}
+        assert checkpoint.record("ROOM01") == b'{"bastionGold":1,"party":[{"id":1,"name":"Aria"}]}'
+        assert checkpoint.record("ROOM03") == b'{"bastionGold":3}'
+    finally:
+        checkpoint.close()
+    assert not (tmp_path / "rooms.bin.tmp").exists()
+
+
+def test_a_truncated_file_is_refused(tmp_path):
+    path = tmp_path / "rooms.bin"
+    write_checkpoint(str(path), ROOMS)
+    path.write_bytes(path.read_bytes()[:-1])
+
+    with pytest.raises(ValueError):
+        CheckpointFile(str(path))
+    assert RoomCheckpoint(str(path), None).open() == 0
+
+
+def test_reconcile_keeps_only_rooms_at_least_as_new_as_mongo(tmp_path):
+    path = str(tmp_path / "rooms.bin")
+    write_checkpoint(path, [
+        ("SAME01", {"bastionGold": 1}, 3),
+        ("AHEAD1", {"bastionGold": 2}, 9),
+        ("NEWER1", {"bastionGold": 3}, 3),
+        ("GONE01", {"bastionGold": 4}, 3),
+    ])
+    bastions = FakeCollection(unique_key="room_code")
+    for room_code, revision in [("SAME01", 3), ("AHEAD1", 5), ("NEWER1", 4)]:
+        bastions._insert({"room_code": room_code, "revision": revision, "bastion_data": {}})
+    checkpoint = RoomCheckpoint(path, None)
+
+    async def scenario():
+        assert checkpoint.open() == 4
+        await checkpoint.reconcile(bastions)
+        stats = checkpoint.stats()
+        warm = await checkpoint.take_many(["SAME01", "AHEAD1", "NEWER1", "GONE01"])
+        return stats, warm, await checkpoint.take("SAME01")
+
+    stats, warm, again = asyncio.run(scenario())
+
+    assert (stats["warmRooms"], stats["staleRooms"]) == (2, 2)
+    # (bastion_data, checkpointed revision, revision stored in MongoDB)
+    assert warm == {"SAME01": ({"bastionGold": 1}, 3, 3), "AHEAD1": ({"bastionGold": 2}, 9, 5)}
+    assert again is None
+    assert (checkpoint.warm_loads, checkpoint.recovered_rooms) == (2, 1)
+    assert checkpoint.stats()["warmRooms"] == 0
+
+
+def test_unclaimed_rooms_are_carried_into_the_next_checkpoint(tmp_path):
+    path = str(tmp_path / "rooms.bin")
+    write_checkpoint(path, ROOMS)
+    bastions = FakeCollection(unique_key="room_code")
+    for room_code, _, revision in ROOMS:
+        bastions._insert({"room_code": room_code, "revision": revision, "bastion_data": {}})
+
+    async def dump_rooms():
+        return [("ROOM04", {"bastionGold": 4}, 1)]
+
+    async def scenario():
+        checkpoint = RoomCheckpoint(path, dump_rooms)
+        checkpoint.open()
+        await checkpoint.reconcile(bastions)
+        await checkpoint.take("ROOM01")
+        written = await checkpoint.write()
+        checkpoint.discard()
+        return written
+
+    assert asyncio.run(scenario()) == 2
+    checkpoint = CheckpointFile(path)
+    try:
+        assert sorted(checkpoint.index) == ["ROOM02", "ROOM04"]
+        assert checkpoint.record("ROOM02") == b'{"bastionGold":2}'
+    finally:
+        checkpoint.close()
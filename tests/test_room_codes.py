@@ -0,0 +1,54 @@
+"""Room codes come from a keyed permutation of a shared sequence, so they never collide"""
+import asyncio
+import itertools
+
+from benchmarks.fake_mongo import FakeCollection
+from room_codes import ALPHABET, CODE_LENGTH, CODE_SPACE, CodePermutation, RoomCodeAllocator, encode_code
+
+SAMPLE = list(itertools.chain(range(20000), range(CODE_SPACE // 2, CODE_SPACE // 2 + 5000),
+                              range(CODE_SPACE - 5000, CODE_SPACE)))
+
+
+def test_permutation_is_a_bijection_on_a_sampled_range():
+    permute = CodePermutation(b"test key")
+    images = [permute(i) for i in SAMPLE]
+
+    assert len(set(images)) == len(SAMPLE)
+    assert all(0 <= image < CODE_SPACE for image in images)
+    # Consecutive sequence numbers are scattered across the code space
+    assert len({image * 16 // CODE_SPACE for image in images[:100]}) == 16
+    assert [CodePermutation(b"other key")(i) for i in range(100)] != images[:100]
+
+
+def test_codes_are_fixed_width_and_distinct():
+    assert encode_code(0) == "A" * CODE_LENGTH
+    assert encode_code(CODE_SPACE - 1) == ALPHABET[-1] * CODE_LENGTH
+    assert len({encode_code(i) for i in SAMPLE}) == len(SAMPLE)
+
+
+def test_workers_sharing_the_counter_never_hand_out_the_same_code():
+    counters = FakeCollection()
+    workers = [RoomCodeAllocator(counters, b"test key", block_size=50) for _ in range(3)]
+
+    async def scenario():
+        batches = await asyncio.gather(*(worker.allocate_many(120) for worker in workers))
+        return [code for batch in batches for code in batch] + [await workers[0].allocate()]
+
+    codes = asyncio.run(scenario())
+
+    assert len(set(codes)) == len(codes) == 361
+    # A request larger than a block reserves it in one go; the last code needed a block of its own
+    assert [worker.blocks_reserved for worker in workers] == [2, 1, 1]
+
+
+def test_create_bastion_skips_a_code_already_in_use(fake_server):
+    server, db = fake_server.server, fake_server.db
+    # The code the allocator hands out first, as if the old random generator had already used it
+    taken = encode_code(server.code_allocator._permute(0))
+    db.bastions._insert({"room_code": taken, "revision": 3, "bastion_data": {"bastionGold": 7}})
+
+    created = asyncio.run(server.create_bastion())
+
+    assert created.roomCode == encode_code(server.code_allocator._permute(1))
+    assert db.bastions._by_unique[taken]["revision"] == 3
+    assert db.bastions._by_unique[created.roomCode]["revision"] == 0
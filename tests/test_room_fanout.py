@@ -0,0 +1,64 @@
+"""Spectator frames are coalesced per room, and membership notices are debounced"""
+import asyncio
+import time
+
+from room_fanout import RoomFanout, spectator_room
+
+
+def recording_fanout(**kwargs):
+    emitted = []
+
+    async def emit(event, data=None, room=None):
+        emitted.append((event, data, room, time.monotonic()))
+
+    return RoomFanout(emit, **kwargs), emitted
+
+
+def test_patches_between_frames_are_merged_onto_the_previous_frame():
+    fanout, emitted = recording_fanout(frame_rate=10)
+
+    async def scenario():
+        fanout.publish("FRAME1", 1, {"bastionGold": 90, "armoryStocked": True})
+        fanout.publish("FRAME1", 2, {"bastionGold": 80})
+        fanout.publish("FRAME1", 3, {"bastionTurn": 2})
+        await asyncio.sleep(0.02)
+        fanout.publish("FRAME1", 4, {"bastionGold": 70})
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+
+    frames = [(data, room) for _, data, room, _ in emitted]
+    assert frames == [
+        ({"revision": 3, "base": 0, "changes": {"bastionGold": 80, "armoryStocked": True, "bastionTurn": 2}},
+         spectator_room("FRAME1")),
+        ({"revision": 4, "base": 3, "changes": {"bastionGold": 70}}, spectator_room("FRAME1")),
+    ]
+    # The second frame waited out the interval since the first
+    assert emitted[1][3] - emitted[0][3] >= 0.09
+    assert fanout.stats() == {"pendingFrames": 0, "framesSent": 2, "patchesCoalesced": 2, "membershipNotices": 0}
+
+
+def test_joins_and_leaves_within_the_window_are_one_notice():
+    fanout, emitted = recording_fanout(membership_delay=0.02)
+    aria, brom, cass = ({"id": n, "name": n} for n in ("aria", "brom", "cass"))
+
+    async def scenario():
+        fanout.members_changed("ROSTER", players=[aria], joined=aria)
+        fanout.members_changed("ROSTER", players=[aria, brom], joined=brom)
+        fanout.members_changed("ROSTER", spectators=4)
+        fanout.members_changed("ROSTER", players=[brom], left=aria)
+        fanout.members_changed("ROSTER", players=[brom, cass], joined=cass)
+        await asyncio.sleep(0.05)
+        fanout.members_changed("ROSTER", spectators=3, player_count=2)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(scenario())
+
+    assert [(event, data, room) for event, data, room, _ in emitted] == [
+        ("playersChanged", {"joined": [aria, brom, cass], "left": [aria]}, "ROSTER"),
+        ("connectedPlayersUpdate", [brom, cass], "ROSTER"),
+        ("memberCount", {"players": 2, "spectators": 4}, spectator_room("ROSTER")),
+        # A spectator leaving tells the spectators only
+        ("memberCount", {"players": 2, "spectators": 3}, spectator_room("ROSTER")),
+    ]
+    assert fanout.stats()["membershipNotices"] == 2
@@ -0,0 +1,84 @@
+"""A dropped player's seat is held for a grace period and can be resumed with its token"""
+import asyncio
+
+from bastion_merge import ClientUpdate
+
+
+def seed_and_join(fake_server, room_code, sid):
+    """Seed a fresh room and return the joinBastion call that seats a player in it"""
+    fake_server.db.bastions._insert({"room_code": room_code, "revision": 0, "bastion_data": {"bastionGold": 100}})
+    return fake_server.server.joinBastion(sid, {"roomCode": room_code, "playerName": "Aria"})
+
+
+def sent(fake_server, event, room=None):
+    return [data for name, data, to in fake_server.emitted if name == event and (room is None or to == room)]
+
+
+def test_parked_seat_resumes_with_only_the_missed_changes(fake_server, monkeypatch):
+    server = fake_server.server
+    monkeypatch.setattr(server.fanout, "membership_delay", 0.01)
+
+    async def scenario():
+        await seed_and_join(fake_server, "PARK01", "old-sid")
+        await asyncio.sleep(0.05)
+        await server.disconnect("old-sid")
+        parked = server.resumable.stats()["parkedNow"]
+        await server.mailboxes.submit_and_wait("PARK01", None, ClientUpdate({"bastionGold": 50}))
+        [started] = sent(fake_server, "sessionStarted", "old-sid")
+        await server.resumeSession("new-sid", {"token": started["resumeToken"], "revision": 0})
+        await asyncio.sleep(0.05)
+        return parked, (await server.store.get_state("PARK01"))[0]["connectedPlayers"]
+
+    parked, players = asyncio.run(scenario())
+
+    assert parked == 1
+    assert [player["name"] for player in players] == ["Aria"]
+    assert sent(fake_server, "sessionResumed", "new-sid")[0]["revision"] == 1
+    assert sent(fake_server, "bastionPatch", "new-sid") == [{"revision": 1, "base": 0, "changes": {"bastionGold": 50}}]
+    assert sent(fake_server, "bastionState", "new-sid") == []
+    # Nobody saw the player leave
+    assert all(not change["left"] for change in sent(fake_server, "playersChanged"))
+    assert server.sessions.lookup("new-sid")[0] == "PARK01"
+
+
+def test_parked_seat_is_released_once_the_grace_period_expires(fake_server, monkeypatch):
+    server = fake_server.server
+    monkeypatch.setattr(server.resumable, "grace", 0.05)
+    monkeypatch.setattr(server.fanout, "membership_delay", 0.01)
+
+    async def scenario():
+        await seed_and_join(fake_server, "PARK02", "old-sid")
+        await server.disconnect("old-sid")
+        await asyncio.sleep(0.15)
+        [started] = sent(fake_server, "sessionStarted", "old-sid")
+        await server.resumeSession("new-sid", {"token": started["resumeToken"], "revision": 0})
+        return started["playerId"], (await server.store.get_state("PARK02") or [{}])[0].get("connectedPlayers", [])
+
+    player_id, players = asyncio.run(scenario())
+
+    assert players == []
+    assert [change["left"] for change in sent(fake_server, "playersChanged")][-1] == [{"id": player_id, "name": "Aria"}]
+    assert sent(fake_server, "resumeFailed", "new-sid") == [{}]
+    assert server.resumable.stats()["expired"] == 1
+    assert not server.resumable.holds(player_id)
+
+
+def test_leaving_on_purpose_releases_the_seat_at_once(fake_server, monkeypatch):
+    server = fake_server.server
+    monkeypatch.setattr(server.fanout, "membership_delay", 0.01)
+
+    async def scenario():
+        await seed_and_join(fake_server, "PARK03", "old-sid")
+        await server.leaveBastion("old-sid")
+        await server.disconnect("old-sid")
+        await asyncio.sleep(0.05)
+        [started] = sent(fake_server, "sessionStarted", "old-sid")
+        await server.resumeSession("new-sid", {"token": started["resumeToken"], "revision": 0})
+        return started["playerId"], (await server.store.get_state("PARK03") or [{}])[0].get("connectedPlayers", [])
+
+    player_id, players = asyncio.run(scenario())
+
+    assert players == []
+    assert server.resumable.stats()["parkedNow"] == 0 and not server.resumable.holds(player_id)
+    assert [change["left"] for change in sent(fake_server, "playersChanged")][-1] == [{"id": player_id, "name": "Aria"}]
+    assert sent(fake_server, "resumeFailed", "new-sid") == [{}]
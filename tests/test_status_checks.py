@@ -0,0 +1,66 @@
+"""Status checks are listed newest first, a keyset page at a time"""
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+from status_checks import MAX_PAGE_SIZE, decode_cursor, encode_cursor, page_filter
+
+NOON = datetime(2024, 5, 1, 12, 0, 0, 123000)
+
+
+def test_cursor_round_trips_to_the_millisecond():
+    assert decode_cursor(encode_cursor(NOON, "check:with:colons")) == (NOON, "check:with:colons")
+    # Sub-millisecond precision is not kept, as BSON dates do not keep it either
+    assert decode_cursor(encode_cursor(NOON + timedelta(microseconds=999), "a"))[0] == NOON
+
+
+@pytest.mark.parametrize("cursor", ["!!!", "bm9jb2xvbg", "YWJjOmQ"])
+def test_cursors_not_made_by_encode_cursor_are_refused(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_page_filter_resumes_strictly_after_the_cursor():
+    assert page_filter(None) == {}
+    assert page_filter(encode_cursor(NOON, "m")) == {"$or": [
+        {"timestamp": {"$lt": NOON}},
+        {"timestamp": NOON, "id": {"$lt": "m"}},
+    ]}
+
+
+def seed(db, count, same_timestamp=3):
+    """count checks, the newest same_timestamp of which share one timestamp"""
+    for i in range(count):
+        timestamp = NOON if i < same_timestamp else NOON - timedelta(seconds=i)
+        db.status_checks._insert({"id": f"id{i:03d}", "client_name": f"c{i}", "timestamp": timestamp})
+
+
+def test_pages_cover_every_check_once_across_a_timestamp_tie(fake_server):
+    seed(fake_server.db, 7)
+    client = TestClient(fake_server.server.app)
+    seen, cursor = [], None
+
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/status", params=params).json()
+        assert set(page) == {"items", "nextCursor"}
+        assert set(page["items"][0]) == {"id", "client_name", "timestamp"}
+        seen += [item["id"] for item in page["items"]]
+        cursor = page["nextCursor"]
+        if cursor is None:
+            break
+
+    assert seen == ["id002", "id001", "id000", "id003", "id004", "id005", "id006"]
+
+
+def test_limit_is_bounded_and_a_bad_cursor_is_a_client_error(fake_server):
+    seed(fake_server.db, 3)
+    client = TestClient(fake_server.server.app)
+
+    assert client.get("/api/status", params={"limit": MAX_PAGE_SIZE + 1}).status_code == 422
+    assert client.get("/api/status", params={"limit": 0}).status_code == 422
+    last_page = orjson.loads(client.get("/api/status", params={"limit": MAX_PAGE_SIZE}).content)
+    assert len(last_page["items"]) == 3 and last_page["nextCursor"] is None
+    assert client.get("/api/status", params={"cursor": "!!!"}).status_code == 400
@@ -0,0 +1,80 @@
+"""Undo restores an earlier state through the room's mailbox"""
+import asyncio
+
+from bastion_merge import ClientUpdate
+
+BASE_STATE = {"party": [], "bastionGold": 100, "bastionTurn": 1, "basicFacilities": [], "specialFacilities": []}
+
+
+async def seed_room(server, db, room_code):
+    db.bastions._insert({"room_code": room_code, "bastion_data": dict(BASE_STATE), "revision": 0})
+    assert await server.room_cache.ensure(room_code)
+
+
+def test_undo_removes_fields_the_restored_state_lacks(fake_server):
+    server, db = fake_server.server, fake_server.db
+
+    async def scenario():
+        await seed_room(server, db, "UNDO01")
+        await server.mailboxes.submit_and_wait(
+            "UNDO01", None, ClientUpdate({"armoryStocked": True, "bastionGold": 50}))
+        result = await server.undo_bastion("UNDO01", server.UndoRequest(revision=0))
+        await server.persister.flush()
+        return result, await server.store.get_state("UNDO01")
+
+    result, (bastion_data, revision) = asyncio.run(scenario())
+
+    assert sorted(result["fields"]) == ["armoryStocked", "bastionGold"]
+    assert result["revision"] == revision == 2
+    assert "armoryStocked" not in bastion_data and bastion_data["bastionGold"] == 100
+    assert "armoryStocked" not in db.bastions._by_unique["UNDO01"]["bastion_data"]
+    patch = [data for event, data, room in fake_server.emitted if event == "bastionPatch" and data["revision"] == 2]
+    assert patch == [{"revision": 2, "changes": {"bastionGold": 100}, "removed": ["armoryStocked"]}]
+
+
+def test_undo_returns_while_players_keep_editing(fake_server):
+    server, db = fake_server.server, fake_server.db
+
+    async def scenario():
+        await seed_room(server, db, "UNDO02")
+        await server.mailboxes.submit_and_wait("UNDO02", None, ClientUpdate({"bastionGold": 1}))
+        editing = True
+
+        async def keep_editing():
+            gold = 2
+            while editing:
+                server.mailboxes.submit("UNDO02", None, ClientUpdate({"bastionGold": gold}))
+                gold += 1
+                await asyncio.sleep(0)
+
+        editor = asyncio.create_task(keep_editing())
+        try:
+            return await asyncio.wait_for(server.undo_bastion("UNDO02", server.UndoRequest(revision=0)), 5)
+        finally:
+            editing = False
+            await editor
+
+    result = asyncio.run(scenario())
+    assert result["restoredRevision"] == 0
+    assert result["revision"] > 1
+
+
+def test_undo_to_the_first_turn_restores_the_new_bastion(fake_server):
+    server = fake_server.server
+
+    async def scenario():
+        created = await server.create_bastion()
+        room_code = created.roomCode
+        await server.mailboxes.submit_and_wait(room_code, None, ClientUpdate({"bastionGold": 4000}))
+        await server.advance_bastion_turns(server.AdvanceTurnsRequest(bastions=[{"roomCode": room_code}]))
+        at_turn = await server.get_bastion_state_at(room_code, turn=1)
+        before_history = await server.get_bastion_state_at(room_code, turn=0)
+        undone = await server.undo_bastion(room_code, server.UndoRequest(turn=1))
+        return at_turn, before_history, undone, (await server.store.get_state(room_code))[0]
+
+    at_turn, before_history, undone, bastion_data = asyncio.run(scenario())
+
+    assert at_turn["revision"] == before_history["revision"] == 0
+    assert at_turn["bastionData"]["bastionGold"] == 5000
+    assert undone["restoredRevision"] == 0
+    assert bastion_data["bastionGold"] == 5000 and bastion_data["bastionTurn"] == 1
@@ -0,0 +1,71 @@
+"""Client updates are checked field by field and rate limited per socket before they are queued"""
+import pytest
+
+import server
+from update_validation import TokenBucketLimiter, UpdateRejected, UpdateValidator
+
+validator = UpdateValidator(server.BastionData, exclude=server.SERVER_OWNED_FIELDS)
+
+
+def rejects(update):
+    with pytest.raises(UpdateRejected) as raised:
+        validator.validate(update)
+    return raised.value.reason, raised.value.field
+
+
+@pytest.mark.parametrize("level", ["abc", 0, 21, 10 ** 12, 5.5, True, [5]])
+def test_party_levels_must_be_bounded_ints(level):
+    assert rejects({"party": [{"id": 1, "name": "X", "level": level}]}) == ("invalid_value", "party")
+
+
+def test_party_levels_that_are_valid_or_being_retyped_pass():
+    party = [{"id": 1700000000000, "name": "X", "level": 20}, {"id": "b", "name": "Y", "level": None}, {"id": 3}]
+    assert validator.validate({"party": party})
+
+
+@pytest.mark.parametrize("facility", [
+    {"id": 1, "name": 7},
+    {"id": 1, "name": "Armory", "space": ["Vast"]},
+    {"id": 1, "name": "Armory", "hirelings": "many"},
+    {"id": 1, "name": "Armory", "hirelings": [{"id": {"nested": True}}]},
+    {"id": None, "name": "Armory"},
+])
+def test_facility_keys_the_server_reads_are_type_checked(facility):
+    assert rejects({"specialFacilities": [facility]}) == ("invalid_value", "specialFacilities")
+
+
+@pytest.mark.parametrize("update, expected", [
+    ([], ("not_an_object", None)),
+    ({"hitPoints": 3}, ("unknown_field", "hitPoints")),
+    ({"connectedPlayers": []}, ("server_owned", "connectedPlayers")),
+    ({"bastionGold": "5000"}, ("invalid_value", "bastionGold")),
+    ({"bastionGold": 10 ** 9 + 1}, ("invalid_value", "bastionGold")),
+    ({"bastionGold": True}, ("invalid_value", "bastionGold")),
+    ({"armoryStocked": 1}, ("invalid_value", "armoryStocked")),
+    ({"party": [{"id": i} for i in range(21)]}, ("invalid_value", "party")),
+    ({"party": [{"id": 1, "name": "x" * 16 * 1024}]}, ("invalid_value", "party")),
+    ({"party": ["not an object"]}, ("invalid_value", "party")),
+])
+def test_invalid_updates_are_rejected(update, expected):
+    assert rejects(update) == expected
+
+
+def test_too_many_fields_are_rejected_before_any_is_checked():
+    update = {f"field{i}": i for i in range(len(validator.fields) + 1)}
+    assert rejects(update) == ("too_many_fields", None)
+
+
+def test_token_bucket_allows_a_burst_then_refills_at_the_rate():
+    now = [0.0]
+    limiter = TokenBucketLimiter(rate=2, burst=3, clock=lambda: now[0])
+
+    assert [limiter.allow("sid") for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow("other")
+    now[0] = 0.5
+    assert limiter.allow("sid") and not limiter.allow("sid")
+    now[0] = 100.0
+    assert [limiter.allow("sid") for _ in range(4)] == [True, True, True, False]
+
+    limiter.discard("sid")
+    assert len(limiter) == 1
+    assert limiter.allow("sid", cost=3) and not limiter.allow("sid", cost=0.5)